@@ -0,0 +1,14 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_AX)
+(set-info :source |Swapping two array elements twice restores the array.|)
+(set-info :status unsat)
+(declare-sort Index 0)
+(declare-sort Element 0)
+(declare-fun a () (Array Index Element))
+(declare-fun i () Index)
+(declare-fun j () Index)
+(define-fun swap ((m (Array Index Element)) (k Index) (l Index)) (Array Index Element)
+  (store (store m k (select m l)) l (select m k)))
+(assert (not (= (swap (swap a i j) i j) a)))
+(check-sat)
+(exit)
@@ -0,0 +1,14 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_BV)
+(set-info :source |Factor a 32-bit semiprime with non-trivial 16-bit factors.|)
+(set-info :status sat)
+(declare-fun p () (_ BitVec 32))
+(declare-fun q () (_ BitVec 32))
+(assert (bvult p #x00010000))
+(assert (bvult q #x00010000))
+(assert (bvugt p #x00000001))
+(assert (bvugt q #x00000001))
+(assert (bvule p q))
+(assert (= (bvmul p q) #x774943CD))
+(check-sat)
+(exit)
@@ -0,0 +1,9 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_BV)
+(set-info :source |(x and y) + (x or y) = x + y holds for all 64-bit vectors.|)
+(set-info :status unsat)
+(declare-fun x () (_ BitVec 64))
+(declare-fun y () (_ BitVec 64))
+(assert (not (= (bvadd (bvand x y) (bvor x y)) (bvadd x y))))
+(check-sat)
+(exit)
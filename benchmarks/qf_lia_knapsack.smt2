@@ -0,0 +1,13 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_LIA)
+(set-info :source |Small bounded knapsack with an exact value target.|)
+(set-info :status sat)
+(declare-fun a () Int)
+(declare-fun b () Int)
+(declare-fun c () Int)
+(declare-fun d () Int)
+(assert (and (<= 0 a 5) (<= 0 b 5) (<= 0 c 5) (<= 0 d 5)))
+(assert (<= (+ (* 12 a) (* 7 b) (* 11 c) (* 8 d)) 60))
+(assert (= (+ (* 24 a) (* 13 b) (* 23 c) (* 15 d)) 119))
+(check-sat)
+(exit)
@@ -0,0 +1,9 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_LIA)
+(set-info :source |Two even terms cannot sum to an odd constant.|)
+(set-info :status unsat)
+(declare-fun x () Int)
+(declare-fun y () Int)
+(assert (= (+ (* 2 x) (* 4 y)) 7))
+(check-sat)
+(exit)
@@ -0,0 +1,14 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_LRA)
+(set-info :source |Feasible blend of three components under linear constraints.|)
+(set-info :status sat)
+(declare-fun x () Real)
+(declare-fun y () Real)
+(declare-fun z () Real)
+(assert (= (+ x y z) 1.0))
+(assert (and (>= x 0.0) (>= y 0.0) (>= z 0.0)))
+(assert (>= (+ (* 0.2 x) (* 0.5 y) (* 0.9 z)) 0.6))
+(assert (<= (+ (* 3.0 x) (* 2.0 y) (* 7.0 z)) 4.5))
+(assert (> y (* 2.0 x)))
+(check-sat)
+(exit)
@@ -0,0 +1,11 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_NIA)
+(set-info :source |A Pythagorean triple with its smallest leg above ten.|)
+(set-info :status sat)
+(declare-fun x () Int)
+(declare-fun y () Int)
+(declare-fun z () Int)
+(assert (and (> x 10) (< x y) (< y 100) (< z 100)))
+(assert (= (+ (* x x) (* y y)) (* z z)))
+(check-sat)
+(exit)
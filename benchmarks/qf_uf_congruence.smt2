@@ -0,0 +1,12 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_UF)
+(set-info :source |f^3(a) = a and f^5(a) = a imply f(a) = a.|)
+(set-info :status unsat)
+(declare-sort U 0)
+(declare-fun a () U)
+(declare-fun f (U) U)
+(assert (= (f (f (f a))) a))
+(assert (= (f (f (f (f (f a))))) a))
+(assert (not (= (f a) a)))
+(check-sat)
+(exit)
@@ -0,0 +1,266 @@
+(set-info :smt-lib-version 2.6)
+(set-logic QF_UF)
+(set-info :source |Pigeonhole principle, 8 pigeons in 7 holes.|)
+(set-info :status unsat)
+(declare-fun p_0_0 () Bool)
+(declare-fun p_0_1 () Bool)
+(declare-fun p_0_2 () Bool)
+(declare-fun p_0_3 () Bool)
+(declare-fun p_0_4 () Bool)
+(declare-fun p_0_5 () Bool)
+(declare-fun p_0_6 () Bool)
+(declare-fun p_1_0 () Bool)
+(declare-fun p_1_1 () Bool)
+(declare-fun p_1_2 () Bool)
+(declare-fun p_1_3 () Bool)
+(declare-fun p_1_4 () Bool)
+(declare-fun p_1_5 () Bool)
+(declare-fun p_1_6 () Bool)
+(declare-fun p_2_0 () Bool)
+(declare-fun p_2_1 () Bool)
+(declare-fun p_2_2 () Bool)
+(declare-fun p_2_3 () Bool)
+(declare-fun p_2_4 () Bool)
+(declare-fun p_2_5 () Bool)
+(declare-fun p_2_6 () Bool)
+(declare-fun p_3_0 () Bool)
+(declare-fun p_3_1 () Bool)
+(declare-fun p_3_2 () Bool)
+(declare-fun p_3_3 () Bool)
+(declare-fun p_3_4 () Bool)
+(declare-fun p_3_5 () Bool)
+(declare-fun p_3_6 () Bool)
+(declare-fun p_4_0 () Bool)
+(declare-fun p_4_1 () Bool)
+(declare-fun p_4_2 () Bool)
+(declare-fun p_4_3 () Bool)
+(declare-fun p_4_4 () Bool)
+(declare-fun p_4_5 () Bool)
+(declare-fun p_4_6 () Bool)
+(declare-fun p_5_0 () Bool)
+(declare-fun p_5_1 () Bool)
+(declare-fun p_5_2 () Bool)
+(declare-fun p_5_3 () Bool)
+(declare-fun p_5_4 () Bool)
+(declare-fun p_5_5 () Bool)
+(declare-fun p_5_6 () Bool)
+(declare-fun p_6_0 () Bool)
+(declare-fun p_6_1 () Bool)
+(declare-fun p_6_2 () Bool)
+(declare-fun p_6_3 () Bool)
+(declare-fun p_6_4 () Bool)
+(declare-fun p_6_5 () Bool)
+(declare-fun p_6_6 () Bool)
+(declare-fun p_7_0 () Bool)
+(declare-fun p_7_1 () Bool)
+(declare-fun p_7_2 () Bool)
+(declare-fun p_7_3 () Bool)
+(declare-fun p_7_4 () Bool)
+(declare-fun p_7_5 () Bool)
+(declare-fun p_7_6 () Bool)
+(assert (or p_0_0 p_0_1 p_0_2 p_0_3 p_0_4 p_0_5 p_0_6))
+(assert (or p_1_0 p_1_1 p_1_2 p_1_3 p_1_4 p_1_5 p_1_6))
+(assert (or p_2_0 p_2_1 p_2_2 p_2_3 p_2_4 p_2_5 p_2_6))
+(assert (or p_3_0 p_3_1 p_3_2 p_3_3 p_3_4 p_3_5 p_3_6))
+(assert (or p_4_0 p_4_1 p_4_2 p_4_3 p_4_4 p_4_5 p_4_6))
+(assert (or p_5_0 p_5_1 p_5_2 p_5_3 p_5_4 p_5_5 p_5_6))
+(assert (or p_6_0 p_6_1 p_6_2 p_6_3 p_6_4 p_6_5 p_6_6))
+(assert (or p_7_0 p_7_1 p_7_2 p_7_3 p_7_4 p_7_5 p_7_6))
+(assert (not (and p_0_0 p_1_0)))
+(assert (not (and p_0_0 p_2_0)))
+(assert (not (and p_0_0 p_3_0)))
+(assert (not (and p_0_0 p_4_0)))
+(assert (not (and p_0_0 p_5_0)))
+(assert (not (and p_0_0 p_6_0)))
+(assert (not (and p_0_0 p_7_0)))
+(assert (not (and p_1_0 p_2_0)))
+(assert (not (and p_1_0 p_3_0)))
+(assert (not (and p_1_0 p_4_0)))
+(assert (not (and p_1_0 p_5_0)))
+(assert (not (and p_1_0 p_6_0)))
+(assert (not (and p_1_0 p_7_0)))
+(assert (not (and p_2_0 p_3_0)))
+(assert (not (and p_2_0 p_4_0)))
+(assert (not (and p_2_0 p_5_0)))
+(assert (not (and p_2_0 p_6_0)))
+(assert (not (and p_2_0 p_7_0)))
+(assert (not (and p_3_0 p_4_0)))
+(assert (not (and p_3_0 p_5_0)))
+(assert (not (and p_3_0 p_6_0)))
+(assert (not (and p_3_0 p_7_0)))
+(assert (not (and p_4_0 p_5_0)))
+(assert (not (and p_4_0 p_6_0)))
+(assert (not (and p_4_0 p_7_0)))
+(assert (not (and p_5_0 p_6_0)))
+(assert (not (and p_5_0 p_7_0)))
+(assert (not (and p_6_0 p_7_0)))
+(assert (not (and p_0_1 p_1_1)))
+(assert (not (and p_0_1 p_2_1)))
+(assert (not (and p_0_1 p_3_1)))
+(assert (not (and p_0_1 p_4_1)))
+(assert (not (and p_0_1 p_5_1)))
+(assert (not (and p_0_1 p_6_1)))
+(assert (not (and p_0_1 p_7_1)))
+(assert (not (and p_1_1 p_2_1)))
+(assert (not (and p_1_1 p_3_1)))
+(assert (not (and p_1_1 p_4_1)))
+(assert (not (and p_1_1 p_5_1)))
+(assert (not (and p_1_1 p_6_1)))
+(assert (not (and p_1_1 p_7_1)))
+(assert (not (and p_2_1 p_3_1)))
+(assert (not (and p_2_1 p_4_1)))
+(assert (not (and p_2_1 p_5_1)))
+(assert (not (and p_2_1 p_6_1)))
+(assert (not (and p_2_1 p_7_1)))
+(assert (not (and p_3_1 p_4_1)))
+(assert (not (and p_3_1 p_5_1)))
+(assert (not (and p_3_1 p_6_1)))
+(assert (not (and p_3_1 p_7_1)))
+(assert (not (and p_4_1 p_5_1)))
+(assert (not (and p_4_1 p_6_1)))
+(assert (not (and p_4_1 p_7_1)))
+(assert (not (and p_5_1 p_6_1)))
+(assert (not (and p_5_1 p_7_1)))
+(assert (not (and p_6_1 p_7_1)))
+(assert (not (and p_0_2 p_1_2)))
+(assert (not (and p_0_2 p_2_2)))
+(assert (not (and p_0_2 p_3_2)))
+(assert (not (and p_0_2 p_4_2)))
+(assert (not (and p_0_2 p_5_2)))
+(assert (not (and p_0_2 p_6_2)))
+(assert (not (and p_0_2 p_7_2)))
+(assert (not (and p_1_2 p_2_2)))
+(assert (not (and p_1_2 p_3_2)))
+(assert (not (and p_1_2 p_4_2)))
+(assert (not (and p_1_2 p_5_2)))
+(assert (not (and p_1_2 p_6_2)))
+(assert (not (and p_1_2 p_7_2)))
+(assert (not (and p_2_2 p_3_2)))
+(assert (not (and p_2_2 p_4_2)))
+(assert (not (and p_2_2 p_5_2)))
+(assert (not (and p_2_2 p_6_2)))
+(assert (not (and p_2_2 p_7_2)))
+(assert (not (and p_3_2 p_4_2)))
+(assert (not (and p_3_2 p_5_2)))
+(assert (not (and p_3_2 p_6_2)))
+(assert (not (and p_3_2 p_7_2)))
+(assert (not (and p_4_2 p_5_2)))
+(assert (not (and p_4_2 p_6_2)))
+(assert (not (and p_4_2 p_7_2)))
+(assert (not (and p_5_2 p_6_2)))
+(assert (not (and p_5_2 p_7_2)))
+(assert (not (and p_6_2 p_7_2)))
+(assert (not (and p_0_3 p_1_3)))
+(assert (not (and p_0_3 p_2_3)))
+(assert (not (and p_0_3 p_3_3)))
+(assert (not (and p_0_3 p_4_3)))
+(assert (not (and p_0_3 p_5_3)))
+(assert (not (and p_0_3 p_6_3)))
+(assert (not (and p_0_3 p_7_3)))
+(assert (not (and p_1_3 p_2_3)))
+(assert (not (and p_1_3 p_3_3)))
+(assert (not (and p_1_3 p_4_3)))
+(assert (not (and p_1_3 p_5_3)))
+(assert (not (and p_1_3 p_6_3)))
+(assert (not (and p_1_3 p_7_3)))
+(assert (not (and p_2_3 p_3_3)))
+(assert (not (and p_2_3 p_4_3)))
+(assert (not (and p_2_3 p_5_3)))
+(assert (not (and p_2_3 p_6_3)))
+(assert (not (and p_2_3 p_7_3)))
+(assert (not (and p_3_3 p_4_3)))
+(assert (not (and p_3_3 p_5_3)))
+(assert (not (and p_3_3 p_6_3)))
+(assert (not (and p_3_3 p_7_3)))
+(assert (not (and p_4_3 p_5_3)))
+(assert (not (and p_4_3 p_6_3)))
+(assert (not (and p_4_3 p_7_3)))
+(assert (not (and p_5_3 p_6_3)))
+(assert (not (and p_5_3 p_7_3)))
+(assert (not (and p_6_3 p_7_3)))
+(assert (not (and p_0_4 p_1_4)))
+(assert (not (and p_0_4 p_2_4)))
+(assert (not (and p_0_4 p_3_4)))
+(assert (not (and p_0_4 p_4_4)))
+(assert (not (and p_0_4 p_5_4)))
+(assert (not (and p_0_4 p_6_4)))
+(assert (not (and p_0_4 p_7_4)))
+(assert (not (and p_1_4 p_2_4)))
+(assert (not (and p_1_4 p_3_4)))
+(assert (not (and p_1_4 p_4_4)))
+(assert (not (and p_1_4 p_5_4)))
+(assert (not (and p_1_4 p_6_4)))
+(assert (not (and p_1_4 p_7_4)))
+(assert (not (and p_2_4 p_3_4)))
+(assert (not (and p_2_4 p_4_4)))
+(assert (not (and p_2_4 p_5_4)))
+(assert (not (and p_2_4 p_6_4)))
+(assert (not (and p_2_4 p_7_4)))
+(assert (not (and p_3_4 p_4_4)))
+(assert (not (and p_3_4 p_5_4)))
+(assert (not (and p_3_4 p_6_4)))
+(assert (not (and p_3_4 p_7_4)))
+(assert (not (and p_4_4 p_5_4)))
+(assert (not (and p_4_4 p_6_4)))
+(assert (not (and p_4_4 p_7_4)))
+(assert (not (and p_5_4 p_6_4)))
+(assert (not (and p_5_4 p_7_4)))
+(assert (not (and p_6_4 p_7_4)))
+(assert (not (and p_0_5 p_1_5)))
+(assert (not (and p_0_5 p_2_5)))
+(assert (not (and p_0_5 p_3_5)))
+(assert (not (and p_0_5 p_4_5)))
+(assert (not (and p_0_5 p_5_5)))
+(assert (not (and p_0_5 p_6_5)))
+(assert (not (and p_0_5 p_7_5)))
+(assert (not (and p_1_5 p_2_5)))
+(assert (not (and p_1_5 p_3_5)))
+(assert (not (and p_1_5 p_4_5)))
+(assert (not (and p_1_5 p_5_5)))
+(assert (not (and p_1_5 p_6_5)))
+(assert (not (and p_1_5 p_7_5)))
+(assert (not (and p_2_5 p_3_5)))
+(assert (not (and p_2_5 p_4_5)))
+(assert (not (and p_2_5 p_5_5)))
+(assert (not (and p_2_5 p_6_5)))
+(assert (not (and p_2_5 p_7_5)))
+(assert (not (and p_3_5 p_4_5)))
+(assert (not (and p_3_5 p_5_5)))
+(assert (not (and p_3_5 p_6_5)))
+(assert (not (and p_3_5 p_7_5)))
+(assert (not (and p_4_5 p_5_5)))
+(assert (not (and p_4_5 p_6_5)))
+(assert (not (and p_4_5 p_7_5)))
+(assert (not (and p_5_5 p_6_5)))
+(assert (not (and p_5_5 p_7_5)))
+(assert (not (and p_6_5 p_7_5)))
+(assert (not (and p_0_6 p_1_6)))
+(assert (not (and p_0_6 p_2_6)))
+(assert (not (and p_0_6 p_3_6)))
+(assert (not (and p_0_6 p_4_6)))
+(assert (not (and p_0_6 p_5_6)))
+(assert (not (and p_0_6 p_6_6)))
+(assert (not (and p_0_6 p_7_6)))
+(assert (not (and p_1_6 p_2_6)))
+(assert (not (and p_1_6 p_3_6)))
+(assert (not (and p_1_6 p_4_6)))
+(assert (not (and p_1_6 p_5_6)))
+(assert (not (and p_1_6 p_6_6)))
+(assert (not (and p_1_6 p_7_6)))
+(assert (not (and p_2_6 p_3_6)))
+(assert (not (and p_2_6 p_4_6)))
+(assert (not (and p_2_6 p_5_6)))
+(assert (not (and p_2_6 p_6_6)))
+(assert (not (and p_2_6 p_7_6)))
+(assert (not (and p_3_6 p_4_6)))
+(assert (not (and p_3_6 p_5_6)))
+(assert (not (and p_3_6 p_6_6)))
+(assert (not (and p_3_6 p_7_6)))
+(assert (not (and p_4_6 p_5_6)))
+(assert (not (and p_4_6 p_6_6)))
+(assert (not (and p_4_6 p_7_6)))
+(assert (not (and p_5_6 p_6_6)))
+(assert (not (and p_5_6 p_7_6)))
+(assert (not (and p_6_6 p_7_6)))
+(check-sat)
+(exit)
@@ -0,0 +1,125 @@
+package com.collins.trustedsystems.z3;
+
+import static org.junit.Assert.assertEquals;
+import static org.junit.Assert.assertNotSame;
+import static org.junit.Assert.assertSame;
+import static org.junit.Assert.assertTrue;
+import static org.junit.Assert.fail;
+
+import java.io.File;
+import java.io.IOException;
+import java.util.concurrent.TimeoutException;
+
+import org.junit.After;
+import org.junit.Assume;
+import org.junit.Before;
+import org.junit.Test;
+
+/**
+ * Runs {@link Z3ProcessPool} on the z3 packaged in the Linux fragment, named
+ * by the {@code z3.executable} system property. Skipped where that z3 cannot
+ * run.
+ */
+public class Z3ProcessPoolTest {
+
+	private static final long TIMEOUT_MILLIS = 10000;
+
+	private File executable;
+	private Z3ProcessPool pool;
+
+	@Before
+	public void setUp() {
+		String path = System.getProperty("z3.executable");
+		Assume.assumeTrue("z3.executable is not set", path != null);
+		Assume.assumeTrue("The packaged Linux z3 only runs on Linux",
+				System.getProperty("os.name").toLowerCase().contains("linux"));
+		executable = new File(path);
+		Assume.assumeTrue(executable + " is not packaged", executable.isFile());
+		executable.setExecutable(true);
+		pool = new Z3ProcessPool(executable, 2);
+	}
+
+	@After
+	public void tearDown() {
+		if (pool != null) {
+			pool.close();
+		}
+	}
+
+	@Test
+	public void executesScripts() throws IOException, TimeoutException {
+		assertEquals("sat", pool.execute("(declare-const x Int)\n(assert (> x 1))\n(check-sat)", TIMEOUT_MILLIS).trim());
+	}
+
+	@Test
+	public void reusesIdleProcess() throws IOException, TimeoutException {
+		Z3Process first = pool.acquire(TIMEOUT_MILLIS);
+		pool.release(first, true);
+		assertEquals(1, pool.getIdleCount());
+		Z3Process second = pool.acquire(TIMEOUT_MILLIS);
+		assertSame(first, second);
+		pool.release(second, true);
+	}
+
+	@Test
+	public void resetsStateBetweenCallers() throws IOException, TimeoutException {
+		pool.execute("(declare-const x Int)\n(assert (> x 1))", TIMEOUT_MILLIS);
+		// Redeclaring x fails, and x < 0 is unsat, unless the previous script was discarded
+		assertEquals("sat", pool.execute("(declare-const x Int)\n(assert (< x 0))\n(check-sat)", TIMEOUT_MILLIS).trim());
+	}
+
+	@Test
+	public void popsStateBetweenCallers() throws IOException, TimeoutException {
+		try (Z3ProcessPool pushPool = new Z3ProcessPool(executable, 1, Z3ProcessPool.ReuseMode.PUSH_POP,
+				Z3ProcessPool.DEFAULT_IDLE_TIMEOUT_MILLIS, Z3ProcessPool.DEFAULT_HEALTH_CHECK_MILLIS)) {
+			pushPool.execute("(declare-const x Int)\n(assert (> x 1))", TIMEOUT_MILLIS);
+			assertEquals("sat",
+					pushPool.execute("(declare-const x Int)\n(assert (< x 0))\n(check-sat)", TIMEOUT_MILLIS).trim());
+		}
+	}
+
+	@Test
+	public void replacesProcessKilledWhileIdle() throws Exception {
+		Z3Process first = pool.acquire(TIMEOUT_MILLIS);
+		pool.release(first, true);
+		first.getProcess().destroyForcibly().waitFor();
+		Z3Process second = pool.acquire(TIMEOUT_MILLIS);
+		assertNotSame(first, second);
+		assertTrue(first.isBroken());
+		assertEquals("sat", second.execute("(check-sat)", TIMEOUT_MILLIS).trim());
+		pool.release(second, true);
+		assertEquals(1, pool.getIdleCount());
+	}
+
+	@Test
+	public void discardsProcessKilledDuringUse() throws Exception {
+		Z3Process process = pool.acquire(TIMEOUT_MILLIS);
+		process.getProcess().destroyForcibly().waitFor();
+		try {
+			process.execute("(check-sat)", TIMEOUT_MILLIS);
+			fail("Expected the killed process to fail");
+		} catch (IOException e) {
+			// Expected
+		}
+		pool.release(process, true);
+		assertEquals(0, pool.getIdleCount());
+		assertEquals("sat", pool.execute("(check-sat)", TIMEOUT_MILLIS).trim());
+	}
+
+	@Test
+	public void waitsForFreeProcess() throws IOException, TimeoutException {
+		Z3Process first = pool.acquire(TIMEOUT_MILLIS);
+		Z3Process second = pool.acquire(TIMEOUT_MILLIS);
+		try {
+			pool.acquire(100);
+			fail("Expected the pool to be exhausted");
+		} catch (TimeoutException e) {
+			// Expected
+		} finally {
+			pool.release(first, true);
+			pool.release(second, true);
+		}
+		assertEquals(2, pool.getIdleCount());
+	}
+
+}
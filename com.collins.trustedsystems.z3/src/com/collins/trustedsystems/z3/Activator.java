@@ -18,6 +18,7 @@ public class Activator implements BundleActivator {
 	@Override
 	public void start(BundleContext bundleContext) throws Exception {
 		Activator.context = bundleContext;
+		Z3Plugin.startExtraction();
 	}
 
 	/*
@@ -26,6 +27,7 @@ public class Activator implements BundleActivator {
 	 */
 	@Override
 	public void stop(BundleContext bundleContext) throws Exception {
+		Z3Plugin.shutdownZ3ProcessPool();
 		Activator.context = null;
 	}
 
@@ -0,0 +1,248 @@
+package com.collins.trustedsystems.z3;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.OutputStream;
+import java.io.Writer;
+import java.net.URL;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.AtomicMoveNotSupportedException;
+import java.nio.file.DirectoryNotEmptyException;
+import java.nio.file.FileAlreadyExistsException;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.nio.file.StandardCopyOption;
+import java.security.MessageDigest;
+import java.security.NoSuchAlgorithmException;
+import java.util.ArrayList;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.Enumeration;
+import java.util.List;
+import java.util.Set;
+import java.util.concurrent.ConcurrentHashMap;
+import java.util.stream.Stream;
+
+import org.osgi.framework.Bundle;
+
+/**
+ * Per-user cache of extracted z3 binaries, shared by all workspaces.
+ *
+ * Binaries are extracted once into a directory named after the SHA-256 of
+ * their content. A small index maps the fragment (symbolic name, version
+ * and modification time) to that digest so later lookups do not read the
+ * bundle at all. Extraction happens in a temporary directory that is moved
+ * into place atomically; each installed directory lists the size and digest
+ * of its files, which are checked against the listing and the directory
+ * name once per process, so an incomplete or damaged copy is detected and
+ * replaced.
+ * Fragments packaged with a {@value #DIGEST_HEADER} header are checked
+ * against it, and found in the cache by it without extraction.
+ */
+class Z3BinaryCache {
+
+	static final String CACHE_PROPERTY = "com.collins.trustedsystems.z3.cache";
+	/** Manifest header carrying the digest of the fragment's binaries, written by the release fetcher. */
+	static final String DIGEST_HEADER = "Z3-Binaries-Digest";
+	private static final String LISTING = ".complete";
+	/** Installed directories whose contents this process has already hashed. */
+	private static final Set<Path> verified = ConcurrentHashMap.newKeySet();
+
+	private final Path root;
+
+	Z3BinaryCache() {
+		String dir = System.getProperty(CACHE_PROPERTY);
+		if (dir == null) {
+			dir = Paths.get(System.getProperty("user.home"), ".cache", "com.collins.trustedsystems.z3").toString();
+		}
+		this.root = Paths.get(dir);
+	}
+
+	/**
+	 * Get the directory holding the extracted contents of a bundle folder,
+	 * extracting it if no valid copy is cached.
+	 */
+	File install(Bundle bundle, String folder) throws IOException {
+		Path index = root.resolve("index").resolve(
+				bundle.getSymbolicName() + "_" + bundle.getVersion() + "_" + bundle.getLastModified());
+		if (Files.exists(index)) {
+			String digest = new String(Files.readAllBytes(index), StandardCharsets.US_ASCII).trim();
+			Path dir = root.resolve(digest);
+			if (isValid(dir)) {
+				return dir.toFile();
+			}
+		}
+
+		// A fragment that declares the digest of its binaries is matched
+		// against the cache without being read at all
+		String expected = bundle.getHeaders("").get(DIGEST_HEADER);
+		if (expected != null && isValid(root.resolve(expected))) {
+			writeIndex(index, expected);
+			return root.resolve(expected).toFile();
+		}
+
+		Files.createDirectories(root);
+		Path temp = Files.createTempDirectory(root, "extract");
+		String digest;
+		try {
+			digest = extract(bundle, folder, temp);
+			if (expected != null && !expected.equals(digest)) {
+				throw new IOException("Binaries of " + bundle.getSymbolicName() + " do not match " + DIGEST_HEADER);
+			}
+		} catch (IOException | RuntimeException e) {
+			delete(temp);
+			throw e;
+		}
+		Path dir = root.resolve(digest);
+		if (isValid(dir)) {
+			delete(temp);
+		} else {
+			if (Files.exists(dir)) {
+				delete(dir);
+			}
+			try {
+				Files.move(temp, dir, StandardCopyOption.ATOMIC_MOVE);
+			} catch (FileAlreadyExistsException | DirectoryNotEmptyException | AtomicMoveNotSupportedException e) {
+				// Another process installed the same content first
+				delete(temp);
+				if (!isValid(dir)) {
+					throw new IOException("Unable to install z3 binaries in " + dir, e);
+				}
+			}
+		}
+
+		writeIndex(index, digest);
+		return dir.toFile();
+	}
+
+	private static void writeIndex(Path index, String digest) throws IOException {
+		Files.createDirectories(index.getParent());
+		Path indexTemp = Files.createTempFile(index.getParent(), "index", ".tmp");
+		Files.write(indexTemp, digest.getBytes(StandardCharsets.US_ASCII));
+		Files.move(indexTemp, index, StandardCopyOption.REPLACE_EXISTING, StandardCopyOption.ATOMIC_MOVE);
+	}
+
+	/**
+	 * Copy the folder's entries into the target directory, returning the
+	 * digest of their names and contents.
+	 */
+	private static String extract(Bundle bundle, String folder, Path target) throws IOException {
+		Enumeration<URL> entries = bundle.findEntries(folder, "*", true);
+		if (entries == null) {
+			throw new IOException("Bundle " + bundle.getSymbolicName() + " has no " + folder + " folder");
+		}
+		List<URL> urls = Collections.list(entries);
+		urls.sort(Comparator.comparing(URL::getPath));
+
+		MessageDigest contentDigest = sha256();
+		List<String> listing = new ArrayList<>();
+		byte[] buffer = new byte[64 * 1024];
+		for (URL url : urls) {
+			String path = url.getPath();
+			if (path.endsWith("/")) {
+				continue;
+			}
+			String name = path.substring(path.indexOf(folder + "/") + folder.length() + 1);
+			Path file = target.resolve(name);
+			Files.createDirectories(file.getParent());
+			MessageDigest fileDigest = sha256();
+			long size = 0;
+			try (InputStream in = url.openStream(); OutputStream out = Files.newOutputStream(file)) {
+				int n;
+				while ((n = in.read(buffer)) > 0) {
+					out.write(buffer, 0, n);
+					fileDigest.update(buffer, 0, n);
+					size += n;
+				}
+			}
+			file.toFile().setExecutable(true);
+			String hex = toHex(fileDigest.digest());
+			listing.add(size + " " + hex + " " + name);
+			contentDigest.update((name + "\0" + hex + "\n").getBytes(StandardCharsets.UTF_8));
+		}
+
+		try (Writer writer = Files.newBufferedWriter(target.resolve(LISTING), StandardCharsets.UTF_8)) {
+			for (String line : listing) {
+				writer.write(line);
+				writer.write('\n');
+			}
+		}
+		return toHex(contentDigest.digest());
+	}
+
+	/**
+	 * Check that every file listed for an installed directory is present
+	 * with the recorded size. The first check in a process also hashes the
+	 * files against their recorded digests, and the listing against the
+	 * directory name.
+	 */
+	private static boolean isValid(Path dir) {
+		Path listing = dir.resolve(LISTING);
+		if (!Files.isRegularFile(listing)) {
+			return false;
+		}
+		boolean verify = !verified.contains(dir);
+		MessageDigest contentDigest = sha256();
+		try (BufferedReader reader = Files.newBufferedReader(listing, StandardCharsets.UTF_8)) {
+			String line;
+			while ((line = reader.readLine()) != null) {
+				String[] fields = line.split(" ", 3);
+				Path file = dir.resolve(fields[2]);
+				if (!Files.isRegularFile(file) || Files.size(file) != Long.parseLong(fields[0])) {
+					return false;
+				}
+				if (verify && !fields[1].equals(hash(file))) {
+					return false;
+				}
+				contentDigest.update((fields[2] + "\0" + fields[1] + "\n").getBytes(StandardCharsets.UTF_8));
+			}
+		} catch (IOException | RuntimeException e) {
+			return false;
+		}
+		if (verify) {
+			if (!toHex(contentDigest.digest()).equals(dir.getFileName().toString())) {
+				return false;
+			}
+			verified.add(dir);
+		}
+		return true;
+	}
+
+	private static String hash(Path file) throws IOException {
+		MessageDigest digest = sha256();
+		byte[] buffer = new byte[64 * 1024];
+		try (InputStream in = Files.newInputStream(file)) {
+			int n;
+			while ((n = in.read(buffer)) > 0) {
+				digest.update(buffer, 0, n);
+			}
+		}
+		return toHex(digest.digest());
+	}
+
+	private static void delete(Path dir) throws IOException {
+		try (Stream<Path> paths = Files.walk(dir)) {
+			paths.sorted(Comparator.reverseOrder()).forEach(p -> p.toFile().delete());
+		}
+	}
+
+	private static MessageDigest sha256() {
+		try {
+			return MessageDigest.getInstance("SHA-256");
+		} catch (NoSuchAlgorithmException e) {
+			throw new IllegalStateException(e);
+		}
+	}
+
+	private static String toHex(byte[] bytes) {
+		StringBuilder sb = new StringBuilder(bytes.length * 2);
+		for (byte b : bytes) {
+			sb.append(String.format("%02x", b));
+		}
+		return sb.toString();
+	}
+
+}
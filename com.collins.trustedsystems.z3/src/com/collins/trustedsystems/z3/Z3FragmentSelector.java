@@ -0,0 +1,204 @@
+package com.collins.trustedsystems.z3;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Files;
+import java.nio.file.Path;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.Comparator;
+import java.util.HashSet;
+import java.util.List;
+import java.util.Set;
+import java.util.concurrent.TimeUnit;
+
+import org.osgi.framework.Bundle;
+
+/**
+ * Chooses among the variant fragments that hold a z3 optimized for more
+ * capable hosts than the generic fragment of the platform.
+ *
+ * Variants are named after the generic fragment with a suffix, such as
+ * {@code com.collins.trustedsystems.z3.linux.gtk.x86_64.x86_64_v3}, and state
+ * what they need in their manifest: {@value #CPU_HEADER} lists
+ * {@code /proc/cpuinfo} flags and {@value #GLIBC_HEADER} the oldest glibc
+ * they run with. Variants the host satisfies are preferred by the number of
+ * CPU features they use, then by glibc version. A host whose features
+ * cannot be read only gets variants that need none.
+ */
+class Z3FragmentSelector {
+
+	/** System property naming the only variant to use, bypassing the host checks, or "generic" for none. */
+	static final String VARIANT_PROPERTY = "com.collins.trustedsystems.z3.variant";
+	static final String VARIANT_HEADER = "Z3-Variant";
+	static final String CPU_HEADER = "Z3-CPU-Features";
+	static final String GLIBC_HEADER = "Z3-Glibc-Version";
+	private static final long PROBE_TIMEOUT_MILLIS = 10000;
+
+	private final Set<String> cpuFlags;
+	private final int[] glibcVersion;
+
+	Z3FragmentSelector() {
+		this(readCpuFlags(), readGlibcVersion());
+	}
+
+	/**
+	 * @param cpuFlags flags of the host CPU as named in {@code /proc/cpuinfo}
+	 * @param glibcVersion version of the host glibc, or null if unknown
+	 */
+	Z3FragmentSelector(Set<String> cpuFlags, int[] glibcVersion) {
+		this.cpuFlags = cpuFlags;
+		this.glibcVersion = glibcVersion;
+	}
+
+	/**
+	 * Get the variants of a generic fragment the host can run, most
+	 * optimized first.
+	 *
+	 * @param fragments all fragments attached to the host bundle, may be null
+	 */
+	List<Bundle> select(Bundle generic, Bundle[] fragments) {
+		List<Bundle> variants = new ArrayList<>();
+		if (fragments == null) {
+			return variants;
+		}
+		String forced = System.getProperty(VARIANT_PROPERTY);
+		String prefix = generic.getSymbolicName() + ".";
+		for (Bundle fragment : fragments) {
+			String variant = header(fragment, VARIANT_HEADER);
+			if (!fragment.getSymbolicName().startsWith(prefix) || variant == null) {
+				continue;
+			}
+			if (forced != null ? forced.equals(variant) : isCompatible(fragment)) {
+				variants.add(fragment);
+			}
+		}
+		variants.sort(Comparator.comparingInt((Bundle b) -> requiredFlags(b).size())
+				.thenComparing((Bundle b) -> parseVersion(header(b, GLIBC_HEADER)), Z3FragmentSelector::compareVersions)
+				.reversed());
+		return variants;
+	}
+
+	private boolean isCompatible(Bundle fragment) {
+		if (!cpuFlags.containsAll(requiredFlags(fragment))) {
+			return false;
+		}
+		int[] required = parseVersion(header(fragment, GLIBC_HEADER));
+		return required == null || (glibcVersion != null && compareVersions(glibcVersion, required) >= 0);
+	}
+
+	private static Set<String> requiredFlags(Bundle fragment) {
+		String flags = header(fragment, CPU_HEADER);
+		if (flags == null || flags.trim().isEmpty()) {
+			return Collections.emptySet();
+		}
+		return new HashSet<>(Arrays.asList(flags.trim().split("\\s+")));
+	}
+
+	private static String header(Bundle bundle, String name) {
+		return bundle.getHeaders("").get(name);
+	}
+
+	/**
+	 * Check that an extracted z3 starts and reports its version, which it
+	 * does not if the CPU lacks an instruction it was built for.
+	 */
+	static boolean runs(File executable) {
+		try {
+			Process process = new ProcessBuilder(executable.getPath(), "-version").redirectErrorStream(true).start();
+			String output;
+			try (BufferedReader reader = new BufferedReader(
+					new InputStreamReader(process.getInputStream(), StandardCharsets.US_ASCII))) {
+				output = reader.readLine();
+			}
+			if (!process.waitFor(PROBE_TIMEOUT_MILLIS, TimeUnit.MILLISECONDS)) {
+				process.destroyForcibly();
+				return false;
+			}
+			return process.exitValue() == 0 && output != null && output.startsWith("Z3 version");
+		} catch (IOException e) {
+			return false;
+		} catch (InterruptedException e) {
+			Thread.currentThread().interrupt();
+			return false;
+		}
+	}
+
+	private static Set<String> readCpuFlags() {
+		Path cpuinfo = Paths.get("/proc/cpuinfo");
+		if (!Files.isReadable(cpuinfo)) {
+			return Collections.emptySet();
+		}
+		try (BufferedReader reader = Files.newBufferedReader(cpuinfo, StandardCharsets.US_ASCII)) {
+			String line;
+			while ((line = reader.readLine()) != null) {
+				if (line.startsWith("flags")) {
+					return new HashSet<>(Arrays.asList(line.substring(line.indexOf(':') + 1).trim().split("\\s+")));
+				}
+			}
+		} catch (IOException e) {
+			// Treated as a host without optional features
+		}
+		return Collections.emptySet();
+	}
+
+	private static int[] readGlibcVersion() {
+		if (!System.getProperty("os.name").toLowerCase().contains("linux")) {
+			return null;
+		}
+		try {
+			Process process = new ProcessBuilder("getconf", "GNU_LIBC_VERSION").redirectErrorStream(true).start();
+			String output;
+			try (BufferedReader reader = new BufferedReader(
+					new InputStreamReader(process.getInputStream(), StandardCharsets.US_ASCII))) {
+				output = reader.readLine();
+			}
+			if (!process.waitFor(PROBE_TIMEOUT_MILLIS, TimeUnit.MILLISECONDS)) {
+				process.destroyForcibly();
+				return null;
+			}
+			// "glibc 2.31"
+			if (process.exitValue() != 0 || output == null || !output.startsWith("glibc ")) {
+				return null;
+			}
+			return parseVersion(output.substring("glibc ".length()));
+		} catch (IOException e) {
+			return null;
+		} catch (InterruptedException e) {
+			Thread.currentThread().interrupt();
+			return null;
+		}
+	}
+
+	static int[] parseVersion(String version) {
+		if (version == null) {
+			return null;
+		}
+		try {
+			return Arrays.stream(version.trim().split("\\.")).mapToInt(Integer::parseInt).toArray();
+		} catch (NumberFormatException e) {
+			return null;
+		}
+	}
+
+	/** Compare dotted versions numerically; an unknown version sorts first. */
+	static int compareVersions(int[] a, int[] b) {
+		if (a == null || b == null) {
+			return a == null ? (b == null ? 0 : -1) : 1;
+		}
+		for (int i = 0; i < Math.max(a.length, b.length); i++) {
+			int x = i < a.length ? a[i] : 0;
+			int y = i < b.length ? b[i] : 0;
+			if (x != y) {
+				return Integer.compare(x, y);
+			}
+		}
+		return 0;
+	}
+
+}
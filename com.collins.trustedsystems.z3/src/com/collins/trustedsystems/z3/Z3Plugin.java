@@ -1,7 +1,11 @@
 package com.collins.trustedsystems.z3;
 
 import java.io.File;
+import java.io.IOException;
 import java.net.URL;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.Future;
+import java.util.concurrent.FutureTask;
 
 import org.eclipse.core.runtime.FileLocator;
 import org.eclipse.core.runtime.Platform;
@@ -9,18 +13,93 @@ import org.osgi.framework.Bundle;
 
 public class Z3Plugin {
 
+	private static Z3ProcessPool processPool;
+	private static Future<String> extraction;
+	private static volatile String z3Directory;
+
 	public static String getZ3Directory() {
+		String dir = z3Directory;
+		if (dir != null) {
+			return dir;
+		}
+		try {
+			dir = startExtraction().get();
+		} catch (ExecutionException e) {
+			resetExtraction();
+			throw new IllegalArgumentException("Unable to extract z3 from plug-in", e.getCause());
+		} catch (InterruptedException e) {
+			Thread.currentThread().interrupt();
+			throw new IllegalArgumentException("Interrupted while extracting z3 from plug-in", e);
+		}
+		z3Directory = dir;
+		return dir;
+	}
+
+	/**
+	 * Start locating (and if needed extracting) the z3 binaries in the
+	 * background, so the first solver call does not wait for it.
+	 */
+	static synchronized Future<String> startExtraction() {
+		if (extraction == null) {
+			FutureTask<String> task = new FutureTask<>(Z3Plugin::extractZ3Directory);
+			Thread thread = new Thread(task, "z3-extraction");
+			thread.setDaemon(true);
+			thread.start();
+			extraction = task;
+		}
+		return extraction;
+	}
+
+	private static synchronized void resetExtraction() {
+		extraction = null;
+	}
+
+	private static String extractZ3Directory() throws IOException {
 		String fragmentExt = getFragmentExt();
 		Bundle bundle = Platform.getBundle("com.collins.trustedsystems.z3" + "." + fragmentExt);
-		String exeName = getExecutableName();
+		if (bundle == null) {
+			throw new IOException("No z3 binaries fragment for " + fragmentExt);
+		}
+		Z3BinaryCache cache = new Z3BinaryCache();
+		Bundle[] fragments = Platform.getFragments(Platform.getBundle("com.collins.trustedsystems.z3"));
+		for (Bundle variant : new Z3FragmentSelector().select(bundle, fragments)) {
+			try {
+				File dir = cache.install(variant, "binaries");
+				if (Z3FragmentSelector.runs(new File(dir, getExecutableName()))) {
+					return dir.getPath();
+				}
+			} catch (IOException e) {
+				// Try the next variant, and finally the generic fragment
+			}
+		}
 		try {
 			// Extract entire directory so DLLs are available on windows
+			return cache.install(bundle, "binaries").getPath();
+		} catch (IOException e) {
+			// Fall back to extracting into the workspace state area
 			URL dirUrl = FileLocator.toFileURL(bundle.getEntry("binaries"));
-			File exe = new File(dirUrl.getPath(), exeName);
+			File exe = new File(dirUrl.getPath(), getExecutableName());
 			exe.setExecutable(true);
 			return exe.getParent();
-		} catch (Exception e) {
-			throw new IllegalArgumentException("Unable to extract z3 from plug-in", e);
+		}
+	}
+
+	/**
+	 * Get the shared pool of long-lived z3 processes, creating it on first use
+	 * with one process per available processor.
+	 */
+	public static synchronized Z3ProcessPool getZ3ProcessPool() {
+		if (processPool == null) {
+			File exe = new File(getZ3Directory(), getExecutableName());
+			processPool = new Z3ProcessPool(exe, Runtime.getRuntime().availableProcessors());
+		}
+		return processPool;
+	}
+
+	static synchronized void shutdownZ3ProcessPool() {
+		if (processPool != null) {
+			processPool.close();
+			processPool = null;
 		}
 	}
 
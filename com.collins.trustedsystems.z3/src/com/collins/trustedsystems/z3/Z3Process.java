@@ -0,0 +1,167 @@
+package com.collins.trustedsystems.z3;
+
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStreamWriter;
+import java.io.Writer;
+import java.nio.charset.StandardCharsets;
+import java.util.concurrent.BlockingQueue;
+import java.util.concurrent.LinkedBlockingQueue;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+import java.util.concurrent.atomic.AtomicLong;
+
+/**
+ * A long-lived z3 process reading SMT-LIB commands from its standard input
+ * ({@code z3 -in}).
+ *
+ * Each call to {@link #execute(String, long)} writes the script followed by an
+ * {@code echo} of a unique sentinel and collects the output up to that
+ * sentinel, so a single process can serve any number of queries. A process
+ * that times out or dies is destroyed and must not be reused.
+ */
+public class Z3Process {
+
+	private static final String EOF = new String("<eof>");
+	private static final AtomicLong SENTINELS = new AtomicLong();
+
+	private final Process process;
+	private final Writer input;
+	private final BlockingQueue<String> output = new LinkedBlockingQueue<>();
+	private volatile long lastUsed = System.currentTimeMillis();
+	private volatile boolean broken = false;
+
+	public Z3Process(File executable) throws IOException {
+		ProcessBuilder builder = new ProcessBuilder(executable.getPath(), "-in");
+		builder.directory(executable.getParentFile());
+		builder.redirectErrorStream(true);
+		process = builder.start();
+		input = new OutputStreamWriter(process.getOutputStream(), StandardCharsets.US_ASCII);
+		Thread reader = new Thread(this::readOutput, "z3-reader-" + SENTINELS.incrementAndGet());
+		reader.setDaemon(true);
+		reader.start();
+	}
+
+	private void readOutput() {
+		try (BufferedReader reader = new BufferedReader(
+				new InputStreamReader(process.getInputStream(), StandardCharsets.US_ASCII))) {
+			String line;
+			while ((line = reader.readLine()) != null) {
+				output.add(line);
+			}
+		} catch (IOException e) {
+			// Treated as end of stream
+		} finally {
+			output.add(EOF);
+		}
+	}
+
+	/**
+	 * Send a script to z3 and return everything it printed in response.
+	 *
+	 * @param script SMT-LIB commands
+	 * @param timeoutMillis maximum time to wait for the response
+	 * @return the output of z3, one line per response line
+	 * @throws TimeoutException if z3 does not answer in time; the process is destroyed
+	 * @throws IOException if the process cannot be written to or has exited
+	 */
+	public synchronized String execute(String script, long timeoutMillis) throws IOException, TimeoutException {
+		if (broken || !process.isAlive()) {
+			broken = true;
+			throw new IOException("z3 process is no longer running");
+		}
+		String sentinel = "z3-plugin-done-" + SENTINELS.incrementAndGet();
+		output.clear();
+		try {
+			input.write(script);
+			input.write("\n(echo \"" + sentinel + "\")\n");
+			input.flush();
+		} catch (IOException e) {
+			destroy();
+			throw e;
+		}
+
+		StringBuilder result = new StringBuilder();
+		long deadline = System.nanoTime() + TimeUnit.MILLISECONDS.toNanos(timeoutMillis);
+		try {
+			while (true) {
+				long remaining = deadline - System.nanoTime();
+				String line = remaining > 0 ? output.poll(remaining, TimeUnit.NANOSECONDS) : null;
+				if (line == null) {
+					destroy();
+					throw new TimeoutException("z3 did not respond within " + timeoutMillis + " ms");
+				}
+				if (line == EOF) {
+					destroy();
+					throw new IOException("z3 process exited: " + result);
+				}
+				if (line.equals(sentinel)) {
+					break;
+				}
+				result.append(line).append('\n');
+			}
+		} catch (InterruptedException e) {
+			destroy();
+			Thread.currentThread().interrupt();
+			throw new IOException("Interrupted while waiting for z3", e);
+		}
+		lastUsed = System.currentTimeMillis();
+		return result.toString();
+	}
+
+	/**
+	 * Check that the process still answers a trivial command within the timeout.
+	 */
+	public boolean isHealthy(long timeoutMillis) {
+		try {
+			return execute("(echo \"ping\")", timeoutMillis).trim().equals("ping");
+		} catch (IOException | TimeoutException e) {
+			return false;
+		}
+	}
+
+	public boolean isBroken() {
+		return broken || !process.isAlive();
+	}
+
+	public void push(long timeoutMillis) throws IOException, TimeoutException {
+		execute("(push)", timeoutMillis);
+	}
+
+	public void pop(long timeoutMillis) throws IOException, TimeoutException {
+		execute("(pop)", timeoutMillis);
+	}
+
+	/**
+	 * Discard all assertions, declarations and options so the process can be
+	 * handed to an unrelated caller.
+	 */
+	public void reset(long timeoutMillis) throws IOException, TimeoutException {
+		execute("(reset)", timeoutMillis);
+	}
+
+	public long getLastUsed() {
+		return lastUsed;
+	}
+
+	/**
+	 * The underlying operating system process, for tests that kill it behind
+	 * the pool's back.
+	 */
+	Process getProcess() {
+		return process;
+	}
+
+	public void destroy() {
+		broken = true;
+		try {
+			input.close();
+		} catch (IOException e) {
+			// Ignore, the process is being killed anyway
+		}
+		process.destroyForcibly();
+	}
+
+}
@@ -0,0 +1,206 @@
+package com.collins.trustedsystems.z3;
+
+import java.io.File;
+import java.io.IOException;
+import java.util.ArrayList;
+import java.util.Deque;
+import java.util.Iterator;
+import java.util.LinkedList;
+import java.util.List;
+import java.util.concurrent.Executors;
+import java.util.concurrent.ScheduledExecutorService;
+import java.util.concurrent.Semaphore;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+
+/**
+ * A bounded pool of long-lived {@link Z3Process} instances.
+ *
+ * At most {@code maxSize} processes exist at any time. Callers either run a
+ * self-contained script with {@link #execute(String, long)} or borrow a
+ * process for an incremental session with {@link #acquire(long)}. Processes
+ * are cleaned with {@code (reset)} or {@code (push)}/{@code (pop)} between
+ * callers, checked for health after sitting idle, and terminated once they
+ * have been idle longer than the idle timeout.
+ */
+public class Z3ProcessPool implements AutoCloseable {
+
+	public enum ReuseMode {
+		/** Issue {@code (reset)} after each use; scripts may set the logic and options. */
+		RESET,
+		/** Wrap each use in {@code (push)}/{@code (pop)}; cheaper, but the logic cannot be changed. */
+		PUSH_POP
+	}
+
+	public static final long DEFAULT_IDLE_TIMEOUT_MILLIS = 60000;
+	public static final long DEFAULT_HEALTH_CHECK_MILLIS = 5000;
+	private static final long CONTROL_TIMEOUT_MILLIS = 5000;
+
+	private final File executable;
+	private final ReuseMode reuseMode;
+	private final long idleTimeoutMillis;
+	private final long healthCheckMillis;
+	private final Semaphore permits;
+	private final Deque<Z3Process> idle = new LinkedList<>();
+	private final ScheduledExecutorService evictor;
+	private volatile boolean closed = false;
+
+	public Z3ProcessPool(File executable, int maxSize) {
+		this(executable, maxSize, ReuseMode.RESET, DEFAULT_IDLE_TIMEOUT_MILLIS, DEFAULT_HEALTH_CHECK_MILLIS);
+	}
+
+	public Z3ProcessPool(File executable, int maxSize, ReuseMode reuseMode, long idleTimeoutMillis,
+			long healthCheckMillis) {
+		if (maxSize < 1) {
+			throw new IllegalArgumentException("Pool size must be at least 1");
+		}
+		this.executable = executable;
+		this.reuseMode = reuseMode;
+		this.idleTimeoutMillis = idleTimeoutMillis;
+		this.healthCheckMillis = healthCheckMillis;
+		this.permits = new Semaphore(maxSize, true);
+		this.evictor = Executors.newSingleThreadScheduledExecutor(r -> {
+			Thread thread = new Thread(r, "z3-pool-evictor");
+			thread.setDaemon(true);
+			return thread;
+		});
+		long period = Math.max(idleTimeoutMillis / 2, 1000);
+		evictor.scheduleWithFixedDelay(this::evictIdle, period, period, TimeUnit.MILLISECONDS);
+	}
+
+	/**
+	 * Run a self-contained SMT-LIB script on a pooled process.
+	 *
+	 * @param script SMT-LIB commands
+	 * @param timeoutMillis limit on waiting for a free process plus running the script
+	 * @return the output of z3
+	 */
+	public String execute(String script, long timeoutMillis) throws IOException, TimeoutException {
+		long deadline = System.currentTimeMillis() + timeoutMillis;
+		Z3Process process = acquire(timeoutMillis);
+		boolean reusable = false;
+		try {
+			if (reuseMode == ReuseMode.PUSH_POP) {
+				process.push(CONTROL_TIMEOUT_MILLIS);
+			}
+			String result = process.execute(script, Math.max(deadline - System.currentTimeMillis(), 1));
+			reusable = true;
+			return result;
+		} finally {
+			release(process, reusable);
+		}
+	}
+
+	/**
+	 * Borrow a process for exclusive use. It must be handed back with
+	 * {@link #release(Z3Process, boolean)}.
+	 *
+	 * @param timeoutMillis maximum time to wait for a free process
+	 */
+	public Z3Process acquire(long timeoutMillis) throws IOException, TimeoutException {
+		if (closed) {
+			throw new IllegalStateException("z3 process pool is closed");
+		}
+		try {
+			if (!permits.tryAcquire(timeoutMillis, TimeUnit.MILLISECONDS)) {
+				throw new TimeoutException("No z3 process available within " + timeoutMillis + " ms");
+			}
+		} catch (InterruptedException e) {
+			Thread.currentThread().interrupt();
+			throw new IOException("Interrupted while waiting for a z3 process", e);
+		}
+		try {
+			Z3Process process;
+			while ((process = pollIdle()) != null) {
+				if (isUsable(process)) {
+					return process;
+				}
+				process.destroy();
+			}
+			return new Z3Process(executable);
+		} catch (IOException | RuntimeException e) {
+			permits.release();
+			throw e;
+		}
+	}
+
+	/**
+	 * Return a borrowed process to the pool.
+	 *
+	 * @param reusable false if the caller left the process in an unknown
+	 *            state, in which case it is terminated
+	 */
+	public void release(Z3Process process, boolean reusable) {
+		try {
+			if (reusable && !closed && !process.isBroken()) {
+				try {
+					if (reuseMode == ReuseMode.PUSH_POP) {
+						process.pop(CONTROL_TIMEOUT_MILLIS);
+					} else {
+						process.reset(CONTROL_TIMEOUT_MILLIS);
+					}
+					synchronized (idle) {
+						idle.addFirst(process);
+					}
+					return;
+				} catch (IOException | TimeoutException e) {
+					// Fall through and discard the process
+				}
+			}
+			process.destroy();
+		} finally {
+			permits.release();
+		}
+	}
+
+	private Z3Process pollIdle() {
+		synchronized (idle) {
+			return idle.pollFirst();
+		}
+	}
+
+	private boolean isUsable(Z3Process process) {
+		if (process.isBroken()) {
+			return false;
+		}
+		if (System.currentTimeMillis() - process.getLastUsed() < healthCheckMillis) {
+			return true;
+		}
+		return process.isHealthy(CONTROL_TIMEOUT_MILLIS);
+	}
+
+	private void evictIdle() {
+		long now = System.currentTimeMillis();
+		List<Z3Process> evicted = new ArrayList<>();
+		synchronized (idle) {
+			Iterator<Z3Process> it = idle.iterator();
+			while (it.hasNext()) {
+				Z3Process process = it.next();
+				if (process.isBroken() || now - process.getLastUsed() > idleTimeoutMillis) {
+					it.remove();
+					evicted.add(process);
+				}
+			}
+		}
+		evicted.forEach(Z3Process::destroy);
+	}
+
+	public int getIdleCount() {
+		synchronized (idle) {
+			return idle.size();
+		}
+	}
+
+	@Override
+	public void close() {
+		closed = true;
+		evictor.shutdownNow();
+		List<Z3Process> remaining;
+		synchronized (idle) {
+			remaining = new ArrayList<>(idle);
+			idle.clear();
+		}
+		remaining.forEach(Z3Process::destroy);
+	}
+
+}
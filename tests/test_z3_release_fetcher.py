@@ -0,0 +1,301 @@
+'''Tests of the stateful parts of z3_release_fetcher.
+
+Run from the repository root with python3 -m unittest discover -s tests
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+# Keep the module's state stores out of the user's cache
+STATE_DIR = tempfile.mkdtemp(prefix='z3-fetcher-tests-')
+os.environ['Z3_FETCHER_STATE_DIR'] = STATE_DIR
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import z3_release_fetcher as fetcher
+
+
+def tearDownModule():
+    shutil.rmtree(STATE_DIR, ignore_errors=True)
+
+
+class CheckpointsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.checkpoints = fetcher.Checkpoints(os.path.join(self.temp_dir, 'state', 'checkpoints.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_nothing_is_done_without_resume(self):
+        self.checkpoints.start('4.8.6', 'z3-4.8.6')
+        self.checkpoints.record('4.8.6', 'render')
+        self.assertFalse(self.checkpoints.done('4.8.6', 'render'))
+        self.assertIsNone(self.checkpoints.last_stage('4.8.6'))
+
+    def test_resume_keeps_recorded_stages(self):
+        self.checkpoints.start('4.8.6', 'z3-4.8.6')
+        self.checkpoints.record('4.8.6', 'render')
+        self.checkpoints.record('4.8.6', 'download', 'linux', sha256='abc')
+        self.checkpoints.resume = True
+        self.checkpoints.start('4.8.6', 'z3-4.8.6')
+        self.assertTrue(self.checkpoints.done('4.8.6', 'render'))
+        self.assertEqual(self.checkpoints.get('4.8.6', 'download', 'linux')['sha256'], 'abc')
+        self.assertFalse(self.checkpoints.done('4.8.6', 'download', 'osx'))
+        self.assertEqual(self.checkpoints.last_stage('4.8.6'), 'download')
+
+    def test_start_without_resume_clears_a_version(self):
+        self.checkpoints.record('4.8.6', 'render')
+        self.checkpoints.start('4.8.6', 'z3-4.8.6')
+        self.checkpoints.resume = True
+        self.assertFalse(self.checkpoints.done('4.8.6', 'render'))
+
+    def test_stage_in_work_tree_only_counts_there(self):
+        work_dir = os.path.join(self.temp_dir, 'worktree')
+        self.checkpoints.resume = True
+        self.checkpoints.record('4.8.6', 'copy', 'linux', work_dir)
+        self.assertTrue(self.checkpoints.done('4.8.6', 'copy', 'linux', work_dir))
+        self.assertFalse(self.checkpoints.done('4.8.6', 'copy', 'linux', self.temp_dir))
+
+    def test_unfinished_lists_releases_without_upload(self):
+        for ver in ('4.8.4', '4.8.5', '4.8.6'):
+            self.checkpoints.start(ver, 'z3-' + ver)
+        self.checkpoints.record('4.8.4', 'release')
+        self.checkpoints.record('4.8.4', 'upload')
+        self.checkpoints.record('4.8.5', 'release')
+        self.checkpoints.record('4.8.6', 'commit')
+        self.assertEqual(self.checkpoints.unfinished(), {'4.8.5': 'z3-4.8.5'})
+
+
+class BuildCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = fetcher.BuildCache(os.path.join(self.temp_dir, 'cache'))
+        self.output = os.path.join(self.temp_dir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.output, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+
+    def read(self, name):
+        with open(os.path.join(self.output, name)) as f:
+            return f.read()
+
+    def test_fingerprint_depends_on_every_input(self):
+        fingerprint = fetcher.BuildCache.fingerprint('maven', ['mvn'], '4.8.6', 'tree')
+        self.assertEqual(fingerprint, fetcher.BuildCache.fingerprint('maven', ['mvn'], '4.8.6', 'tree'))
+        self.assertNotEqual(fingerprint, fetcher.BuildCache.fingerprint('maven', ['mvn'], '4.8.5', 'tree'))
+        self.assertNotEqual(fingerprint, fetcher.BuildCache.fingerprint('maven', ['mvn', '-o'], '4.8.6', 'tree'))
+        self.assertNotEqual(fingerprint, fetcher.BuildCache.fingerprint('binaries', ['mvn'], '4.8.6', 'tree'))
+
+    def test_restore_replaces_outputs(self):
+        self.write('a.jar', 'built')
+        self.cache.store('maven', 'f1', {'out': self.output})
+        self.write('a.jar', 'changed')
+        self.write('stale.jar', 'stale')
+        self.assertTrue(self.cache.restore('maven', 'f1', {'out': self.output}))
+        self.assertEqual(self.read('a.jar'), 'built')
+        self.assertFalse(os.path.exists(os.path.join(self.output, 'stale.jar')))
+        self.assertFalse(self.cache.restore('maven', 'f2', {'out': self.output}))
+
+    def test_disabled_cache_never_hits(self):
+        self.write('a.jar', 'built')
+        self.cache.enabled = False
+        self.cache.store('maven', 'f1', {'out': self.output})
+        self.assertFalse(self.cache.restore('maven', 'f1', {'out': self.output}))
+
+    def test_unchanged_files_are_merged_not_stored(self):
+        self.write('repository/plugins/old.jar', 'published')
+        unchanged = {'out': fetcher.tree_digests(self.output)}
+        self.write('repository/plugins/new.jar', 'built')
+        self.write('repository/content.jar', 'metadata')
+        self.cache.store('maven', 'f1', {'out': self.output}, unchanged)
+        entry = os.path.join(self.cache.root, 'maven', 'f1', 'out')
+        self.assertEqual(sorted(fetcher.tree_digests(entry)), [os.path.join('repository', 'content.jar'),
+                                                               os.path.join('repository', 'plugins', 'new.jar')])
+        shutil.rmtree(self.output)
+        self.write('repository/plugins/old.jar', 'published')
+        self.assertTrue(self.cache.restore('maven', 'f1', {'out': self.output}))
+        self.assertEqual(self.read('repository/plugins/old.jar'), 'published')
+        self.assertEqual(self.read('repository/plugins/new.jar'), 'built')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.write('a.jar', 'x' * 1000)
+        self.cache.max_bytes = 2500
+        for fingerprint in ('f1', 'f2'):
+            self.cache.store('maven', fingerprint, {'out': self.output})
+        past = time.time() - 60
+        os.utime(os.path.join(self.cache.root, 'maven', 'f1'), (past, past))
+        os.utime(os.path.join(self.cache.root, 'maven', 'f2'), (past - 60, past - 60))
+        self.assertTrue(self.cache.restore('maven', 'f2', {'out': self.output}))
+        self.cache.store('maven', 'f3', {'out': self.output})
+        self.assertEqual(sorted(os.listdir(os.path.join(self.cache.root, 'maven'))), ['f2', 'f3'])
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code, headers=None, text=''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class FakeSession(object):
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.sent = 0
+
+    def request(self, method, url, *args, **kwargs):
+        self.sent += 1
+        return self.responses.pop(0)
+
+
+class GitHubSchedulerTest(unittest.TestCase):
+
+    def test_rate_follows_remaining_quota(self):
+        scheduler = fetcher.GitHubScheduler(reserve=10)
+        reset = int(time.time()) + 1000
+        scheduler.observe(FakeResponse(200, {'X-RateLimit-Remaining': '110', 'X-RateLimit-Reset': str(reset)}), 0)
+        self.assertEqual(scheduler.remaining, 110)
+        self.assertAlmostEqual(scheduler.rate, 0.1, delta=0.01)
+
+    def test_reserve_is_kept_for_finishing_calls(self):
+        scheduler = fetcher.GitHubScheduler(reserve=10)
+        scheduler.observe(FakeResponse(200, {'X-RateLimit-Remaining': '5',
+                                             'X-RateLimit-Reset': str(int(time.time()) + 100)}), 0)
+        now = time.monotonic()
+        self.assertGreater(scheduler._delay(fetcher.PRIORITY_DISCOVERY, now), 50)
+        self.assertEqual(scheduler._delay(fetcher.PRIORITY_FINISH, now), 0.0)
+
+    def test_burst_then_paced(self):
+        scheduler = fetcher.GitHubScheduler(burst=3)
+        for _ in range(3):
+            scheduler.acquire()
+        self.assertGreater(scheduler._delay(fetcher.PRIORITY_DISCOVERY, time.monotonic()), 0.0)
+
+    def test_secondary_rate_limit_is_retried(self):
+        scheduler = fetcher.GitHubScheduler()
+        session = FakeSession([FakeResponse(403, {'Retry-After': '0'}, 'secondary rate limit'), FakeResponse(200)])
+        scheduler.install(session)
+        self.assertEqual(session.request('GET', 'https://api.github.com/').status_code, 200)
+        self.assertEqual(session.sent, 2)
+
+    def test_other_errors_are_returned(self):
+        scheduler = fetcher.GitHubScheduler()
+        session = FakeSession([FakeResponse(404, text='Not Found')])
+        scheduler.install(session)
+        self.assertEqual(session.request('GET', 'https://api.github.com/').status_code, 404)
+        self.assertEqual(session.sent, 1)
+
+    def test_finishing_calls_go_first(self):
+        scheduler = fetcher.GitHubScheduler(burst=1)
+        scheduler.acquire()
+        order = []
+        def request(priority):
+            with scheduler.priority(priority):
+                scheduler.acquire()
+            order.append(priority)
+        threads = [threading.Thread(target=request, args=(fetcher.PRIORITY_DISCOVERY,))]
+        threads[0].start()
+        while not scheduler.waiters:
+            time.sleep(0.01)
+        threads.append(threading.Thread(target=request, args=(fetcher.PRIORITY_FINISH,)))
+        threads[1].start()
+        while len(scheduler.waiters) < 2:
+            time.sleep(0.01)
+        with scheduler.condition:
+            scheduler.tokens = 1.0
+            scheduler.condition.notify_all()
+        threads[1].join(5)
+        with scheduler.condition:
+            scheduler.tokens = 1.0
+            scheduler.condition.notify_all()
+        threads[0].join(5)
+        self.assertEqual(order, [fetcher.PRIORITY_FINISH, fetcher.PRIORITY_DISCOVERY])
+
+
+class RangeServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    '''Serves DATA at /file, and redirects /asset there like GitHub does'''
+    DATA = bytes(range(256)) * 1024
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get('Range'))
+        if self.path == '/asset':
+            self.send_response(302)
+            self.send_header('Location', '/file')
+            self.end_headers()
+            return
+        start, _, end = self.headers['Range'][len('bytes='):].partition('-')
+        start, end = int(start), min(int(end), len(self.DATA) - 1)
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(self.DATA)))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(self.DATA[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpRangeFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RangeServer(('127.0.0.1', 0), RangeHandler)
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/asset' % (self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_follows_redirect_and_reports_size(self):
+        remote = fetcher.HttpRangeFile(self.url)
+        self.assertEqual(remote.size, len(RangeHandler.DATA))
+        self.assertTrue(remote.url.endswith('/file'))
+
+    def test_seek_and_read(self):
+        remote = fetcher.HttpRangeFile(self.url, block_size=1024)
+        remote.seek(-10, os.SEEK_END)
+        self.assertEqual(remote.read(), RangeHandler.DATA[-10:])
+        remote.seek(5000)
+        self.assertEqual(remote.read(100), RangeHandler.DATA[5000:5100])
+        self.assertEqual(remote.tell(), 5100)
+
+    def test_sequential_reads_grow_requests(self):
+        remote = fetcher.HttpRangeFile(self.url, block_size=1024, max_block_size=8192)
+        data = b''.join(iter(lambda: remote.read(512), b''))
+        self.assertEqual(data, RangeHandler.DATA)
+        self.assertEqual(remote.bytes_fetched, len(RangeHandler.DATA))
+        sizes = []
+        for header in self.server.requests[2:]:
+            start, _, end = header[len('bytes='):].partition('-')
+            sizes.append(min(int(end), len(RangeHandler.DATA) - 1) - int(start) + 1)
+        self.assertEqual(sizes[:3], [2048, 4096, 8192])
+        self.assertEqual(max(sizes), 8192)
+
+
+if __name__ == '__main__':
+    unittest.main()
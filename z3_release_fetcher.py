@@ -13,21 +13,43 @@ Also, versions already packaged are skipped as well.
 @license:    MIT License
 '''
 
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import lzma
+import mmap
 import os
 import re
 import subprocess
 import sys
 import tempfile
+import shutil
+import sqlite3
+import threading
+import time
+
+import requests
 
 from argparse import ArgumentParser
 from argparse import RawDescriptionHelpFormatter
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
 from git import Repo
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from github3 import GitHub
+from macholib.MachO import MachO
 from macholib.MachOGraph import MachOGraph
 from pprint import pprint, pformat
-from shutil import copyfile
+from shutil import copyfile, copyfileobj
+from socketserver import ThreadingMixIn
 from string import Template
-from zipfile import ZipFile
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+from xml.etree import ElementTree
+from zipfile import BadZipFile, ZipFile, ZIP_DEFLATED
 
 POM_TEMPLATE = Template('''<project xmlns="http://maven.apache.org/POM/4.0.0" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
     xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd">
@@ -54,10 +76,11 @@ POM_TEMPLATE = Template('''<project xmlns="http://maven.apache.org/POM/4.0.0" xm
     </properties>
     <modules>
         <module>com.collins.trustedsystems.z3</module>
+        <module>com.collins.trustedsystems.z3.tests</module>
         <module>com.collins.trustedsystems.z3.linux.gtk.x86_64</module>
         <module>com.collins.trustedsystems.z3.macosx.cocoa.x86_64</module>
         <module>com.collins.trustedsystems.z3.win32.win32.x86_64</module>
-        <module>com.collins.trustedsystems.z3.feature</module>
+${variant_modules}        <module>com.collins.trustedsystems.z3.feature</module>
         <module>com.collins.trustedsystems.z3.target</module>
         <module>com.collins.trustedsystems.z3.repository</module>
         <module>com.collins.trustedsystems.z3.updates</module>
@@ -366,6 +389,53 @@ Export-Package: com.collins.trustedsystems.z3
 Automatic-Module-Name: com.collins.trustedsystems.z3
 ''')
 
+TESTS_POM_TEMPLATE = Template('''<?xml version="1.0" encoding="UTF-8"?>
+<project
+    xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd"
+    xmlns="http://maven.apache.org/POM/4.0.0"
+    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+    <modelVersion>4.0.0</modelVersion>
+
+    <parent>
+        <groupId>com.collins.trustedsystems.z3</groupId>
+        <artifactId>com.collins.trustedsystems.z3.parent</artifactId>
+        <version>${plugin_version}</version>
+    </parent>
+    <artifactId>com.collins.trustedsystems.z3.tests</artifactId>
+    <packaging>eclipse-test-plugin</packaging>
+
+    <build>
+        <plugins>
+            <plugin>
+                <groupId>org.eclipse.tycho</groupId>
+                <artifactId>tycho-surefire-plugin</artifactId>
+                <version>$${tycho.version}</version>
+                <configuration>
+                    <useUIHarness>false</useUIHarness>
+                    <useUIThread>false</useUIThread>
+                    <systemProperties>
+                        <!-- The tests run the z3 packaged in the Linux fragment, and are skipped elsewhere -->
+                        <z3.executable>$${project.basedir}/../com.collins.trustedsystems.z3.linux.gtk.x86_64/binaries/z3</z3.executable>
+                    </systemProperties>
+                </configuration>
+            </plugin>
+        </plugins>
+    </build>
+</project>
+''')
+
+TESTS_MANIFEST_TEMPLATE = Template('''Manifest-Version: 1.0
+Bundle-ManifestVersion: 2
+Bundle-Name: Z3 Plugin Tests
+Bundle-SymbolicName: com.collins.trustedsystems.z3.tests
+Bundle-Version: ${plugin_version}
+Bundle-Vendor: Collins Aerospace
+Fragment-Host: com.collins.trustedsystems.z3;bundle-version="${plugin_version}"
+Require-Bundle: org.junit;bundle-version="4.12.0"
+Bundle-RequiredExecutionEnvironment: JavaSE-1.8
+Automatic-Module-Name: com.collins.trustedsystems.z3.tests
+''')
+
 FEATURE_POM_TEMPLATE = Template('''<?xml version="1.0" encoding="UTF-8"?>
 <project
     xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd"
@@ -402,7 +472,7 @@ FEATURE_POM_TEMPLATE = Template('''<?xml version="1.0" encoding="UTF-8"?>
                         <plugin id="com.collins.trustedsystems.z3.linux.gtk.x86_64" />
                         <plugin id="com.collins.trustedsystems.z3.macosx.cocoa.x86_64" />
                         <plugin id="com.collins.trustedsystems.z3.win32.win32.x86_64" />
-                    </excludes>
+${variant_excludes}                    </excludes>
                 </configuration>
             </plugin>
             <plugin>
@@ -488,7 +558,22 @@ THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLI
          version="${plugin_version}"
          fragment="true"/>
 
-</feature>
+${variant_plugins}</feature>
+''')
+
+FEATURE_VARIANT_TEMPLATE = Template('''   <plugin
+         id="${artifact_id}"
+         os="${os}"
+         ws="${ws}"
+         arch="${arch}"
+         download-size="0"
+         install-size="0"
+         version="${plugin_version}"
+         fragment="true"/>
+
+''')
+
+FEATURE_VARIANT_EXCLUDE_TEMPLATE = Template('''                        <plugin id="${artifact_id}" />
 ''')
 
 BINARY_POM_TEMPLATE = Template('''<?xml version="1.0" encoding="UTF-8"?>
@@ -532,7 +617,7 @@ BINARY_POM_TEMPLATE = Template('''<?xml version="1.0" encoding="UTF-8"?>
 BINARY_MANIFEST_TEMPLATE = Template('''Manifest-Version: 1.0
 Bundle-ManifestVersion: 2
 Bundle-Name: Z3 Linux GTK x86_64 binaries
-Bundle-SymbolicName: com.collins.trustedsystems.z3.${os}.${ws}.${arch};singleton:=true
+Bundle-SymbolicName: ${artifact_id};singleton:=true
 Bundle-Version: ${plugin_version}
 Bundle-Vendor: Collins Aerospace
 Fragment-Host: com.collins.trustedsystems.z3;bundle-version="${plugin_version}"
@@ -541,6 +626,10 @@ Bundle-RequiredExecutionEnvironment: JavaSE-1.8
 Eclipse-PlatformFilter: (& (osgi.os=${os}) (osgi.ws=${ws}) (osgi.arch=${arch}) )
 ''')
 
+FRAGMENT_BUILD_PROPERTIES = '''bin.includes = META-INF/,\\
+               binaries/
+'''
+
 TARGET_POM_TEMPLATE = Template('''<project xmlns="http://maven.apache.org/POM/4.0.0"
     xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
     xsi:schemaLocation="http://maven.apache.org/POM/4.0.0 http://maven.apache.org/xsd/maven-4.0.0.xsd">
@@ -746,8 +835,12 @@ __updated__ = '2019-03-29'
 
 AUTH_TOKEN = os.environ['GH_TOKEN'] if 'GH_TOKEN' in os.environ.keys() else None
 
+# Persistent state (digests, caches) kept between runs, outside the git work tree
+STATE_DIR = os.environ.get('Z3_FETCHER_STATE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'z3-release-fetcher'))
+
 BASE_PACKAGE = 'com.collins.trustedsystems.z3'
 SOURCE_DIR = BASE_PACKAGE
+TESTS_DIR = '.'.join([BASE_PACKAGE, 'tests'])
 FEATURE_DIR = '.'.join([BASE_PACKAGE, 'feature'])
 LINUX_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'linux.gtk.x86_64'])
 MACOS_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'macosx.cocoa.x86_64'])
@@ -755,6 +848,65 @@ WIN32_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'win32.win32.x86_64'])
 REPO_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'repository'])
 UPDATES_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'updates'])
 TARGET_PACKAGE_DIR = '.'.join([BASE_PACKAGE, 'target'])
+FRAGMENT_DIRS = [LINUX_PACKAGE_DIR, MACOS_PACKAGE_DIR, WIN32_PACKAGE_DIR]
+# Maven reactor modules, in the order of the parent pom
+MAVEN_MODULE_DIRS = [SOURCE_DIR, TESTS_DIR, LINUX_PACKAGE_DIR, MACOS_PACKAGE_DIR, WIN32_PACKAGE_DIR,
+                     FEATURE_DIR, TARGET_PACKAGE_DIR, REPO_PACKAGE_DIR, UPDATES_PACKAGE_DIR]
+# install, so that later partial builds can resolve the modules they skip from the local repository
+MAVEN_COMMAND = ['mvn', 'clean', 'install']
+# SMT-LIB problems the packaged Linux z3 is benchmarked on
+BENCHMARK_DIR = 'benchmarks'
+
+Platform = namedtuple('Platform', ['name', 'package_dir', 'os', 'ws', 'arch', 'libc', 'exe_name'])
+
+# Native fragments; binaries come from the release asset built for the same os, arch and libc
+PLATFORMS = [
+    Platform('linux', LINUX_PACKAGE_DIR, 'linux', 'gtk', 'x86_64', 'glibc', 'z3'),
+    Platform('osx', MACOS_PACKAGE_DIR, 'macosx', 'cocoa', 'x86_64', None, 'z3'),
+    Platform('win32', WIN32_PACKAGE_DIR, 'win32', 'win32', 'x86_64', None, 'z3.exe'),
+]
+
+# Release asset names: z3-<version>[.<commit>]-<arch>-<os>[-<os version>].zip
+ASSET_NAME_PATTERN = re.compile(r'^z3-(\d+(?:\.\d+)*)(?:\.([0-9a-f]{7,40}))?-(x64|x86|arm64)-'
+                                r'(ubuntu|debian|glibc|musl|osx|win)(?:-(\d+(?:\.\d+)*))?\.zip$')
+ASSET_ARCHES = {'x64': 'x86_64', 'x86': 'x86', 'arm64': 'aarch64'}
+ASSET_OSES = {'ubuntu': 'linux', 'debian': 'linux', 'glibc': 'linux', 'musl': 'linux', 'osx': 'macosx', 'win': 'win32'}
+# glibc shipped by the distributions older releases were built on
+DISTRO_GLIBC_VERSIONS = {
+    ('ubuntu', '12.04'): '2.15', ('ubuntu', '12.10'): '2.15', ('ubuntu', '13.04'): '2.17',
+    ('ubuntu', '13.10'): '2.17', ('ubuntu', '14.04'): '2.19', ('ubuntu', '14.10'): '2.19',
+    ('ubuntu', '15.04'): '2.21', ('ubuntu', '15.10'): '2.21', ('ubuntu', '16.04'): '2.23',
+    ('ubuntu', '16.10'): '2.24', ('ubuntu', '17.04'): '2.24', ('ubuntu', '17.10'): '2.26',
+    ('ubuntu', '18.04'): '2.27', ('ubuntu', '18.10'): '2.28', ('ubuntu', '19.04'): '2.29',
+    ('ubuntu', '19.10'): '2.30', ('ubuntu', '20.04'): '2.31', ('ubuntu', '22.04'): '2.35',
+    ('ubuntu', '24.04'): '2.39',
+    ('debian', '7'): '2.13', ('debian', '8'): '2.19', ('debian', '9'): '2.24', ('debian', '10'): '2.28',
+    ('debian', '11'): '2.31', ('debian', '12'): '2.36',
+}
+
+# x86-64 microarchitecture levels locally built variants may target, with the
+# /proc/cpuinfo flags each one adds to the level below
+CPU_LEVELS = ['x86_64_v2', 'x86_64_v3', 'x86_64_v4']
+CPU_LEVEL_FLAGS = {
+    'x86_64_v2': ['cx16', 'lahf_lm', 'popcnt', 'sse4_1', 'sse4_2', 'ssse3'],
+    'x86_64_v3': ['abm', 'avx', 'avx2', 'bmi1', 'bmi2', 'f16c', 'fma', 'movbe', 'xsave'],
+    'x86_64_v4': ['avx512bw', 'avx512cd', 'avx512dq', 'avx512f', 'avx512vl'],
+}
+# MANIFEST.MF headers stating what a Linux variant fragment needs of its host
+VARIANT_HEADER = 'Z3-Variant'
+VARIANT_CPU_HEADER = 'Z3-CPU-Features'
+VARIANT_GLIBC_HEADER = 'Z3-Glibc-Version'
+
+# Digests of the packaged binaries, kept in each fragment next to MANIFEST.MF
+BINARIES_MANIFEST = os.path.join('META-INF', 'binaries.sha256')
+# MANIFEST.MF header Z3Plugin checks extracted binaries against
+BINARIES_DIGEST_HEADER = 'Z3-Binaries-Digest'
+
+# Bump when the dependency resolvers change which files they select
+RESOLVER_VERSION = 1
+
+# Deltas are only published if they are at most this fraction of the full jar
+DELTA_MAX_RATIO = 0.9
 
 DEBUG = 1
 
@@ -769,6 +921,15 @@ Z3_PLUGIN_OWNER = 'smaccm'
 Z3_PLUGIN_REPO = 'z3-plugin-test'
 Z3_PLUGIN_REQUEST = '/'.join([GITHUB_API, Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO, GITHUB_RELEASES])
 
+# Policies choosing between several assets built for the same platform
+ASSET_POLICIES = ['oldest', 'newest']
+
+# Orders in which pending plugin versions are built
+SCHEDULE_POLICIES = ['newest', 'oldest']
+
+# Stages of packaging and releasing a plugin version, in order; each records a checkpoint when done
+CHECKPOINT_STAGES = ['render', 'download', 'extract', 'resolve', 'copy', 'benchmark', 'build', 'commit', 'tag', 'push', 'release', 'upload']
+
 class CLIError(Exception):
     '''Generic exception to raise and log different fatal errors.'''
     def __init__(self, msg):
@@ -779,274 +940,1902 @@ class CLIError(Exception):
     def __unicode__(self):
         return self.msg
 
-def package_plugin(plugin_version, z3_version, z3_releases):
-    '''Package a plugin from the exectuables for the corresponding release'''
+METRIC_HELP = {
+    'z3_fetcher_stage_duration_seconds': 'Duration of packaging stages',
+    'z3_fetcher_stage_failures_total': 'Packaging stages that failed',
+    'z3_fetcher_stage_peak_rss_bytes': 'Peak resident memory of the fetcher while a stage ran',
+    'z3_fetcher_stage_scratch_bytes': 'Peak size of the scratch directory while a stage ran',
+    'z3_fetcher_downloaded_bytes_total': 'Bytes of release assets transferred',
+    'z3_fetcher_asset_fetches_total': 'Release assets fetched, by source',
+    'z3_fetcher_dependency_scans_total': 'Binaries inspected by the dependency resolvers',
+    'z3_fetcher_closure_files': 'Files in the packaged dependency closure',
+    'z3_fetcher_closure_bytes': 'Bytes of the packaged dependency closure',
+    'z3_fetcher_artifact_bytes': 'Size of the built bundle and feature jars',
+    'z3_fetcher_maven_modules_selected': 'Maven modules selected for the last reactor build',
+    'z3_fetcher_benchmark_seconds': 'Wall time of the packaged z3 on each benchmark problem',
+    'z3_fetcher_benchmark_peak_rss_bytes': 'Peak resident memory of the packaged z3 on each benchmark problem',
+    'z3_fetcher_benchmark_results_total': 'Benchmark problems solved, by result',
+    'z3_fetcher_cache_requests_total': 'Build cache lookups, by stage and result',
+    'z3_fetcher_uploaded_bytes_total': 'Bytes uploaded as release assets',
+    'z3_fetcher_upload_bytes_per_second': 'Throughput of the last release asset upload',
+    'z3_fetcher_last_run_timestamp_seconds': 'Time the last run finished',
+    'z3_fetcher_last_run_success': 'Whether the last run succeeded',
+}
+
+class Metrics(object):
+    '''Counters, gauges and histograms exported in the Prometheus text format'''
+    BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 1800.0)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.types = {}
+        self.values = {}
+        # Callables receiving every sample as (name, kind, value, labels)
+        self.recorders = []
+        # Context managers entered around every timed stage, called as tracker(stage, **labels)
+        self.trackers = []
+
+    def _key(self, name, kind, labels):
+        self.types.setdefault(name, kind)
+        return name, tuple(sorted(labels.items()))
+
+    def _record(self, name, kind, value, labels):
+        for recorder in self.recorders:
+            recorder(name, kind, value, labels)
+
+    def inc(self, name, value=1, **labels):
+        with self.lock:
+            key = self._key(name, 'counter', labels)
+            self.values[key] = self.values.get(key, 0) + value
+        self._record(name, 'counter', value, labels)
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[self._key(name, 'gauge', labels)] = value
+        self._record(name, 'gauge', value, labels)
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, 'histogram', labels)
+            buckets, total, count = self.values.get(key, ([0] * len(self.BUCKETS), 0.0, 0))
+            buckets = [b + (1 if value <= le else 0) for b, le in zip(buckets, self.BUCKETS)]
+            self.values[key] = (buckets, total + value, count + 1)
+        self._record(name, 'histogram', value, labels)
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        '''Record the duration of a stage, and its failure if it raises or exits'''
+        start = time.monotonic()
+        try:
+            with ExitStack() as stack:
+                for tracker in self.trackers:
+                    stack.enter_context(tracker(stage, **labels))
+                yield
+        except BaseException:
+            self.inc('z3_fetcher_stage_failures_total', stage=stage, **labels)
+            raise
+        finally:
+            self.observe('z3_fetcher_stage_duration_seconds', time.monotonic() - start, stage=stage, **labels)
+
+    def render(self):
+        def format_labels(labels):
+            if not labels:
+                return ''
+            return '{%s}' % (','.join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in labels))
+        lines = []
+        with self.lock:
+            for name in sorted(self.types):
+                kind = self.types[name]
+                lines.append('# HELP %s %s' % (name, METRIC_HELP.get(name, name)))
+                lines.append('# TYPE %s %s' % (name, kind))
+                for (key_name, labels), value in sorted(self.values.items(), key=lambda i: (i[0][0], str(i[0][1]))):
+                    if key_name != name:
+                        continue
+                    if kind != 'histogram':
+                        lines.append('%s%s %s' % (name, format_labels(labels), value))
+                        continue
+                    buckets, total, count = value
+                    for le, bucket in zip(self.BUCKETS, buckets):
+                        lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', le),)), bucket))
+                    lines.append('%s_bucket%s %d' % (name, format_labels(labels + (('le', '+Inf'),)), count))
+                    lines.append('%s_sum%s %s' % (name, format_labels(labels), total))
+                    lines.append('%s_count%s %d' % (name, format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, filename):
+        '''Write the metrics for the node exporter textfile collector'''
+        with open(filename + '.part', 'w') as text_file:
+            text_file.write(self.render())
+        os.replace(filename + '.part', filename)
+
+METRICS = Metrics()
+
+# Metrics kept in the run history, one value per run, plugin version and label set
+HISTORY_METRICS = [
+    'z3_fetcher_stage_duration_seconds',
+    'z3_fetcher_stage_peak_rss_bytes',
+    'z3_fetcher_stage_scratch_bytes',
+    'z3_fetcher_downloaded_bytes_total',
+    'z3_fetcher_closure_files',
+    'z3_fetcher_closure_bytes',
+    'z3_fetcher_artifact_bytes',
+    'z3_fetcher_benchmark_seconds',
+    'z3_fetcher_benchmark_peak_rss_bytes',
+]
+
+class RunHistory(object):
+    '''SQLite history of the metrics of every run, for spotting trends and regressions.
+
+    Samples are collected in memory while the run goes on, attributed to the
+    plugin version the recording thread is packaging, and written in one
+    transaction by flush().  Durations and byte counts are summed per run,
+    version and labels; gauges keep their last value.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, finished REAL, success INTEGER);
+        CREATE TABLE IF NOT EXISTS samples (
+            run_id INTEGER REFERENCES runs(id), plugin_version TEXT, metric TEXT,
+            stage TEXT, platform TEXT, labels TEXT, value REAL);
+        CREATE INDEX IF NOT EXISTS samples_series ON samples (metric, stage, platform, labels);
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+        self.samples = {}
+
+    def set_version(self, plugin_version):
+        '''Attribute the samples recorded by this thread to a plugin version'''
+        self.local.version = plugin_version
+
+    def __call__(self, name, kind, value, labels):
+        if name not in HISTORY_METRICS:
+            return
+        labels = dict(labels)
+        key = (getattr(self.local, 'version', None), name, labels.pop('stage', None), labels.pop('platform', None),
+               json.dumps(labels, sort_keys=True))
+        with self.lock:
+            self.samples[key] = value if kind == 'gauge' else self.samples.get(key, 0) + value
+
+    def connect(self):
+        dirname = os.path.dirname(self.filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        connection = sqlite3.connect(self.filename)
+        connection.executescript(self.SCHEMA)
+        return connection
+
+    def flush(self, success):
+        '''Store the samples collected since the last flush as one run'''
+        with self.lock:
+            samples, self.samples = self.samples, {}
+            started, self.started = self.started, time.time()
+        if not samples:
+            return
+        connection = self.connect()
+        try:
+            with connection:
+                run_id = connection.execute('INSERT INTO runs (started, finished, success) VALUES (?, ?, ?)',
+                                            (started, time.time(), 1 if success else 0)).lastrowid
+                connection.executemany('INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                       [(run_id,) + key + (value,) for key, value in samples.items()])
+        finally:
+            connection.close()
+
+    def series(self):
+        '''Values of each metric, label set and plugin version in run order, as {key: [(run started, value)]}'''
+        connection = self.connect()
+        try:
+            rows = connection.execute('''SELECT s.metric, s.stage, s.platform, s.labels, r.started, s.plugin_version, s.value
+                                          FROM samples s JOIN runs r ON s.run_id = r.id
+                                          WHERE r.success = 1 ORDER BY r.started, s.rowid''').fetchall()
+        finally:
+            connection.close()
+        series = {}
+        for metric, stage, platform, labels, started, version, value in rows:
+            series.setdefault((metric, stage, platform, labels, version), []).append((started, value))
+        return series
+
+RUN_HISTORY = RunHistory(os.path.join(STATE_DIR, 'history.sqlite'))
+METRICS.recorders.append(RUN_HISTORY)
+
+def report_history(history, baseline_runs, threshold):
+    '''Print the trend of each recorded series and flag the latest values that regressed.
+
+    A value regresses when it exceeds the mean of the baseline_runs values
+    before it by more than threshold (a fraction).  Only runs of the same
+    plugin version, stage, platform and labels are compared, as versions
+    differ in size and in the platforms packaged.  Returns the regressions.
+    '''
+    regressions = []
+    print('%-36s %-10s %-8s %-8s %7s %12s %12s %8s' % ('metric', 'stage', 'platform', 'version', 'samples', 'baseline', 'latest', 'change'))
+    for (metric, stage, platform, labels, version), points in sorted(history.series().items(), key=lambda i: tuple(str(k) for k in i[0])):
+        values = [value for _, value in points]
+        baseline = values[-baseline_runs - 1:-1]
+        extra_labels = json.loads(labels)
+        name = metric.replace('z3_fetcher_', '')
+        if extra_labels:
+            name += '{%s}' % (','.join('%s=%s' % (k, extra_labels[k]) for k in sorted(extra_labels)))
+        if not baseline:
+            print('%-36s %-10s %-8s %-8s %7d %12s %12.6g %8s' % (name, stage or '-', platform or '-', version or '-', len(values), '-', values[-1], '-'))
+            continue
+        mean = sum(baseline) / len(baseline)
+        change = (values[-1] - mean) / mean if mean else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append((metric, stage, platform, version, mean, values[-1]))
+        print('%-36s %-10s %-8s %-8s %7d %12.6g %12.6g %+7.1f%%%s' % (name, stage or '-', platform or '-', version or '-', len(values), mean, values[-1], change * 100, flag))
+    for metric, stage, platform, version, mean, value in regressions:
+        print('Regression: %s%s%s%s is %.6g against a baseline of %.6g.' % (
+            metric, ' stage ' + stage if stage else '', ' on ' + platform if platform else '',
+            ' for plugin version ' + version if version else '', value, mean))
+    return regressions
+
+# Request priorities, lower values are served first
+PRIORITY_FINISH = 0       # release creation and asset upload
+PRIORITY_DISCOVERY = 1    # release listing
+
+class GitHubScheduler(object):
+    '''Pace GitHub API requests according to the advertised rate limit.
+
+    Every request takes a token from a bucket that refills at the rate which
+    spreads the remaining quota (X-RateLimit-Remaining) evenly until the
+    window resets (X-RateLimit-Reset).  A small reserve of the quota is kept
+    for finishing calls so a run is not cut off between building a version
+    and releasing it.  Responses signalling a secondary rate limit are
+    retried after Retry-After or an exponential backoff.
+    '''
+    def __init__(self, burst=10, reserve=10, max_retries=5, backoff=60.0):
+        self.burst = burst
+        self.reserve = reserve
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.tokens = float(burst)
+        self.rate = float(burst)
+        self.last_refill = time.monotonic()
+        self.remaining = None
+        self.reset_at = None
+        self.blocked_until = 0.0
+        self.condition = threading.Condition()
+        self.waiters = []
+        self.counter = itertools.count()
+        self.local = threading.local()
+
+    @contextmanager
+    def priority(self, priority):
+        '''Run the requests made by the current thread at the given priority'''
+        previous = getattr(self.local, 'priority', PRIORITY_DISCOVERY)
+        self.local.priority = priority
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def _refill(self, now):
+        self.tokens = min(float(self.burst), self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def _delay(self, priority, now):
+        '''Seconds until a request of this priority may be sent, 0 if now'''
+        delay = self.blocked_until - now
+        if (self.remaining is not None and self.reset_at
+                and self.remaining <= (0 if priority == PRIORITY_FINISH else self.reserve)):
+            delay = max(delay, self.reset_at - time.time())
+        if self.tokens < 1.0:
+            delay = max(delay, (1.0 - self.tokens) / self.rate)
+        return max(delay, 0.0)
+
+    def acquire(self):
+        '''Block until the calling thread may send its next request'''
+        priority = getattr(self.local, 'priority', PRIORITY_DISCOVERY)
+        ticket = (priority, next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    delay = self._delay(priority, now)
+                    if self.waiters[0] == ticket and delay == 0.0:
+                        self.tokens -= 1.0
+                        if self.remaining is not None:
+                            self.remaining -= 1
+                        return
+                    self.condition.wait(min(delay, 60.0) if self.waiters[0] == ticket else 1.0)
+            finally:
+                self.waiters.remove(ticket)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def observe(self, response, attempt):
+        '''Track rate limit headers; return a retry delay or None if done'''
+        headers = response.headers
+        with self.condition:
+            if 'X-RateLimit-Remaining' in headers and 'X-RateLimit-Reset' in headers:
+                self.remaining = int(headers['X-RateLimit-Remaining'])
+                self.reset_at = int(headers['X-RateLimit-Reset'])
+                window = max(self.reset_at - time.time(), 1.0)
+                self.rate = max(self.remaining - self.reserve, 1) / window
+            retry = None
+            if response.status_code in (403, 429):
+                if 'Retry-After' in headers:
+                    retry = float(headers['Retry-After'])
+                elif self.remaining == 0 and self.reset_at:
+                    retry = max(self.reset_at - time.time(), 1.0)
+                elif 'rate limit' in response.text.lower():
+                    retry = self.backoff * (2 ** attempt)
+            if retry is None or attempt >= self.max_retries:
+                return None
+            sys.stderr.write('GitHub rate limit hit, backing off %.1f seconds\n' % (retry))
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry)
+            self.condition.notify_all()
+            return retry
+
+    def install(self, session):
+        '''Route every request of a requests session through this scheduler'''
+        send = session.request
+        def request(method, url, *args, **kwargs):
+            attempt = 0
+            while True:
+                self.acquire()
+                response = send(method, url, *args, **kwargs)
+                if self.observe(response, attempt) is None:
+                    return response
+                attempt += 1
+                data = kwargs.get('data')
+                if hasattr(data, 'seek'):
+                    data.seek(0)
+        session.request = request
+        return session
+
+GITHUB_SCHEDULER = GitHubScheduler()
+
+def connect_github():
+    '''Create a GitHub client whose requests share the rate limit scheduler'''
+    gh = GitHub(GITHUB_API, token=AUTH_TOKEN)
+    GITHUB_SCHEDULER.install(gh.session)
+    return gh
+
+class MirrorAsset(object):
+    '''Release asset stored in a local mirror, usable in place of a github3 Asset.
+
+    A local asset was built on this host rather than published, so it is
+    not checked against, or recorded in, the digests of release assets.
+    '''
+    def __init__(self, path, description, local=False):
+        self.path = path
+        self.name = description['name']
+        self.size = description.get('size')
+        self.description = description
+        self.local = local
+
+    def as_dict(self):
+        return self.description
+
+    def download(self, path=''):
+        path = path or self.name
+        with open(self.path, 'rb') as source:
+            if hasattr(path, 'write'):
+                copyfileobj(source, path)
+                return getattr(path, 'name', None)
+            with open(path, 'wb') as target:
+                copyfileobj(source, target)
+        return path
+
+class MirrorRelease(object):
+    '''Release stored in a local mirror, usable in place of a github3 Release'''
+    def __init__(self, assets_dir, description):
+        self.assets_dir = assets_dir
+        self.tag_name = description['tag_name']
+        self.description = description
+
+    def as_dict(self):
+        return self.description
+
+    def assets(self):
+        for description in self.description.get('assets', []):
+            path = os.path.join(self.assets_dir, self.tag_name, description['name'])
+            if os.path.exists(path):
+                yield MirrorAsset(path, description)
+
+class ReleaseMirror(object):
+    '''Local copy of GitHub release metadata and assets.
+
+    The mirror is a directory (or file:// URL) laid out as
+    <owner>/<repo>/releases.json and <owner>/<repo>/assets/<tag>/<asset name>.
+    '''
+    def __init__(self, location):
+        url = urlparse(location)
+        self.root = url2pathname(url.path) if url.scheme == 'file' else location
+
+    def repo_dir(self, owner, repo):
+        return os.path.join(self.root, owner, repo)
+
+    def releases(self, owner, repo):
+        repo_dir = self.repo_dir(owner, repo)
+        filename = os.path.join(repo_dir, 'releases.json')
+        if not os.path.exists(filename):
+            raise CLIError('mirror %s has no releases for %s/%s, run --sync-mirror first' % (self.root, owner, repo))
+        with open(filename) as json_file:
+            descriptions = json.load(json_file)
+        return [MirrorRelease(os.path.join(repo_dir, 'assets'), d) for d in descriptions]
+
+    def sync(self, gh, owner, repo, tag_filter=None, asset_filter=None):
+        '''Fetch release metadata and the assets not yet mirrored'''
+        repo_dir = self.repo_dir(owner, repo)
+        if not os.path.exists(repo_dir):
+            os.makedirs(repo_dir)
+        print('Syncing mirror of %s/%s ...' % (owner, repo))
+        releases = [r for r in gh.repository(owner, repo).releases()]
+        for release in releases:
+            if asset_filter is None or (tag_filter and not tag_filter(release.tag_name)):
+                continue
+            for asset in release.assets():
+                if not asset_filter(asset.name):
+                    continue
+                asset_dir = os.path.join(repo_dir, 'assets', release.tag_name)
+                path = os.path.join(asset_dir, asset.name)
+                if os.path.exists(path) and os.path.getsize(path) == asset.size:
+                    continue
+                if not os.path.exists(asset_dir):
+                    os.makedirs(asset_dir)
+                print('  Downloading %s ...' % (asset.name))
+                download_asset(asset, path + '.part')
+                os.replace(path + '.part', path)
+        filename = os.path.join(repo_dir, 'releases.json')
+        with open(filename + '.part', 'w') as json_file:
+            json.dump([r.as_dict() for r in releases], json_file, indent=1)
+        os.replace(filename + '.part', filename)
+        print('  Mirrored %d releases.' % (len(releases)))
+
+class HashingWriter(object):
+    '''File wrapper computing the SHA-256 digest and size of the data written'''
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.name = fileobj.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+class DigestStore(object):
+    '''SHA-256 digests and sizes of downloaded assets, keyed by asset name'''
+    def __init__(self, filename):
+        self.filename = filename
+        self.digests = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.digests is None:
+            self.digests = {}
+            if os.path.exists(self.filename):
+                with open(self.filename) as json_file:
+                    self.digests = json.load(json_file)
+
+    def get(self, name):
+        with self.lock:
+            self._load()
+            return self.digests.get(name)
+
+    def record(self, name, sha256, size):
+        with self.lock:
+            self._load()
+            self.digests[name] = {'sha256': sha256, 'size': size}
+            dirname = os.path.dirname(self.filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            with open(self.filename + '.part', 'w') as json_file:
+                json.dump(self.digests, json_file, indent=1, sort_keys=True)
+            os.replace(self.filename + '.part', self.filename)
+
+DIGEST_STORE = DigestStore(os.path.join(STATE_DIR, 'digests.json'))
+# Digests of the members extracted from each asset, keyed by <asset name>/<member name>
+MEMBER_DIGESTS = DigestStore(os.path.join(STATE_DIR, 'member-digests.json'))
+
+def check_members(asset, binaries_dir, members, verified):
+    '''Check the members extracted from an asset against their recorded digests, recording new ones.
+
+    verified tells whether the members come from a download whose digest
+    was checked.  A range fetch cannot check the digest of the whole
+    asset, so if the release publishes one, every member fetched must
+    match a digest recorded from a verified download; IOError is raised
+    for a member that has none.
+    '''
+    published = (asset.as_dict().get('digest') or '').startswith('sha256:')
+    for member in members:
+        path = os.path.join(binaries_dir, member)
+        digest, size = file_sha256(path), os.path.getsize(path)
+        key = '%s/%s' % (asset.name, member)
+        recorded = MEMBER_DIGESTS.get(key)
+        if recorded and (recorded['sha256'] != digest or recorded['size'] != size):
+            raise CLIError('%s of %s has sha256 %s, previously recorded %s' % (member, asset.name, digest, recorded['sha256']))
+        if not recorded:
+            if not verified and published:
+                raise IOError('no verified digest of %s in %s' % (member, asset.name))
+            MEMBER_DIGESTS.record(key, digest, size)
+
+def download_url(url, writer, chunk_size=1024 * 1024):
+    '''Stream a URL into a writer; return the URL, or None if the request failed'''
+    response = requests.get(url, stream=True)
+    try:
+        if response.status_code != 200:
+            return None
+        for chunk in response.iter_content(chunk_size):
+            writer.write(chunk)
+    finally:
+        response.close()
+    return url
+
+def download_asset(asset, path):
+    '''Download an asset, hashing it while it streams to disk.
+
+    The digest is checked against the digest GitHub publishes for the asset
+    and the one recorded by an earlier download, then recorded.  Returns the
+    hex SHA-256 digest.
+    '''
+    url = getattr(asset, 'browser_download_url', None)
+    with open(path, 'wb') as asset_file:
+        writer = HashingWriter(asset_file)
+        if url:
+            # Browser download URLs are not API calls, so they bypass the rate limit scheduler
+            result = download_url(url, writer)
+        else:
+            result = asset.download(writer)
+    digest = writer.hexdigest()
+    published = asset.as_dict().get('digest') or ''
+    algorithm, _, published_digest = published.partition(':')
+    local = getattr(asset, 'local', False)
+    recorded = None if local else DIGEST_STORE.get(asset.name)
+    problem = None
+    if result is None:
+        problem = 'download of %s failed' % (asset.name)
+    elif algorithm == 'sha256' and published_digest != digest:
+        problem = '%s has sha256 %s, release publishes %s' % (asset.name, digest, published_digest)
+    elif recorded and (recorded['sha256'] != digest or recorded['size'] != writer.size):
+        problem = '%s has sha256 %s, previously recorded %s' % (asset.name, digest, recorded['sha256'])
+    if problem:
+        os.remove(path)
+        raise CLIError(problem)
+    if local:
+        source = 'local'
+    else:
+        DIGEST_STORE.record(asset.name, digest, writer.size)
+        source = 'mirror' if isinstance(asset, MirrorAsset) else 'github'
+    METRICS.inc('z3_fetcher_downloaded_bytes_total', writer.size, source=source)
+    METRICS.inc('z3_fetcher_asset_fetches_total', source=source)
+    return digest
+
+class HttpRangeFile(io.RawIOBase):
+    '''Seekable read-only view of a remote file fetched with HTTP Range requests.
+
+    Sequential reads double the size of each request (up to max_block_size)
+    so large members are fetched in few round trips, while the scattered
+    reads of the zip directory only fetch small blocks.
+    '''
+    def __init__(self, url, session=None, block_size=64 * 1024, max_block_size=16 * 1024 * 1024):
+        super(HttpRangeFile, self).__init__()
+        self.session = session or requests.Session()
+        self.block_size = block_size
+        self.max_block_size = max_block_size
+        self.fetch_size = block_size
+        self.asset_url = url
+        self.size = self._resolve()
+        self.position = 0
+        self.buffer = b''
+        self.buffer_start = 0
+        self.bytes_fetched = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(base + offset, 0)
+        return self.position
+
+    def _resolve(self):
+        '''Follow the asset URL to its current download location; return the file size'''
+        response = self.session.get(self.asset_url, headers={'Range': 'bytes=0-0'}, stream=True)
+        response.close()
+        if response.status_code != 206 or 'Content-Range' not in response.headers:
+            raise IOError('%s does not support range requests' % (self.asset_url))
+        # Keep the redirect target so later requests skip the redirect
+        self.url = response.url
+        return int(response.headers['Content-Range'].rpartition('/')[2])
+
+    def _fetch(self, start, end):
+        response = self.session.get(self.url, headers={'Range': 'bytes=%d-%d' % (start, end)})
+        if response.status_code == 403 and self.url != self.asset_url:
+            # The presigned redirect target has expired; ask for a fresh one
+            self._resolve()
+            response = self.session.get(self.url, headers={'Range': 'bytes=%d-%d' % (start, end)})
+        if response.status_code != 206:
+            raise IOError('range request for %s failed with status %d' % (self.url, response.status_code))
+        self.buffer = response.content
+        self.buffer_start = start
+        self.bytes_fetched += len(self.buffer)
+
+    def readinto(self, b):
+        if self.position >= self.size:
+            return 0
+        offset = self.position - self.buffer_start
+        if not 0 <= offset < len(self.buffer):
+            if self.position == self.buffer_start + len(self.buffer):
+                self.fetch_size = min(self.fetch_size * 2, self.max_block_size)
+            else:
+                self.fetch_size = self.block_size
+            end = min(self.position + max(len(b), self.fetch_size), self.size)
+            self._fetch(self.position, end - 1)
+            offset = 0
+        count = min(len(b), len(self.buffer) - offset)
+        b[:count] = self.buffer[offset:offset + count]
+        self.position += count
+        return count
+
+class ResourceBudget(object):
+    '''Memory and scratch-disk budget of the streaming mode, and the peak use of every stage.
+
+    In streaming mode a downloaded release zip is not unpacked whole: only
+    the closure of the executable is extracted, member by member in chunks
+    sized from the memory budget, and binaries are hashed with reads of that
+    size instead of memory maps.  Each platform holds an estimate of the
+    scratch space it needs until its scratch directory is removed, and
+    waits while other versions hold the rest of the scratch budget.
+
+    In streaming mode every timed stage also records the peak RSS of the
+    fetcher and the peak size of the scratch directory while it ran,
+    sampled every SAMPLE_INTERVAL seconds.
+    '''
+    SAMPLE_INTERVAL = 0.05
+    # Unpacked closure of a z3 release relative to its zip, for scratch estimates
+    EXPANSION = 3
+
+    def __init__(self, scratch_root):
+        self.scratch_root = scratch_root
+        self.streaming = False
+        self.memory_bytes = None
+        self.scratch_bytes = None
+        self.condition = threading.Condition()
+        self.reserved = 0
+        self.holders = 0
+        self.peaks = []
+        self.sampler = None
+
+    @property
+    def chunk_size(self):
+        '''Bytes read at a time when extracting and hashing, a small fraction of the memory budget'''
+        if not self.memory_bytes:
+            return 1024 * 1024
+        return max(64 * 1024, min(1024 * 1024, self.memory_bytes // 64))
+
+    @property
+    def hash_workers(self):
+        '''Files hashed at once, each holding one chunk'''
+        workers = os.cpu_count() or 1
+        if self.memory_bytes:
+            workers = max(1, min(workers, self.memory_bytes // (8 * self.chunk_size)))
+        return workers
+
+    @staticmethod
+    def read_rss():
+        '''Resident memory of this process in bytes, or 0 where /proc is not available'''
+        try:
+            with open('/proc/self/status') as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (IOError, ValueError):
+            pass
+        return 0
 
-    def get_asset(release_assets_by_name, substr):
-        asset = None
-        filename_iter = filter(lambda n: substr in n, release_assets_by_name.keys())
-        for asset in filename_iter:
+    def scratch_usage(self):
+        '''Bytes of the files under the scratch directory'''
+        total = 0
+        for folder, _, files in os.walk(self.scratch_root):
+            for file in files:
+                try:
+                    total += os.lstat(os.path.join(folder, file)).st_size
+                except OSError:
+                    # Removed while walking
+                    pass
+        return total
+
+    def sample(self):
+        with self.condition:
+            peaks = list(self.peaks)
+        rss, scratch = self.read_rss(), self.scratch_usage()
+        for peak in peaks:
+            peak['rss'] = max(peak['rss'], rss)
+            peak['scratch'] = max(peak['scratch'], scratch)
+
+    def run_sampler(self):
+        while True:
+            self.sample()
+            time.sleep(self.SAMPLE_INTERVAL)
+            with self.condition:
+                if not self.peaks:
+                    self.sampler = None
+                    return
+
+    @contextmanager
+    def track(self, stage, **labels):
+        '''Record the peak RSS and scratch size while a stage runs'''
+        peak = {'rss': self.read_rss(), 'scratch': self.scratch_usage()}
+        with self.condition:
+            self.peaks.append(peak)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self.run_sampler, daemon=True)
+                self.sampler.start()
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.peaks.remove(peak)
+            METRICS.set('z3_fetcher_stage_peak_rss_bytes', peak['rss'], stage=stage, **labels)
+            METRICS.set('z3_fetcher_stage_scratch_bytes', peak['scratch'], stage=stage, **labels)
+            name = ' '.join([stage] + [str(v) for _, v in sorted(labels.items())])
+            print('  Stage %s peaked at %.1f MiB RSS, %.1f MiB scratch.' % (name, peak['rss'] / 1048576.0, peak['scratch'] / 1048576.0))
+            if self.memory_bytes and peak['rss'] > self.memory_bytes:
+                print('  Stage %s exceeded the memory budget of %.1f MiB.' % (name, self.memory_bytes / 1048576.0))
+
+    @contextmanager
+    def scratch(self, nbytes, name):
+        '''Hold nbytes of the scratch budget while the block runs.
+
+        Waits while other holders leave too little of the budget; a single
+        holder needing more than the whole budget proceeds alone.
+        '''
+        if not self.scratch_bytes:
+            yield
+            return
+        with self.condition:
+            if nbytes > self.scratch_bytes:
+                print('  %s needs about %.1f MiB of scratch, more than the budget of %.1f MiB.' % (name, nbytes / 1048576.0, self.scratch_bytes / 1048576.0))
+            waited = False
+            while self.holders and self.reserved + nbytes > self.scratch_bytes:
+                if not waited:
+                    print('  Waiting for scratch space for %s...' % (name))
+                    waited = True
+                self.condition.wait()
+            self.reserved += nbytes
+            self.holders += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.reserved -= nbytes
+                self.holders -= 1
+                self.condition.notify_all()
+
+RESOURCES = ResourceBudget(os.path.join(STATE_DIR, 'scratch'))
+
+def stream_lines(command, check=True):
+    '''Decoded lines of the output of a command, read as it prints them'''
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    with process:
+        for line in process.stdout:
+            yield line.decode('ascii', 'replace')
+    if check and process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+class FileIndex(object):
+    '''Files of a tree, walked only as far as the lookups so far needed.
+
+    One index serves all lookups of a resolver.  Files are found by exact
+    base name, the first in os.walk order winning, or by case-folded path.
+    '''
+    def __init__(self, root):
+        self.paths = []
+        self.by_name = {}
+        self.by_folded_path = {}
+        self.walker = os.walk(root)
+
+    def advance(self):
+        '''Index the files of the next folder; return False once the tree is exhausted'''
+        try:
+            folder, _, files = next(self.walker)
+        except StopIteration:
+            return False
+        for file in files:
+            path = os.path.join(folder, file)
+            self.paths.append(path)
+            self.by_name.setdefault(file, path)
+            self.by_folded_path.setdefault(path.upper(), path)
+        return True
+
+    def find(self, name):
+        while name not in self.by_name and self.advance():
             pass
-        return release_assets_by_name[asset]
+        return self.by_name.get(name)
 
-    def extract_binaries(binaries_dir, asset):
-        print('  Downloading binary package %s ...' % (asset.name))
-        zipfilename = asset.download(os.path.join(binaries_dir, asset.name))
-        print('  Download complete.  Extracting...')
+    def get_folded(self, path):
+        '''The file whose path matches path ignoring case, or None'''
+        while path.upper() not in self.by_folded_path and self.advance():
+            pass
+        return self.by_folded_path.get(path.upper())
+
+    def __iter__(self):
+        position = 0
+        while position < len(self.paths) or self.advance():
+            while position < len(self.paths):
+                yield self.paths[position]
+                position += 1
+
+def extract_member(zipfile, member, target_dir):
+    '''Extract a zip member chunk by chunk; return its path'''
+    path = os.path.normpath(os.path.join(target_dir, member.filename))
+    if not path.startswith(os.path.normpath(target_dir) + os.sep):
+        raise CLIError('%s would be extracted outside %s' % (member.filename, target_dir))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.open(member) as source, open(path, 'wb') as target:
+        copyfileobj(source, target, RESOURCES.chunk_size)
+    return path
+
+def scan_needed_linux(filename):
+    '''Names of the shared libraries a Linux binary needs but cannot find'''
+    pattern = re.compile(r'\s*(\S+)\s+=>\s+not found')
+    return {m.group(1) for m in map(pattern.match, stream_lines(['ldd', filename], check=False)) if m}
+
+def scan_needed_osx(filename):
+    '''Names of the dylibs a Mach-O binary loads'''
+    try:
+        return {os.path.basename(other) for header in MachO(filename).headers for _, _, other in header.walkRelocatables()}
+    except Exception:
+        return set()
+
+def scan_needed_win32(filename):
+    '''Names of the DLLs a PE binary imports'''
+    pattern = re.compile(r'\s*DLL\s+Name:\s*(\S+)')
+    return {m.group(1) for m in map(pattern.search, stream_lines(['objdump', '-p', filename], check=False)) if m}
+
+def extract_closure(zipfile, binaries_dir, exe_name, scan_needed):
+    '''Extract the executable and, transitively, the archive members it needs.
+
+    Member names are matched on their case-folded base name, as the loaders
+    search the directory of the executable.
+    '''
+    members = {os.path.basename(i.filename).upper(): i for i in zipfile.infolist() if not i.filename.endswith('/')}
+    wanted = {exe_name.upper()}
+    extracted = set()
+    while wanted - extracted:
+        for name in wanted - extracted:
+            if name in members:
+                filename = extract_member(zipfile, members[name], binaries_dir)
+                wanted |= {n.upper() for n in scan_needed(filename)}
+            extracted.add(name)
+    return [members[n].filename for n in extracted if n in members]
+
+def extract_remote_closure(url, binaries_dir, exe_name, scan_needed):
+    '''Extract the executable closure of a remote zip, fetching only the needed byte ranges'''
+    remote = HttpRangeFile(url)
+    with ZipFile(remote) as zipfile:
+        members = extract_closure(zipfile, binaries_dir, exe_name, scan_needed)
+    METRICS.inc('z3_fetcher_downloaded_bytes_total', remote.bytes_fetched, source='range')
+    METRICS.inc('z3_fetcher_asset_fetches_total', source='range')
+    print('  Extracted %s, fetched %d of %d bytes.' % (pformat(members), remote.bytes_fetched, remote.size))
+    return members
+
+def file_sha256(filename, chunk_size=1024 * 1024):
+    '''Hex SHA-256 digest of a file, read in 1 MiB chunks'''
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def tree_digests(root):
+    '''Digests of the files under root, by name relative to it'''
+    digests = {}
+    for folder, _, files in os.walk(root):
+        for file in files:
+            fn = os.path.join(folder, file)
+            digests[os.path.relpath(fn, root)] = file_sha256(fn)
+    return digests
+
+def tree_size(root):
+    '''Total size in bytes of the files under root'''
+    return sum(os.path.getsize(os.path.join(folder, file)) for folder, _, files in os.walk(root) for file in files)
+
+def tree_fingerprint(paths, skip_dirs=('target', 'bin'), root='.'):
+    '''SHA-256 over the names (relative to root) and contents of the files under the given paths'''
+    sha256 = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(os.path.join(root, path)):
+            sha256.update(('%s\0%s\n' % (path, file_sha256(os.path.join(root, path)))).encode('utf-8'))
+            continue
+        for folder, dirs, files in os.walk(os.path.join(root, path)):
+            dirs[:] = sorted(d for d in dirs if d not in skip_dirs)
+            for file in sorted(files):
+                fn = os.path.join(folder, file)
+                sha256.update(('%s\0%s\n' % (os.path.relpath(fn, root), file_sha256(fn))).encode('utf-8'))
+    return sha256.hexdigest()
+
+def asset_fingerprint(asset):
+    '''Identify the content of an asset without downloading it.
+
+    Uses the digest GitHub publishes, or else the name, size and upload
+    time, which GitHub changes whenever an asset is replaced.
+    '''
+    description = asset.as_dict()
+    if description.get('digest'):
+        return description['digest']
+    return '%s:%s:%s' % (asset.name, description.get('size'), description.get('updated_at'))
+
+BinaryEntry = namedtuple('BinaryEntry', ['name', 'size', 'sha256', 'source'])
+
+def mmap_sha256(filename):
+    '''Hex SHA-256 digest of a file, hashed from a memory map without copying'''
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha256(mapped).hexdigest()
+
+def hash_binaries(binaries_dir, source):
+    '''Describe the files of a binaries directory, hashing them in parallel'''
+    names = sorted(os.listdir(binaries_dir))
+    paths = [os.path.join(binaries_dir, name) for name in names]
+    if RESOURCES.streaming:
+        # Mapped pages count towards the RSS; read budget-sized chunks instead
+        def digest(path):
+            return file_sha256(path, RESOURCES.chunk_size)
+        workers = RESOURCES.hash_workers
+    else:
+        digest, workers = mmap_sha256, os.cpu_count()
+    # hashlib releases the GIL while hashing, so threads use every core
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(digest, paths))
+    return [BinaryEntry(name, os.path.getsize(path), digest, source) for name, path, digest in zip(names, paths, digests)]
+
+def binaries_digest(entries):
+    '''Digest of a binaries directory as a whole, computed as Z3BinaryCache does'''
+    sha256 = hashlib.sha256()
+    for entry in sorted(entries):
+        sha256.update(('%s\0%s\n' % (entry.name, entry.sha256)).encode('utf-8'))
+    return sha256.hexdigest()
+
+def read_binaries_manifest(package_dir):
+    '''Read the build fingerprint and entries recorded for a fragment's binaries'''
+    filename = os.path.join(package_dir, BINARIES_MANIFEST)
+    if not os.path.exists(filename):
+        return None, []
+    fingerprint, entries = None, []
+    with open(filename) as text_file:
+        for line in text_file:
+            if line.startswith('# fingerprint '):
+                fingerprint = line.split()[2]
+            elif line.strip() and not line.startswith('#'):
+                size, sha256, name, source = line.split()
+                entries.append(BinaryEntry(name, int(size), sha256, source))
+    return fingerprint, entries
+
+def write_binaries_manifest(package_dir, entries, fingerprint):
+    with open(os.path.join(package_dir, BINARIES_MANIFEST), 'w') as text_file:
+        text_file.write('# fingerprint %s\n' % (fingerprint))
+        text_file.write('# size sha256 file source\n')
+        for entry in entries:
+            text_file.write('%d %s %s %s\n' % (entry.size, entry.sha256, entry.name, entry.source))
+
+def manifest_attribute(name, value):
+    '''MANIFEST.MF header line, continued on lines of at most 72 bytes'''
+    line = '%s: %s' % (name, value)
+    lines = [line[:72]]
+    line = line[72:]
+    while line:
+        lines.append(' ' + line[:71])
+        line = line[71:]
+    return '\n'.join(lines) + '\n'
+
+def binaries_manifest_sections(entries):
+    '''Main attribute and per-entry sections describing the packaged binaries'''
+    text = manifest_attribute(BINARIES_DIGEST_HEADER, binaries_digest(entries))
+    for entry in entries:
+        text += '\n' + manifest_attribute('Name', 'binaries/' + entry.name)
+        text += manifest_attribute('Z3-Size', entry.size)
+        text += manifest_attribute('Z3-SHA-256', entry.sha256)
+        text += manifest_attribute('Z3-Source', entry.source)
+    return text
+
+class BuildCache(object):
+    '''Outputs of packaging stages, stored under a fingerprint of the stage inputs.
+
+    Each entry is a directory <stage>/<fingerprint>/<output name>/ that is
+    renamed into place once complete, so concurrent runs never see a
+    partial entry.
+
+    An output can leave out the files it had before the stage ran, given
+    as a map of relative name to digest; the entry then lists it in
+    MERGE_FILE and is copied over the output on restore instead of
+    replacing it.  This keeps the cumulative updates repository from being
+    stored again for every version.
+
+    Once the entries exceed max_bytes the least recently used ones are
+    removed; a restore marks an entry used.
+    '''
+    MERGE_FILE = 'merge.json'
+
+    def __init__(self, root):
+        self.root = root
+        self.enabled = True
+        self.max_bytes = None
+        self.lock = threading.Lock()
+        self.in_use = set()
+
+    @staticmethod
+    def fingerprint(*inputs):
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def restore(self, stage, fingerprint, outputs):
+        '''Replace the output directories with the cached ones; return True on a hit'''
+        entry = os.path.join(self.root, stage, fingerprint)
+        with self.lock:
+            hit = self.enabled and os.path.isdir(entry)
+            if hit:
+                self.in_use.add(entry)
+        METRICS.inc('z3_fetcher_cache_requests_total', stage=stage, result='hit' if hit else 'miss')
+        if not hit:
+            return False
+        try:
+            os.utime(entry)
+            merged = []
+            if os.path.exists(os.path.join(entry, self.MERGE_FILE)):
+                with open(os.path.join(entry, self.MERGE_FILE)) as json_file:
+                    merged = json.load(json_file)
+            for name, path in outputs.items():
+                saved = os.path.join(entry, name)
+                if name in merged:
+                    copy_tree(saved, path)
+                    continue
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+                if os.path.exists(saved):
+                    shutil.copytree(saved, path)
+        finally:
+            with self.lock:
+                self.in_use.discard(entry)
+        return True
+
+    def store(self, stage, fingerprint, outputs, unchanged=None):
+        '''Save the output directories, leaving out the files of unchanged[name] whose digest is the same'''
+        entry = os.path.join(self.root, stage, fingerprint)
+        if not self.enabled or os.path.exists(entry):
+            return
+        unchanged = unchanged or {}
+        stage_dir = os.path.join(self.root, stage)
+        if not os.path.exists(stage_dir):
+            os.makedirs(stage_dir)
+        # Dot-prefixed so that eviction never takes an entry still being written
+        temp_dir = tempfile.mkdtemp(prefix='.', dir=stage_dir)
+        for name, path in outputs.items():
+            if os.path.exists(path):
+                shutil.copytree(path, os.path.join(temp_dir, name), ignore=self.unchanged_files(path, unchanged.get(name, {})))
+        with open(os.path.join(temp_dir, self.MERGE_FILE), 'w') as json_file:
+            json.dump(sorted(name for name in outputs if name in unchanged), json_file)
+        try:
+            os.rename(temp_dir, entry)
+        except OSError:
+            # Another run stored the same entry first
+            shutil.rmtree(temp_dir)
+        self.evict()
+
+    @staticmethod
+    def unchanged_files(root, digests):
+        '''copytree ignore function skipping the files under root that still have their digests'''
+        def ignore(folder, names):
+            rel = os.path.relpath(folder, root)
+            skipped = set()
+            for n in names:
+                digest = digests.get(os.path.normpath(os.path.join(rel, n)))
+                if digest and os.path.isfile(os.path.join(folder, n)) and digest == file_sha256(os.path.join(folder, n)):
+                    skipped.add(n)
+            return skipped
+        return ignore
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache fits in max_bytes'''
+        if not self.max_bytes:
+            return
+        with self.lock:
+            entries = []
+            for stage in os.listdir(self.root):
+                stage_dir = os.path.join(self.root, stage)
+                for name in os.listdir(stage_dir):
+                    entry = os.path.join(stage_dir, name)
+                    if not name.startswith('.') and entry not in self.in_use:
+                        entries.append((os.path.getmtime(entry), tree_size(entry), entry))
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                # Renamed first so that other runs see it gone at once
+                doomed = os.path.join(os.path.dirname(entry), '.evicted-' + os.path.basename(entry))
+                try:
+                    os.rename(entry, doomed)
+                except OSError:
+                    continue
+                shutil.rmtree(doomed, ignore_errors=True)
+                total -= size
+                METRICS.inc('z3_fetcher_cache_evictions_total', stage=os.path.basename(os.path.dirname(entry)))
+            METRICS.set('z3_fetcher_cache_bytes', total)
+
+BUILD_CACHE = BuildCache(os.path.join(STATE_DIR, 'cache'))
+
+class InstalledModules(object):
+    '''Input fingerprints of the modules last installed to the local Maven repository, by plugin version'''
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename) as json_file:
+            return json.load(json_file)
+
+    def get(self, plugin_version):
+        with self.lock:
+            return self._load().get(plugin_version, {})
+
+    def record(self, plugin_version, fingerprints):
+        with self.lock:
+            installed = self._load()
+            installed[plugin_version] = fingerprints
+            dirname = os.path.dirname(self.filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            with open(self.filename + '.part', 'w') as json_file:
+                json.dump(installed, json_file, indent=1, sort_keys=True)
+            os.replace(self.filename + '.part', self.filename)
+
+INSTALLED_MODULES = InstalledModules(os.path.join(STATE_DIR, 'modules.json'))
+
+class Checkpoints(object):
+    '''Packaging stages completed for each plugin version, so a failed run can be resumed.
+
+    Stages done for one platform are recorded as <stage>/<platform>.  Stages
+    whose outputs live in a work tree record it, and only count as done
+    there.  Nothing is skipped unless resume is set; otherwise a version's
+    checkpoints are cleared when its packaging starts.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.resume = False
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        with open(self.filename) as json_file:
+            return json.load(json_file)
+
+    def _save(self, checkpoints):
+        dirname = os.path.dirname(self.filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(self.filename + '.part', 'w') as json_file:
+            json.dump(checkpoints, json_file, indent=1, sort_keys=True)
+        os.replace(self.filename + '.part', self.filename)
+
+    @staticmethod
+    def _name(stage, platform):
+        return '%s/%s' % (stage, platform) if platform else stage
+
+    def start(self, plugin_version, z3_version):
+        '''Begin packaging a version, forgetting its checkpoints unless resuming'''
+        with self.lock:
+            checkpoints = self._load()
+            if not self.resume or plugin_version not in checkpoints:
+                checkpoints[plugin_version] = {'z3_version': z3_version, 'stages': {}}
+                self._save(checkpoints)
+
+    def get(self, plugin_version, stage, platform=None, work_dir=None):
+        '''Data recorded with a stage a resumed run may skip, or None'''
+        if not self.resume:
+            return None
+        with self.lock:
+            data = self._load().get(plugin_version, {}).get('stages', {}).get(self._name(stage, platform))
+        if data is None or (work_dir and data.get('work_dir') != os.path.abspath(work_dir)):
+            return None
+        return data
+
+    def done(self, plugin_version, stage, platform=None, work_dir=None):
+        return self.get(plugin_version, stage, platform, work_dir) is not None
+
+    def record(self, plugin_version, stage, platform=None, work_dir=None, **data):
+        if work_dir:
+            data['work_dir'] = os.path.abspath(work_dir)
+        data['time'] = time.time()
+        with self.lock:
+            checkpoints = self._load()
+            entry = checkpoints.setdefault(plugin_version, {'z3_version': None, 'stages': {}})
+            entry['stages'][self._name(stage, platform)] = data
+            self._save(checkpoints)
+
+    def last_stage(self, plugin_version):
+        '''The latest of CHECKPOINT_STAGES a resumed run finds done, or None'''
+        if not self.resume:
+            return None
+        with self.lock:
+            stages = {name.split('/')[0] for name in self._load().get(plugin_version, {}).get('stages', {})}
+        return next((stage for stage in reversed(CHECKPOINT_STAGES) if stage in stages), None)
+
+    def unfinished(self):
+        '''Z3 versions of the plugin versions released without their asset being uploaded'''
+        with self.lock:
+            return {ver: entry['z3_version'] for ver, entry in self._load().items()
+                    if entry['z3_version'] and 'release' in entry['stages'] and 'upload' not in entry['stages']}
+
+CHECKPOINTS = Checkpoints(os.path.join(STATE_DIR, 'checkpoints.json'))
+
+def module_fingerprints(work_dir, modules=MAVEN_MODULE_DIRS):
+    '''Fingerprint of each Maven module's inputs: its own files and the parent pom'''
+    parent = tree_fingerprint(['pom.xml'], root=work_dir)
+    return {d: BuildCache.fingerprint(MAVEN_COMMAND, parent, tree_fingerprint([d], root=work_dir)) for d in modules}
+
+def changed_modules(plugin_version, fingerprints, work_dir):
+    '''Modules to rebuild: changed since last installed, or without outputs in this tree'''
+    installed = INSTALLED_MODULES.get(plugin_version)
+    return [d for d in fingerprints
+            if installed.get(d) != fingerprints[d] or not os.path.isdir(os.path.join(work_dir, d, 'target'))]
+
+AssetRecord = namedtuple('AssetRecord', ['name', 'version', 'commit', 'os', 'arch', 'libc', 'libc_version',
+                                         'distro', 'distro_version', 'asset'])
+
+def parse_version(text):
+    '''Dotted version string as a tuple of ints, for ordering'''
+    return tuple(int(x) for x in text.split('.')) if text else ()
+
+def parse_asset_name(name, asset=None):
+    '''Describe a z3 release asset by its name, or None if it is not a binary package'''
+    match = ASSET_NAME_PATTERN.match(name)
+    if not match:
+        return None
+    version, commit, arch, distro, distro_version = match.groups()
+    os_name = ASSET_OSES[distro]
+    libc, libc_version = None, None
+    if distro in ('glibc', 'musl'):
+        libc, libc_version = distro, distro_version
+        distro, distro_version = None, None
+    elif os_name == 'linux':
+        libc = 'glibc'
+        major = distro_version.split('.')[0] if distro == 'debian' and distro_version else distro_version
+        libc_version = DISTRO_GLIBC_VERSIONS.get((distro, major))
+    return AssetRecord(name, version, commit, os_name, ASSET_ARCHES[arch], libc, libc_version,
+                       distro, distro_version, asset)
+
+def is_unmapped_glibc(record):
+    '''Whether a Linux build names a distro release whose glibc version is not known'''
+    return record.libc == 'glibc' and not record.libc_version
+
+class AssetCatalog(object):
+    '''Binary packages of a release, indexed by the platform they were built for.
+
+    Asset names are parsed once into AssetRecords; candidates for a
+    platform are looked up by (os, arch, libc) and one is chosen by policy:
+    'oldest' takes the build for the oldest glibc (or OS version), which
+    runs on the most systems, 'newest' the most recent one.  Builds for the
+    same glibc go to the Ubuntu one, as packaged before assets were
+    catalogued, then by name.  Linux builds for a distro release missing
+    from DISTRO_GLIBC_VERSIONS are left out, as their glibc is unknown.
+    '''
+    def __init__(self, assets):
+        self.records = {}
+        for asset in assets:
+            record = parse_asset_name(asset.name, asset)
+            if record and not is_unmapped_glibc(record):
+                self.records.setdefault((record.os, record.arch, record.libc), []).append(record)
+
+    def candidates(self, platform):
+        return self.records.get((platform.os, platform.arch, platform.libc), [])
+
+    def select(self, platform, policy='oldest'):
+        candidates = self.candidates(platform)
+        if not candidates:
+            raise CLIError('release has no %s %s binaries%s' % (platform.os, platform.arch,
+                           ' for ' + platform.libc if platform.libc else ''))
+        def compatibility(record):
+            return parse_version(record.libc_version or record.distro_version)
+        if policy == 'oldest':
+            chosen = min(compatibility(r) for r in candidates)
+        elif policy == 'newest':
+            chosen = max(compatibility(r) for r in candidates)
+        else:
+            raise CLIError('unknown asset selection policy %s' % (policy))
+        return min((r for r in candidates if compatibility(r) == chosen), key=self.preference)
+
+    @staticmethod
+    def preference(record):
+        '''Sort key choosing among builds for the same glibc or OS version'''
+        return (record.distro != 'ubuntu', record.name)
+
+def is_packaged_asset(name):
+    '''Whether an asset holds binaries for one of the native fragments'''
+    record = parse_asset_name(name)
+    return bool(record) and any((p.os, p.arch, p.libc) == (record.os, record.arch, record.libc) for p in PLATFORMS)
+
+Variant = namedtuple('Variant', ['name', 'package_dir', 'cpu_level', 'glibc', 'record'])
+
+class LinuxVariants(object):
+    '''Extra Linux x86_64 fragments, each holding a z3 that needs more of its host than the generic one.
+
+    Variants come from release assets built for a newer glibc than the one
+    packaged generically, if release_assets is set, and from locally built
+    release zips in <local_dir>/<CPU level>/.  Each variant fragment states
+    the CPU flags and glibc it needs in its manifest, for Z3Plugin to pick
+    the most specific one the host can run.
+
+    Variants share the os/ws/arch filter of the generic Linux fragment, as
+    p2 cannot filter on CPU flags or glibc, so every Linux install of the
+    feature downloads all of them.  Packaging variants is opt-in for that
+    reason; with a few variants the larger install was accepted in
+    exchange for the runtime choice.
+    '''
+    def __init__(self):
+        self.release_assets = False
+        self.local_dir = None
+
+    def local_records(self, z3_version):
+        '''Locally built Linux x86_64 glibc packages of a Z3 version, by CPU level'''
+        records = {}
+        for level in CPU_LEVELS:
+            level_dir = os.path.join(self.local_dir, level) if self.local_dir else None
+            if not level_dir or not os.path.isdir(level_dir):
+                continue
+            for name in sorted(os.listdir(level_dir)):
+                path = os.path.join(level_dir, name)
+                description = {'name': name, 'size': os.path.getsize(path), 'updated_at': os.path.getmtime(path)}
+                record = parse_asset_name(name, MirrorAsset(path, description, local=True))
+                if (record and 'z3-' + record.version == z3_version and not is_unmapped_glibc(record)
+                        and (record.os, record.arch, record.libc) == ('linux', 'x86_64', 'glibc')):
+                    records.setdefault(level, []).append(record)
+        return records
+
+    def variants(self, catalog, generic, z3_version):
+        '''Variants to package next to the generic Linux fragment built from the generic record'''
+        generic_glibc = parse_version(generic.libc_version)
+        def glibc(record):
+            # Only a glibc newer than the generic fragment's restricts where a variant runs
+            return record.libc_version if parse_version(record.libc_version) > generic_glibc else None
+        variants = []
+        if self.release_assets:
+            linux = next(p for p in PLATFORMS if p.name == 'linux')
+            # One variant per glibc version, as several distros may ship the same one
+            by_glibc = {}
+            for record in catalog.candidates(linux):
+                if glibc(record):
+                    by_glibc.setdefault(record.libc_version, []).append(record)
+            for libc_version in sorted(by_glibc, key=parse_version):
+                record = min(by_glibc[libc_version], key=AssetCatalog.preference)
+                name = 'glibc' + libc_version.replace('.', '_')
+                variants.append(Variant(name, '.'.join([LINUX_PACKAGE_DIR, name]), None, libc_version, record))
+        for level, records in sorted(self.local_records(z3_version).items()):
+            # The oldest glibc build of a level runs on the most hosts
+            record = min(records, key=lambda r: (parse_version(r.libc_version), AssetCatalog.preference(r)))
+            variants.append(Variant(level, '.'.join([LINUX_PACKAGE_DIR, level]), level, glibc(record), record))
+        return variants
+
+    @staticmethod
+    def headers(variant):
+        '''MANIFEST.MF main headers describing what the variant needs of its host'''
+        flags = [f for level in CPU_LEVELS[:CPU_LEVELS.index(variant.cpu_level) + 1] for f in CPU_LEVEL_FLAGS[level]] if variant.cpu_level else []
+        headers = manifest_attribute(VARIANT_HEADER, variant.name)
+        if flags:
+            headers += manifest_attribute(VARIANT_CPU_HEADER, ' '.join(flags))
+        if variant.glibc:
+            headers += manifest_attribute(VARIANT_GLIBC_HEADER, variant.glibc)
+        return headers
+
+LINUX_VARIANTS = LinuxVariants()
+
+def variant_package_dirs(work_dir='.'):
+    '''Package directories of the Linux variant fragments generated in a work tree'''
+    prefix = LINUX_PACKAGE_DIR + '.'
+    return sorted(d for d in os.listdir(work_dir) if d.startswith(prefix) and os.path.isdir(os.path.join(work_dir, d)))
+
+def maven_module_dirs(work_dir='.'):
+    '''Maven reactor modules of a work tree, with its variant fragments after the generic fragments'''
+    index = MAVEN_MODULE_DIRS.index(WIN32_PACKAGE_DIR) + 1
+    return MAVEN_MODULE_DIRS[:index] + variant_package_dirs(work_dir) + MAVEN_MODULE_DIRS[index:]
+
+def filter_versions(versions, inpattern, expattern):
+    '''Apply the include and exclude patterns, exclude taking preference'''
+    # filter out the versions matching the exclude pattern
+    if expattern:
+        regex = re.compile(expattern)
+        versions = [x for x in filter(lambda x: not regex.match(x), versions)]
+
+    # filter on include pattern
+    if inpattern:
+        regex = re.compile(inpattern)
+        versions = [x for x in filter(regex.match, versions)]
+    return versions
+
+def package_plugin(plugin_version, z3_version, z3_releases, push=True, range_fetch=False, commit=True, asset_policy='oldest',
+                   work_dir='.', native_p2=False, deltas=False):
+    '''Package a plugin from the exectuables for the corresponding release.
+
+    Files are generated in the git work tree work_dir; returns whether the
+    release was found and packaged.
+    '''
+
+    def extract_binaries(binaries_dir, asset, platform_name, exe_name, scan_needed):
         if not os.path.exists(binaries_dir):
             os.makedirs(binaries_dir)
+        zipfilename = os.path.join(binaries_dir, asset.name)
+        downloaded = CHECKPOINTS.get(plugin_version, 'download', platform_name)
+        if downloaded and os.path.exists(zipfilename):
+            digest = downloaded['sha256']
+            print('  Resuming with downloaded %s.  Extracting...' % (asset.name))
+        else:
+            print('  Downloading binary package %s ...' % (asset.name))
+            digest = download_asset(asset, zipfilename)
+            CHECKPOINTS.record(plugin_version, 'download', platform_name, sha256=digest)
+            print('  Download complete, sha256 %s verified.  Extracting...' % (digest))
         with ZipFile(zipfilename) as zipfile:
-            contents = zipfile.infolist()
-            zipfile.extractall(binaries_dir)
+            if RESOURCES.streaming:
+                members = extract_closure(zipfile, binaries_dir, exe_name, scan_needed)
+                print('  Extracted %s.' % (pformat(members)))
+            else:
+                zipfile.extractall(binaries_dir)
+                members = [i.filename for i in zipfile.infolist() if not i.filename.endswith('/')]
         print('  Extraction complete.')
         if os.path.exists(zipfilename):
             os.remove(zipfilename)
         print('  Downloaded file removed.')
+        # Recorded for later range fetches of the asset, which cannot check its digest
+        check_members(asset, binaries_dir, members, verified=True)
+        return digest
+
+    def fetch_binaries(binaries_dir, asset, platform_name, exe_name, scan_needed):
+        url = getattr(asset, 'browser_download_url', None)
+        if range_fetch and url:
+            print('  Fetching binaries from %s ...' % (url))
+            try:
+                # Reading each member whole checks its CRC against the central directory
+                members = extract_remote_closure(url, binaries_dir, exe_name, scan_needed)
+                check_members(asset, binaries_dir, members, verified=False)
+                print('  Member digests verified.')
+                return None
+            except (IOError, BadZipFile) as e:
+                print('  Range fetch failed (%s), downloading whole asset.' % (e))
+        return extract_binaries(binaries_dir, asset, platform_name, exe_name, scan_needed)
 
     def get_deps_linux(rootdir):
         def get_deps_linux_rec(file):
             def call_ldd(file):
-                import subprocess
-                return subprocess.check_output(['ldd', file]).decode('ascii')
+                METRICS.inc('z3_fetcher_dependency_scans_total', platform='linux')
+                return stream_lines(['ldd', file])
             pattern = re.compile(r'\s*(\S+)\s+=>\s+not found')
             dir_name = os.path.dirname(file)
-            ldd_out = [str(x) for x in call_ldd(file).splitlines()]
-            deps = {pattern.match(x).group(1) for x in ldd_out if 'not found' in x}
+            deps = {pattern.match(x).group(1) for x in call_ldd(file) if 'not found' in x}
             trans_deps = set()
             for d in deps:
                 trans_deps = trans_deps | get_deps_linux_rec(os.path.join(dir_name, d))
             return {file} | trans_deps | deps
-        z3_exec = next(iter([os.path.join(d,f) for d,_,files in os.walk(rootdir) for f in files if f == 'z3']), None)
+        z3_exec = FileIndex(rootdir).find('z3')
         return [x for x in get_deps_linux_rec(z3_exec)]
 
     def get_deps_osx(rootdir):
         mgraph = MachOGraph()
-        z3_exec = None
-        for folder, _, files in os.walk(rootdir):
-            for file in files:
-                fn = os.path.join(folder, file)
-                if file == 'z3':
-                    z3_exec = fn
-                try:
-                    mgraph.run_file(fn)
-                except Exception:
-                    pass
-        return [x for x in filter(lambda d: rootdir in d, mgraph.graph.forw_bfs(z3_exec))]
+        index = FileIndex(rootdir)
+        for fn in index:
+            try:
+                METRICS.inc('z3_fetcher_dependency_scans_total', platform='osx')
+                mgraph.run_file(fn)
+            except Exception:
+                pass
+        return [x for x in filter(lambda d: rootdir in d, mgraph.graph.forw_bfs(index.find('z3')))]
 
     def get_deps_win32(rootdir):
-        def get_casefold_namemap(rootdir):
-            return {x.upper() : x for x in [os.path.join(d,f) for d,_,files in os.walk(rootdir) for f in files]}
         def get_deps_win32_rec(file):
             def call_objdump(file):
-                import subprocess
-                return subprocess.check_output(['objdump', '-p', file]).decode('ascii')
+                METRICS.inc('z3_fetcher_dependency_scans_total', platform='win32')
+                return stream_lines(['objdump', '-p', file])
             pattern = re.compile(r'\s*DLL\s+Name:\s*(\S+)')
             dir_name = os.path.dirname(file)
-            ldd_out = [str(x) for x in call_objdump(file).splitlines()]
-            dll_list = [x for x in ldd_out if 'DLL' in x]
-            raw_deps = {os.path.join(dir_name, x.group(1)) for x in [pattern.search(l) for l in dll_list] if x}
-            deps = {casefold_map[d.upper()] for d in raw_deps if d.upper() in casefold_map}
+            raw_deps = {os.path.join(dir_name, x.group(1)) for x in [pattern.search(l) for l in call_objdump(file) if 'DLL' in l] if x}
+            deps = {index.get_folded(d) for d in raw_deps} - {None}
             trans_deps = set()
             for d in deps:
                 trans_deps = trans_deps | get_deps_win32_rec(d)
             return {file} | trans_deps | deps
-        casefold_map = get_casefold_namemap(rootdir)
-        z3_exec = next(iter([os.path.join(d,f) for d,_,files in os.walk(rootdir) for f in files if f == 'z3.exe']), None)
+        index = FileIndex(rootdir)
+        z3_exec = index.find('z3.exe')
         return [x for x in get_deps_win32_rec(z3_exec)]
 
-    release_description = next(filter(lambda r: r.tag_name == z3_version, z3_releases), None)
-    if release_description:
-        print('Building plugin version %s for Z3 version %s...' % (plugin_version,z3_version))
-
-        gitrepo = Repo(os.getcwd())
-
-        # Since we're in detached head state, make a branch on which to work
-        try:
-            print('  Creating branch for building %s...' % (plugin_version))
-            git_result = gitrepo.git.checkout('-b', plugin_version, with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
-        except Exception as e:
-             sys.stderr.write(str(e))
-             sys.exit(1)
+    resolvers = {'linux': get_deps_linux, 'osx': get_deps_osx, 'win32': get_deps_win32}
+    scanners = {'linux': scan_needed_linux, 'osx': scan_needed_osx, 'win32': scan_needed_win32}
 
-        release_assets_by_name = {x.name : x for x in release_description.assets()}
+    def render_templates(variants):
+        for package_dir in variant_package_dirs(work_dir):
+            if package_dir not in [v.package_dir for v in variants]:
+                try:
+                    gitrepo.index.remove([package_dir], True, r=True)
+                except Exception as e:
+                    sys.stderr.write(str(e))
+                shutil.rmtree(os.path.join(work_dir, package_dir), ignore_errors=True)
+                print('  Removed variant fragment %s.' % (package_dir))
 
         filename = 'pom.xml'
-        with open(filename, 'w') as text_file:
-            text_file.write(POM_TEMPLATE.safe_substitute(plugin_version = plugin_version))
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(POM_TEMPLATE.safe_substitute(plugin_version = plugin_version,
+                variant_modules=''.join('        <module>%s</module>\n' % (v.package_dir) for v in variants)))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(SOURCE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(SOURCE_POM_TEMPLATE.safe_substitute(plugin_version = plugin_version))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(SOURCE_DIR, 'META-INF', 'MANIFEST.MF')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(SOURCE_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
-        filename = os.path.join(FEATURE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
-            text_file.write(FEATURE_POM_TEMPLATE.safe_substitute(plugin_version = plugin_version))
-        print('  Generated %s.' % (filename))
-
-        filename = os.path.join(FEATURE_DIR, 'feature.xml')
-        with open(filename, 'w') as text_file:
-            text_file.write(FEATURE_XML_TEMPLATE.safe_substitute(plugin_version = plugin_version))
-        print('  Generated %s.' % (filename))
-
-        filename = os.path.join(LINUX_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=LINUX_PACKAGE_DIR, os='linux', ws='gtk', arch='x86_64'))
-        print('  Generated %s.' % (filename))
-
-        filename = os.path.join(LINUX_PACKAGE_DIR, 'META-INF', 'MANIFEST.MF')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=LINUX_PACKAGE_DIR, os='linux', ws='gtk', arch='x86_64'))
+        filename = os.path.join(TESTS_DIR, 'pom.xml')
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(TESTS_POM_TEMPLATE.safe_substitute(plugin_version = plugin_version))
         print('  Generated %s.' % (filename))
 
-        # Download and unpack binaries into binaries dir
-        with tempfile.TemporaryDirectory() as temp_dir:
-            binaries_dir = os.path.join(LINUX_PACKAGE_DIR, 'binaries')
-            asset = get_asset(release_assets_by_name, 'x64-ubuntu')
-            try:
-                removed_elements = gitrepo.index.remove([binaries_dir], True, r=True)
-                print('  Previous binaries removed from git: %s' % (pformat(removed_elements)))
-            except Exception as e:
-                sys.stderr.write(str(e))
-            extract_binaries(temp_dir, asset)
-            z3_deps = get_deps_linux(temp_dir)
-            print('  Required (deps) files: %s' % (pformat(z3_deps)))
-            if not os.path.exists(binaries_dir):
-                os.makedirs(binaries_dir)
-            for dep in z3_deps:
-                copyfile(dep, os.path.join(binaries_dir, os.path.basename(dep)))
-            print('  Required files copied.')
-            #added_elements = gitrepo.index.add([os.path.join(binaries_dir, os.path.basename(dep)) for dep in z3_deps])
-            #print('  New binaries added to git: %s' % (added_elements))
-
-        filename = os.path.join(MACOS_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=MACOS_PACKAGE_DIR, os='macosx', ws='cocoa', arch='x86_64'))
+        filename = os.path.join(TESTS_DIR, 'META-INF', 'MANIFEST.MF')
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(TESTS_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
-        filename = os.path.join(MACOS_PACKAGE_DIR, 'META-INF', 'MANIFEST.MF')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=MACOS_PACKAGE_DIR, os='macosx', ws='cocoa', arch='x86_64'))
+        filename = os.path.join(FEATURE_DIR, 'pom.xml')
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(FEATURE_POM_TEMPLATE.safe_substitute(plugin_version = plugin_version,
+                # Variant fragments have no source bundles either
+                variant_excludes=''.join(FEATURE_VARIANT_EXCLUDE_TEMPLATE.safe_substitute(artifact_id=v.package_dir) for v in variants)))
         print('  Generated %s.' % (filename))
 
-        # Download and unpack binaries into binaries dir
-        with tempfile.TemporaryDirectory() as temp_dir:
-            binaries_dir = os.path.join(MACOS_PACKAGE_DIR, 'binaries')
-            asset = get_asset(release_assets_by_name, 'x64-osx')
-            try:
-                removed_elements = gitrepo.index.remove([binaries_dir], True, r=True)
-                print('  Previous binaries removed from git: %s' % (pformat(removed_elements)))
-            except Exception as e:
-                sys.stderr.write(str(e))
-            print('  Previous binaries directory removed from git.')
-            extract_binaries(temp_dir, asset)
-            z3_deps = get_deps_osx(temp_dir)
-            print('  Required (deps) files: %s' % (pformat(z3_deps)))
-            if not os.path.exists(binaries_dir):
-                os.makedirs(binaries_dir)
-            for dep in z3_deps:
-                copyfile(dep, os.path.join(binaries_dir, os.path.basename(dep)))
-            print('  Required files copied.')
-
-        filename = os.path.join(WIN32_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=WIN32_PACKAGE_DIR, os='win32', ws='win32', arch='x86_64'))
+        filename = os.path.join(FEATURE_DIR, 'feature.xml')
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(FEATURE_XML_TEMPLATE.safe_substitute(plugin_version = plugin_version,
+                variant_plugins=''.join(FEATURE_VARIANT_TEMPLATE.safe_substitute(plugin_version=plugin_version,
+                    artifact_id=v.package_dir, os=linux.os, ws=linux.ws, arch=linux.arch) for v in variants)))
         print('  Generated %s.' % (filename))
 
-        filename = os.path.join(WIN32_PACKAGE_DIR, 'META-INF', 'MANIFEST.MF')
-        with open(filename, 'w') as text_file:
-            text_file.write(BINARY_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=WIN32_PACKAGE_DIR, os='win32', ws='win32', arch='x86_64'))
-        print('  Generated %s.' % (filename))
-
-        # Download and unpack binaries into binaries dir
-        with tempfile.TemporaryDirectory() as temp_dir:
-            binaries_dir = os.path.join(WIN32_PACKAGE_DIR, 'binaries')
-            asset = get_asset(release_assets_by_name, 'x64-win')
-            try:
-                removed_elements = gitrepo.index.remove([binaries_dir], True, r=True)
-                print('  Previous binaries removed from git: %s' % (pformat(removed_elements)))
-            except Exception as e:
-                sys.stderr.write(str(e))
-            print('  Previous binaries directory removed from git.')
-            extract_binaries(temp_dir, asset)
-            z3_deps = get_deps_win32(temp_dir)
-            print('  Required (deps) files: %s' % (pformat(z3_deps)))
-            if not os.path.exists(binaries_dir):
-                os.makedirs(binaries_dir)
-            for dep in z3_deps:
-                copyfile(dep, os.path.join(binaries_dir, os.path.basename(dep)))
-            print('  Required files copied.')
+        for platform in PLATFORMS:
+            filename = os.path.join(platform.package_dir, 'pom.xml')
+            with open(os.path.join(work_dir, filename), 'w') as text_file:
+                text_file.write(BINARY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=platform.package_dir, os=platform.os, ws=platform.ws, arch=platform.arch))
+            print('  Generated %s.' % (filename))
+
+        for variant in variants:
+            os.makedirs(os.path.join(work_dir, variant.package_dir, 'META-INF'), exist_ok=True)
+            filename = os.path.join(variant.package_dir, 'pom.xml')
+            with open(os.path.join(work_dir, filename), 'w') as text_file:
+                text_file.write(BINARY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=variant.package_dir, os=linux.os, ws=linux.ws, arch=linux.arch))
+            print('  Generated %s.' % (filename))
+            filename = os.path.join(variant.package_dir, 'build.properties')
+            with open(os.path.join(work_dir, filename), 'w') as text_file:
+                text_file.write(FRAGMENT_BUILD_PROPERTIES)
+            print('  Generated %s.' % (filename))
 
         filename = os.path.join(TARGET_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(TARGET_POM_TEMPLATE.safe_substitute(plugin_version = plugin_version))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(REPO_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(REPOSITORY_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(REPO_PACKAGE_DIR, 'category.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(REPOSITORY_CATEGORY_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(UPDATES_PACKAGE_DIR, 'pom.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(UPDATES_POM_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
         filename = os.path.join(UPDATES_PACKAGE_DIR, 'category.xml')
-        with open(filename, 'w') as text_file:
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
             text_file.write(UPDATES_CATEGORY_TEMPLATE.safe_substitute(plugin_version=plugin_version))
         print('  Generated %s.' % (filename))
 
+    def package_binaries(platform, package_dir, asset, name, headers=''):
+        '''Fill a fragment with the closure of z3 in the asset; name labels its checkpoints and metrics'''
+        binaries_dir = os.path.join(package_dir, 'binaries')
+        fingerprint = BuildCache.fingerprint('binaries', RESOLVER_VERSION, platform.name, asset_fingerprint(asset))
+        binaries_path = os.path.join(work_dir, binaries_dir)
+        recorded_fingerprint, recorded_entries = read_binaries_manifest(os.path.join(work_dir, package_dir))
+        copied = BUILD_CACHE.enabled or CHECKPOINTS.done(plugin_version, 'copy', name, work_dir)
+        if (copied and recorded_fingerprint == fingerprint and os.path.isdir(binaries_path)
+                and hash_binaries(binaries_path, asset.name) == recorded_entries):
+            print('  Binaries for %s unchanged, sha256 verified.' % (name))
+            binary_entries = recorded_entries
+        else:
+            try:
+                removed_elements = gitrepo.index.remove([binaries_dir], True, r=True)
+                print('  Previous binaries removed from git: %s' % (pformat(removed_elements)))
+            except Exception as e:
+                sys.stderr.write(str(e))
+            if BUILD_CACHE.restore('binaries', fingerprint, {'binaries': binaries_path}):
+                print('  Binaries for %s restored from build cache.' % (name))
+            else:
+                # Download and unpack binaries into a scratch dir kept until they are copied, so a resumed run can reuse them
+                scratch_dir = os.path.join(STATE_DIR, 'scratch', plugin_version, name)
+                asset_size = asset.as_dict().get('size') or 0
+                with RESOURCES.scratch(asset_size * (1 + ResourceBudget.EXPANSION), name):
+                    if CHECKPOINTS.done(plugin_version, 'extract', name) and os.path.isdir(scratch_dir):
+                        print('  Resuming with binaries extracted for %s.' % (name))
+                    else:
+                        if not CHECKPOINTS.done(plugin_version, 'download', name) and os.path.exists(scratch_dir):
+                            shutil.rmtree(scratch_dir)
+                        with METRICS.timed('extract', platform=name):
+                            fetch_binaries(scratch_dir, asset, name, platform.exe_name, scanners[platform.name])
+                        CHECKPOINTS.record(plugin_version, 'extract', name)
+                    resolved = CHECKPOINTS.get(plugin_version, 'resolve', name)
+                    if resolved:
+                        z3_deps = resolved['files']
+                    else:
+                        with METRICS.timed('resolve', platform=name):
+                            z3_deps = resolvers[platform.name](scratch_dir)
+                        CHECKPOINTS.record(plugin_version, 'resolve', name, files=z3_deps)
+                    METRICS.set('z3_fetcher_closure_files', len(z3_deps), platform=name)
+                    print('  Required (deps) files: %s' % (pformat(z3_deps)))
+                    if not os.path.exists(binaries_path):
+                        os.makedirs(binaries_path)
+                    for dep in z3_deps:
+                        copyfile(dep, os.path.join(binaries_path, os.path.basename(dep)))
+                    print('  Required files copied.')
+                    shutil.rmtree(scratch_dir)
+                if not os.listdir(os.path.dirname(scratch_dir)):
+                    os.rmdir(os.path.dirname(scratch_dir))
+                BUILD_CACHE.store('binaries', fingerprint, {'binaries': binaries_path})
+            with METRICS.timed('hash', platform=name):
+                binary_entries = hash_binaries(binaries_path, asset.name)
+            write_binaries_manifest(os.path.join(work_dir, package_dir), binary_entries, fingerprint)
+            print('  Generated %s.' % (os.path.join(package_dir, BINARIES_MANIFEST)))
+            CHECKPOINTS.record(plugin_version, 'copy', name, work_dir=work_dir)
+        METRICS.set('z3_fetcher_closure_bytes', sum(e.size for e in binary_entries), platform=name)
+
+        filename = os.path.join(package_dir, 'META-INF', 'MANIFEST.MF')
+        with open(os.path.join(work_dir, filename), 'w') as text_file:
+            text_file.write(BINARY_MANIFEST_TEMPLATE.safe_substitute(plugin_version=plugin_version, artifact_id=package_dir, os=platform.os, ws=platform.ws, arch=platform.arch))
+            text_file.write(headers)
+            text_file.write(binaries_manifest_sections(binary_entries))
+        print('  Generated %s.' % (filename))
+
+    def build_modules():
         # Launch maven to build repository
-        subprocess.call(['mvn', 'clean', 'verify'])
+        module_dirs = maven_module_dirs(work_dir)
+        maven_modules, site_modules = module_dirs, []
+        if native_p2:
+            # Maven only builds the bundles and the feature; the sites are published from their jars below
+            site_modules = [REPO_PACKAGE_DIR, UPDATES_PACKAGE_DIR]
+            maven_modules = [d for d in module_dirs if d not in site_modules]
+        maven_outputs = {d: os.path.join(work_dir, d, 'target') for d in maven_modules}
+        updates_repository = os.path.join(work_dir, UPDATES_PACKAGE_DIR, 'target', 'repository')
+        if native_p2:
+            maven_fingerprint = BuildCache.fingerprint('maven', MAVEN_COMMAND, plugin_version,
+                tree_fingerprint(['pom.xml'] + maven_modules, root=work_dir), 'native-p2')
+        else:
+            maven_fingerprint = BuildCache.fingerprint('maven', MAVEN_COMMAND, plugin_version,
+                tree_fingerprint(['pom.xml'] + module_dirs, root=work_dir),
+                # the updates site is built on top of the previously published repository
+                tree_fingerprint([os.path.join(UPDATES_PACKAGE_DIR, 'target', 'repository')], skip_dirs=(), root=work_dir))
+        # Only what Maven adds to the cumulative updates repository is cached
+        unchanged = {}
+        if UPDATES_PACKAGE_DIR in maven_outputs:
+            unchanged[UPDATES_PACKAGE_DIR] = tree_digests(os.path.dirname(updates_repository))
+        if BUILD_CACHE.restore('maven', maven_fingerprint, maven_outputs):
+            print('  Maven outputs restored from build cache.')
+        else:
+            fingerprints = module_fingerprints(work_dir, maven_modules)
+            changed = changed_modules(plugin_version, fingerprints, work_dir) if BUILD_CACHE.enabled else maven_modules
+            excluded = ['!' + d for d in site_modules]
+            if not changed:
+                print('  All modules unchanged since installed, skipping Maven.')
+                maven_result = 0
+            else:
+                command = MAVEN_COMMAND
+                if len(changed) < len(maven_modules):
+                    # Rebuild the changed modules and those depending on them; the rest resolve from the local repository
+                    print('  Building changed modules and their dependents: %s' % (', '.join(changed)))
+                    command = MAVEN_COMMAND + ['-pl', ','.join(changed + excluded), '-amd']
+                elif excluded:
+                    command = MAVEN_COMMAND + ['-pl', ','.join(excluded)]
+                with METRICS.timed('maven'):
+                    maven_result = subprocess.call(command, cwd=work_dir)
+                METRICS.set('z3_fetcher_maven_modules_selected', len(changed))
+            if maven_result != 0:
+                sys.stderr.write('Maven build of plugin version %s failed.\n' % (plugin_version))
+                sys.exit(maven_result)
+            INSTALLED_MODULES.record(plugin_version, fingerprints)
+            BUILD_CACHE.store('maven', maven_fingerprint, maven_outputs, unchanged)
+
+        for module_dir in [SOURCE_DIR] + FRAGMENT_DIRS + variant_package_dirs(work_dir) + [FEATURE_DIR]:
+            jar = os.path.join(work_dir, module_dir, 'target', '%s-%s.jar' % (module_dir, plugin_version))
+            if os.path.exists(jar):
+                METRICS.set('z3_fetcher_artifact_bytes', os.path.getsize(jar), artifact=module_dir)
+
+        if native_p2:
+            with METRICS.timed('publish'):
+                publish_plugin_repositories(plugin_version, work_dir)
+
+        if deltas:
+            # Publish binary deltas against the previous fragment versions
+            make_delta_artifacts(plugin_version, updates_repository)
+
+    RUN_HISTORY.set_version(plugin_version)
+    release_description = next(filter(lambda r: r.tag_name == z3_version, z3_releases), None)
+    if release_description:
+        print('Building plugin version %s for Z3 version %s...' % (plugin_version,z3_version))
+        CHECKPOINTS.start(plugin_version, z3_version)
+        resumed = CHECKPOINTS.last_stage(plugin_version)
+        if resumed:
+            print('  Resuming after stage %s.' % (resumed))
+
+        gitrepo = Repo(work_dir)
+
+        if CHECKPOINTS.done(plugin_version, 'commit'):
+            # Packaged and merged already; only the tag and push can remain
+            if commit:
+                commit_plugin(gitrepo, plugin_version, push)
+            return True
+
+        if commit:
+            create_branch(gitrepo, plugin_version)
+
+        catalog = AssetCatalog(release_description.assets())
+        linux = next(p for p in PLATFORMS if p.name == 'linux')
+        variants = LINUX_VARIANTS.variants(catalog, catalog.select(linux, asset_policy), z3_version)
+        if variants:
+            print('  Packaging Linux variants %s; every Linux install will download all of them.' % (', '.join(v.name for v in variants)))
+
+        if CHECKPOINTS.done(plugin_version, 'render', work_dir=work_dir):
+            print('  Templates already rendered.')
+        else:
+            render_templates(variants)
+            CHECKPOINTS.record(plugin_version, 'render', work_dir=work_dir)
+
+        for platform in PLATFORMS:
+            record = catalog.select(platform, asset_policy)
+            print('  Using %s for %s.' % (record.name, platform.name))
+            package_binaries(platform, platform.package_dir, record.asset, platform.name)
+            if platform.name == 'linux':
+                for variant in variants:
+                    print('  Using %s for the %s variant.' % (variant.record.name, variant.name))
+                    package_binaries(platform, variant.package_dir, variant.record.asset, 'linux-' + variant.name,
+                                     LinuxVariants.headers(variant))
+
+        if BENCHMARK.enabled and not CHECKPOINTS.done(plugin_version, 'benchmark'):
+            with METRICS.timed('benchmark'):
+                if BENCHMARK.run(plugin_version, work_dir) is not None:
+                    CHECKPOINTS.record(plugin_version, 'benchmark')
+
+        if CHECKPOINTS.done(plugin_version, 'build', work_dir=work_dir):
+            print('  Plugin version %s already built.' % (plugin_version))
+        else:
+            build_modules()
+            CHECKPOINTS.record(plugin_version, 'build', work_dir=work_dir)
+
+        if commit:
+            commit_plugin(gitrepo, plugin_version, push)
+        return True
+
+    else:
+        sys.stderr.write('Cannot find release description for %s' % (z3_version))
+        return False
 
-        # Commit/push this repository
+def create_branch(gitrepo, plugin_version):
+    '''Create the branch on which a plugin version is packaged, or when resuming reuse it'''
+    # Since we're in detached head state, make a branch on which to work
+    try:
+        if CHECKPOINTS.resume and plugin_version in [head.name for head in gitrepo.heads]:
+            print('  Resuming on existing branch %s...' % (plugin_version))
+            git_result = gitrepo.git.checkout(plugin_version, with_extended_output=True)
+        else:
+            print('  Creating branch for building %s...' % (plugin_version))
+            git_result = gitrepo.git.checkout('-b', plugin_version, with_extended_output=True)
+        print(git_result[1])
+        if (git_result[0] != 0) :
+            sys.stderr.write(git_result[2])
+            sys.exit(git_result[0])
+    except Exception as e:
+         sys.stderr.write(str(e))
+         sys.exit(1)
+
+def commit_plugin(gitrepo, plugin_version, push=True):
+    '''Commit the packaged version, merge it to master, tag it and push, skipping the stages already done.
+
+    A version older than one already tagged, as built by a newest-first
+    backfill, is tagged on its own branch instead; master keeps the poms
+    and fragments of the newest version and only takes the updates site,
+    which holds every version.
+    '''
+    RUN_HISTORY.set_version(plugin_version)
+    tagged = [t.name for t in gitrepo.tags if re.match(r'^\d+\.\d+\.\d+$', t.name) and t.name != plugin_version]
+    newest = max(tagged, key=version_key) if tagged else None
+    backfill = newest is not None and version_key(newest) > version_key(plugin_version)
+    # Commit/push this repository
+    with METRICS.timed('git'):
         try:
-            print('  Adding objects to git index...')
-            git_result = gitrepo.git.add('-A', with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
-            print('  Calling git commit...')
-            git_result = gitrepo.git.commit('-m', 'Package plugin version %s' % (plugin_version), with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
-            print('  Calling git checkout master...')
-            git_result = gitrepo.git.checkout('master', with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
-            print('  Calling git merge %s...' % (plugin_version))
-            git_result = gitrepo.git.merge(plugin_version, with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
-            print('  Calling git tag...')
-            tag_ref = gitrepo.git.tag(plugin_version, with_extended_output=True)
-            print(git_result[1])
-            if (git_result[0] != 0) :
-                sys.stderr.write(git_result[2])
-                sys.exit(git_result[0])
+            if CHECKPOINTS.done(plugin_version, 'commit'):
+                print('  Plugin version %s already committed and merged.' % (plugin_version))
+            else:
+                print('  Adding objects to git index...')
+                git_result = gitrepo.git.add('-A', with_extended_output=True)
+                print(git_result[1])
+                if (git_result[0] != 0) :
+                    sys.stderr.write(git_result[2])
+                    sys.exit(git_result[0])
+                if CHECKPOINTS.resume and not gitrepo.is_dirty():
+                    # Committed by the interrupted run before it could merge
+                    print('  Nothing to commit, branch %s already committed.' % (plugin_version))
+                else:
+                    print('  Calling git commit...')
+                    git_result = gitrepo.git.commit('-m', 'Package plugin version %s' % (plugin_version), with_extended_output=True)
+                    print(git_result[1])
+                    if (git_result[0] != 0) :
+                        sys.stderr.write(git_result[2])
+                        sys.exit(git_result[0])
+                print('  Calling git checkout master...')
+                git_result = gitrepo.git.checkout('master', with_extended_output=True)
+                print(git_result[1])
+                if (git_result[0] != 0) :
+                    sys.stderr.write(git_result[2])
+                    sys.exit(git_result[0])
+                if backfill:
+                    print('  Plugin version %s is older than %s, adding only its updates site to master...' % (plugin_version, newest))
+                    updates_repository = os.path.join(UPDATES_PACKAGE_DIR, 'target', 'repository')
+                    gitrepo.git.checkout(plugin_version, '--', updates_repository)
+                    if gitrepo.is_dirty():
+                        git_result = gitrepo.git.commit('-m', 'Add plugin version %s to the updates site' % (plugin_version), with_extended_output=True)
+                        print(git_result[1])
+                        if (git_result[0] != 0) :
+                            sys.stderr.write(git_result[2])
+                            sys.exit(git_result[0])
+                else:
+                    print('  Calling git merge %s...' % (plugin_version))
+                    git_result = gitrepo.git.merge(plugin_version, with_extended_output=True)
+                    print(git_result[1])
+                    if (git_result[0] != 0) :
+                        sys.stderr.write(git_result[2])
+                        sys.exit(git_result[0])
+                CHECKPOINTS.record(plugin_version, 'commit')
+            if CHECKPOINTS.done(plugin_version, 'tag'):
+                print('  Plugin version %s already tagged.' % (plugin_version))
+            else:
+                print('  Calling git tag...')
+                if backfill:
+                    # Tag the branch commit, which has the poms and fragments of this version
+                    tag_ref = gitrepo.git.tag(plugin_version, 'refs/heads/%s' % (plugin_version), with_extended_output=True)
+                else:
+                    tag_ref = gitrepo.git.tag(plugin_version, with_extended_output=True)
+                print(git_result[1])
+                if (git_result[0] != 0) :
+                    sys.stderr.write(git_result[2])
+                    sys.exit(git_result[0])
+                CHECKPOINTS.record(plugin_version, 'tag')
+            if not push:
+                print('  Offline, skipping git push.')
+                return
+            if CHECKPOINTS.done(plugin_version, 'push'):
+                print('  Plugin version %s already pushed.' % (plugin_version))
+                return
             print('  Calling git push...')
             gir_result = gitrepo.git.push('--quiet', '--set-upstream', 'origin-with-token', 'master', with_extended_output=True)
             print(git_result[1])
@@ -1059,27 +2848,966 @@ def package_plugin(plugin_version, z3_version, z3_releases):
             if (git_result[0] != 0) :
                 sys.stderr.write(git_result[2])
                 sys.exit(git_result[0])
+            CHECKPOINTS.record(plugin_version, 'push')
             print('  Git update and push complete.')
         except Exception as e:
              sys.stderr.write(str(e))
              sys.exit(1)
 
+def release_plugin(plugin_version, work_dir='.'):
+    '''Create the GitHub release of a plugin version and upload its repository zip from work_dir'''
+    RUN_HISTORY.set_version(plugin_version)
+    if CHECKPOINTS.done(plugin_version, 'upload'):
+        print('  Plugin version %s already released.' % (plugin_version))
+        return
+    gh = connect_github()
+    with METRICS.timed('release'), GITHUB_SCHEDULER.priority(PRIORITY_FINISH):
+        repository = gh.repository(Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
+        if CHECKPOINTS.done(plugin_version, 'release'):
+            print('  Resuming upload to the existing release %s.' % (plugin_version))
+            release = repository.release_from_tag(plugin_version)
+        else:
+            release = repository.create_release(plugin_version,
+                target_commitish='master',
+                name='Z3 Plugin %s' % (plugin_version),
+                body='Eclipse plugin containing binaries for Z3 Prover version %s.' % (plugin_version),
+                draft=False,
+                prerelease=False,
+            )
+            CHECKPOINTS.record(plugin_version, 'release')
+        filename = '%s-%s.zip' % (REPO_PACKAGE_DIR, plugin_version)
+        filepath = os.path.join(work_dir, REPO_PACKAGE_DIR, 'target', filename)
+        started = time.monotonic()
+        with open(filepath, 'rb') as asset_file:
+            asset = release.upload_asset(content_type='application/binary', name=filename, asset=asset_file)
+        size = os.path.getsize(filepath)
+        CHECKPOINTS.record(plugin_version, 'upload')
+        METRICS.inc('z3_fetcher_uploaded_bytes_total', size)
+        METRICS.set('z3_fetcher_upload_bytes_per_second', size / max(time.monotonic() - started, 1e-6))
+
+P2_INDEX = '''version=1
+metadata.repository.factory.order=content.xml.xz,content.xml,\\!
+artifact.repository.factory.order=artifacts.xml.xz,artifacts.xml,\\!
+'''
+
+# Processing instruction naming the format of each p2 metadata file
+P2_FORMATS = {'content': 'metadataRepository', 'artifacts': 'artifactRepository'}
+
+@contextmanager
+def open_jar_member(path, member):
+    '''Open a member of a jar, closing the jar along with it'''
+    with ZipFile(path) as jar, jar.open(member) as member_file:
+        yield member_file
+
+def read_p2_metadata(repository_dir, name):
+    '''Parse the content or artifacts metadata of a p2 repository.
+
+    Returns the root element and the format version, or (None, None) if the
+    repository has no such metadata.
+    '''
+    readers = [
+        (name + '.xml.xz', lambda path: lzma.open(path)),
+        (name + '.jar', lambda path: open_jar_member(path, name + '.xml')),
+        (name + '.xml', lambda path: open(path, 'rb')),
+    ]
+    for filename, opener in readers:
+        path = os.path.join(repository_dir, filename)
+        if os.path.exists(path):
+            with opener(path) as xml_file:
+                data = xml_file.read()
+            pi = re.search(("<\\?%s version='([^']*)'\\?>" % (P2_FORMATS[name])).encode('ascii'), data)
+            return ElementTree.fromstring(data), pi.group(1).decode('ascii') if pi else '1.1.0'
+    return None, None
+
+def write_p2_metadata(repository_dir, name, root, format_version, plain=False):
+    '''Write p2 metadata compressed as both <name>.jar and <name>.xml.xz, and optionally as plain <name>.xml'''
+    for prop in root.iterfind('properties/property'):
+        if prop.get('name') == 'p2.timestamp':
+            prop.set('value', str(int(time.time() * 1000)))
+    data = ("<?xml version='1.0' encoding='UTF-8'?>\n<?%s version='%s'?>\n" % (P2_FORMATS[name], format_version)).encode('utf-8')
+    data += ElementTree.tostring(root, encoding='unicode').encode('utf-8')
+    with lzma.open(os.path.join(repository_dir, name + '.xml.xz'), 'wb') as xz_file:
+        xz_file.write(data)
+    with ZipFile(os.path.join(repository_dir, name + '.jar'), 'w', ZIP_DEFLATED) as jar:
+        jar.writestr(name + '.xml', data)
+    if plain:
+        with open(os.path.join(repository_dir, name + '.xml'), 'wb') as xml_file:
+            xml_file.write(data)
+    elif os.path.exists(os.path.join(repository_dir, name + '.xml')):
+        # A stale plain copy would shadow the merged metadata for some clients
+        os.remove(os.path.join(repository_dir, name + '.xml'))
+    with open(os.path.join(repository_dir, 'p2.index'), 'w') as index_file:
+        index_file.write(P2_INDEX)
+
+def merge_p2_repositories(target_dir, source_dir):
+    '''Add the units, artifacts and files of one p2 repository to another'''
+    for folder, _, files in os.walk(source_dir):
+        relative = os.path.relpath(folder, source_dir)
+        if relative == '.':
+            continue
+        for file in files:
+            target = os.path.join(target_dir, relative, file)
+            if relative == 'deltas' and file == 'index.json' and os.path.exists(target):
+                with open(target) as index_file:
+                    index = json.load(index_file)
+                with open(os.path.join(folder, file)) as index_file:
+                    index += [e for e in json.load(index_file) if e not in index]
+                with open(target, 'w') as index_file:
+                    json.dump(index, index_file, indent=1)
+            elif not os.path.exists(target):
+                if not os.path.exists(os.path.dirname(target)):
+                    os.makedirs(os.path.dirname(target))
+                copyfile(os.path.join(folder, file), target)
+    for name, list_tag, key_attributes in (('content', 'units', ('id', 'version')),
+                                           ('artifacts', 'artifacts', ('classifier', 'id', 'version'))):
+        source_root, source_format = read_p2_metadata(source_dir, name)
+        if source_root is None:
+            continue
+        target_root, target_format = read_p2_metadata(target_dir, name)
+        if target_root is None:
+            write_p2_metadata(target_dir, name, source_root, source_format)
+            continue
+        target_list = target_root.find(list_tag)
+        keys = {tuple(e.get(a) for a in key_attributes) for e in target_list}
+        for element in source_root.find(list_tag):
+            if tuple(element.get(a) for a in key_attributes) not in keys:
+                target_list.append(element)
+        target_list.set('size', str(len(target_list)))
+        write_p2_metadata(target_dir, name, target_root, target_format)
+
+# Where the artifacts of a simple p2 repository are stored
+P2_MAPPINGS = [
+    ('(& (classifier=osgi.bundle) (format=packed))', '${repoUrl}/plugins/${id}_${version}.jar.pack.gz'),
+    ('(& (classifier=osgi.bundle))', '${repoUrl}/plugins/${id}_${version}.jar'),
+    ('(& (classifier=binary))', '${repoUrl}/binary/${id}_${version}'),
+    ('(& (classifier=org.eclipse.update.feature) (format=packed))', '${repoUrl}/features/${id}_${version}.jar.pack.gz'),
+    ('(& (classifier=org.eclipse.update.feature))', '${repoUrl}/features/${id}_${version}.jar'),
+]
+
+def read_jar_manifest(jar_path):
+    '''Main section headers of a jar's MANIFEST.MF, read line by line from the archive'''
+    headers = {}
+    name = None
+    with ZipFile(jar_path) as jar, jar.open('META-INF/MANIFEST.MF') as manifest:
+        for line in io.TextIOWrapper(manifest, encoding='utf-8'):
+            line = line.rstrip('\r\n')
+            if not line:
+                break
+            if line.startswith(' ') and name:
+                headers[name] += line[1:]
+            else:
+                name, _, value = line.partition(':')
+                headers[name] = value[1:] if value.startswith(' ') else value
+    return headers
+
+def parse_manifest_clauses(value):
+    '''Split an OSGi header into (name, parameters) clauses, honouring quoted commas'''
+    clauses = []
+    for clause in re.findall(r'(?:[^,"]|"[^"]*")+', value or ''):
+        parts = re.findall(r'(?:[^;"]|"[^"]*")+', clause)
+        params = {}
+        for part in parts[1:]:
+            key, _, param = part.partition('=')
+            params[key.strip().rstrip(':')] = param.strip().strip('"')
+        clauses.append((parts[0].strip(), params))
+    return clauses
+
+def read_feature(jar_path):
+    '''Attributes, texts and included plugins of the feature.xml in a feature jar, parsed incrementally'''
+    feature = {'plugins': []}
+    with ZipFile(jar_path) as jar, jar.open('feature.xml') as feature_xml:
+        for _, element in ElementTree.iterparse(feature_xml):
+            if element.tag == 'plugin':
+                feature['plugins'].append(dict(element.attrib))
+            elif element.tag in ('description', 'copyright', 'license'):
+                feature[element.tag] = (element.get('url'), (element.text or '').strip())
+            elif element.tag == 'feature':
+                feature.update(element.attrib)
+            element.clear()
+    return feature
+
+def sized(element):
+    element.set('size', str(len(element)))
+    return element
+
+def add_p2_properties(unit, properties):
+    element = ElementTree.SubElement(unit, 'properties')
+    for name, value in properties:
+        if value is not None:
+            ElementTree.SubElement(element, 'property', {'name': name, 'value': value})
+    return sized(element)
+
+def platform_filter(value):
+    '''Normalize an LDAP filter such as (& (osgi.os=linux) (osgi.ws=gtk)) the way p2 prints it'''
+    terms = sorted(re.findall(r'\(([\w.]+=[^()]*)\)', value))
+    return '(&%s)' % (''.join('(%s)' % (t.strip()) for t in terms)) if len(terms) > 1 else '(%s)' % (terms[0])
+
+def maven_properties(artifact_id, version):
+    return [('maven-groupId', BASE_PACKAGE), ('maven-artifactId', artifact_id), ('maven-version', version)]
+
+def bundle_unit(headers, artifact_id):
+    '''p2 installable unit describing a bundle or fragment from its manifest headers'''
+    (bsn, bsn_params), = parse_manifest_clauses(headers['Bundle-SymbolicName'])
+    version = headers['Bundle-Version']
+    host = parse_manifest_clauses(headers.get('Fragment-Host'))
+    attributes = {'id': bsn, 'version': version}
+    if bsn_params.get('singleton') != 'true':
+        attributes['singleton'] = 'false'
+    attributes['generation'] = '2'
+    unit = ElementTree.Element('unit', attributes)
+    ElementTree.SubElement(unit, 'update', {'id': bsn, 'range': '[0.0.0,%s)' % (version), 'severity': '0'})
+    add_p2_properties(unit, [('org.eclipse.equinox.p2.name', headers.get('Bundle-Name')),
+                             ('org.eclipse.equinox.p2.provider', headers.get('Bundle-Vendor'))]
+                            + maven_properties(artifact_id, version))
+    provides = ElementTree.SubElement(unit, 'provides')
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': bsn, 'version': version})
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'osgi.bundle', 'name': bsn, 'version': version})
+    for package, params in parse_manifest_clauses(headers.get('Export-Package')):
+        ElementTree.SubElement(provides, 'provided', {'namespace': 'java.package', 'name': package, 'version': params.get('version', '0.0.0')})
+    identity = ElementTree.SubElement(provides, 'provided', {'namespace': 'osgi.identity', 'name': bsn, 'version': version})
+    add_p2_properties(identity, [('type', 'osgi.fragment' if host else 'osgi.bundle')])
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.eclipse.type', 'name': 'bundle', 'version': '1.0.0'})
+    for host_bsn, _ in host:
+        ElementTree.SubElement(provides, 'provided', {'namespace': 'osgi.fragment', 'name': host_bsn, 'version': version})
+    sized(provides)
+    requires = ElementTree.SubElement(unit, 'requires')
+    for required, params in parse_manifest_clauses(headers.get('Require-Bundle')) + host:
+        ElementTree.SubElement(requires, 'required', {'namespace': 'osgi.bundle', 'name': required, 'range': params.get('bundle-version', '0.0.0')})
+    for package, params in parse_manifest_clauses(headers.get('Import-Package')):
+        ElementTree.SubElement(requires, 'required', {'namespace': 'java.package', 'name': package, 'range': params.get('version', '0.0.0')})
+    for environment, _ in parse_manifest_clauses(headers.get('Bundle-RequiredExecutionEnvironment')):
+        ee, _, ee_version = environment.partition('-')
+        ElementTree.SubElement(requires, 'requiredProperties', {'namespace': 'osgi.ee', 'match': '(&(osgi.ee=%s)(version=%s))' % (ee, ee_version)})
+    sized(requires)
+    if headers.get('Eclipse-PlatformFilter'):
+        ElementTree.SubElement(unit, 'filter').text = platform_filter(headers['Eclipse-PlatformFilter'])
+    artifacts = ElementTree.SubElement(unit, 'artifacts')
+    ElementTree.SubElement(artifacts, 'artifact', {'classifier': 'osgi.bundle', 'id': bsn, 'version': version})
+    sized(artifacts)
+    ElementTree.SubElement(unit, 'touchpoint', {'id': 'org.eclipse.equinox.p2.osgi', 'version': '1.0.0'})
+    touchpoint_data = ElementTree.SubElement(unit, 'touchpointData')
+    instructions = ElementTree.SubElement(touchpoint_data, 'instructions')
+    manifest = ['Bundle-SymbolicName: ' + headers['Bundle-SymbolicName'], 'Bundle-Version: ' + version]
+    if headers.get('Fragment-Host'):
+        manifest.append('Fragment-Host: ' + headers['Fragment-Host'])
+    ElementTree.SubElement(instructions, 'instruction', {'key': 'manifest'}).text = '\n'.join(manifest)
+    sized(instructions)
+    sized(touchpoint_data)
+    return unit
+
+def add_feature_legal(unit, feature):
+    if 'license' in feature:
+        licenses = ElementTree.SubElement(unit, 'licenses')
+        url, text = feature['license']
+        ElementTree.SubElement(licenses, 'license', {'uri': url, 'url': url}).text = text
+        sized(licenses)
+    if 'copyright' in feature:
+        url, text = feature['copyright']
+        ElementTree.SubElement(unit, 'copyright', {'uri': url, 'url': url}).text = text
+
+def feature_units(feature):
+    '''The feature.group and feature.jar installable units of a feature'''
+    feature_id, version = feature['id'], feature['version']
+    description_url, description = feature.get('description', (None, None))
+    properties = [('org.eclipse.equinox.p2.name', feature.get('label')),
+                  ('org.eclipse.equinox.p2.description', description),
+                  ('org.eclipse.equinox.p2.description.url', description_url),
+                  ('org.eclipse.equinox.p2.provider', feature.get('provider-name'))]
+    jar_filter = '(org.eclipse.update.install.features=true)'
+
+    group_id = feature_id + '.feature.group'
+    group = ElementTree.Element('unit', {'id': group_id, 'version': version, 'singleton': 'false'})
+    ElementTree.SubElement(group, 'update', {'id': group_id, 'range': '[0.0.0,%s)' % (version), 'severity': '0'})
+    add_p2_properties(group, properties + [('org.eclipse.equinox.p2.type.group', 'true')] + maven_properties(feature_id, version))
+    provides = ElementTree.SubElement(group, 'provides')
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': group_id, 'version': version})
+    sized(provides)
+    requires = ElementTree.SubElement(group, 'requires')
+    for plugin in feature['plugins']:
+        required = ElementTree.SubElement(requires, 'required', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': plugin['id'],
+                                                                 'range': '[%s,%s]' % (plugin['version'], plugin['version'])})
+        terms = ['(osgi.%s=%s)' % (key, plugin[key]) for key in ('arch', 'os', 'ws') if plugin.get(key)]
+        if terms:
+            ElementTree.SubElement(required, 'filter').text = '(&%s)' % (''.join(terms)) if len(terms) > 1 else terms[0]
+    required = ElementTree.SubElement(requires, 'required', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': feature_id + '.feature.jar',
+                                                             'range': '[%s,%s]' % (version, version)})
+    ElementTree.SubElement(required, 'filter').text = jar_filter
+    sized(requires)
+    ElementTree.SubElement(group, 'touchpoint', {'id': 'null', 'version': '0.0.0'})
+    add_feature_legal(group, feature)
+
+    jar_id = feature_id + '.feature.jar'
+    jar = ElementTree.Element('unit', {'id': jar_id, 'version': version})
+    add_p2_properties(jar, properties + maven_properties(feature_id, version))
+    provides = ElementTree.SubElement(jar, 'provides')
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': jar_id, 'version': version})
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.eclipse.type', 'name': 'feature', 'version': '1.0.0'})
+    ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.update.feature', 'name': feature_id, 'version': version})
+    sized(provides)
+    ElementTree.SubElement(jar, 'filter').text = jar_filter
+    artifacts = ElementTree.SubElement(jar, 'artifacts')
+    ElementTree.SubElement(artifacts, 'artifact', {'classifier': 'org.eclipse.update.feature', 'id': feature_id, 'version': version})
+    sized(artifacts)
+    ElementTree.SubElement(jar, 'touchpoint', {'id': 'org.eclipse.equinox.p2.osgi', 'version': '1.0.0'})
+    touchpoint_data = ElementTree.SubElement(jar, 'touchpointData')
+    instructions = ElementTree.SubElement(touchpoint_data, 'instructions')
+    ElementTree.SubElement(instructions, 'instruction', {'key': 'zipped'}).text = 'true'
+    sized(instructions)
+    sized(touchpoint_data)
+    add_feature_legal(jar, feature)
+    return [group, jar]
+
+def category_units(category_xml, plugin_version):
+    '''Category installable units for the features a category.xml assigns'''
+    root = ElementTree.parse(category_xml).getroot()
+    labels = {c.get('name'): c.get('label') for c in root.iter('category-def')}
+    members = {}
+    for feature in root.iter('feature'):
+        for category in feature.iter('category'):
+            members.setdefault(category.get('name'), []).append(feature)
+    units = []
+    for name, features in members.items():
+        # One category unit per published version, so merged sites keep them all
+        version = '1.0.0.v' + plugin_version.replace('.', '_')
+        unit = ElementTree.Element('unit', {'id': name, 'version': version})
+        add_p2_properties(unit, [('org.eclipse.equinox.p2.name', labels.get(name, name)),
+                                 ('org.eclipse.equinox.p2.type.category', 'true')])
+        provides = ElementTree.SubElement(unit, 'provides')
+        ElementTree.SubElement(provides, 'provided', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': name, 'version': version})
+        sized(provides)
+        requires = ElementTree.SubElement(unit, 'requires')
+        for feature in features:
+            ElementTree.SubElement(requires, 'required', {'namespace': 'org.eclipse.equinox.p2.iu', 'name': feature.get('id') + '.feature.group',
+                                                          'range': '[%s,%s]' % (feature.get('version'), feature.get('version'))})
+        sized(requires)
+        ElementTree.SubElement(unit, 'touchpoint', {'id': 'null', 'version': '0.0.0'})
+        units.append(unit)
+    return units
+
+def artifact_element(classifier, artifact_id, version, path):
+    artifact = ElementTree.Element('artifact', {'classifier': classifier, 'id': artifact_id, 'version': version})
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    size = str(os.path.getsize(path))
+    add_p2_properties(artifact, [('artifact.size', size), ('download.size', size)] + maven_properties(artifact_id, version)
+                      + [('download.md5', md5.hexdigest()), ('download.checksum.md5', md5.hexdigest()),
+                         ('download.checksum.sha-256', file_sha256(path))])
+    return artifact
+
+def publish_p2_repository(repository_dir, name, bundle_jars, feature_jars, category_xml, plugin_version, plain=True):
+    '''Write a p2 repository of the given jars without running Tycho.
+
+    Unit metadata comes from each bundle's MANIFEST.MF and each feature's
+    feature.xml; categories from category.xml.  The jars are copied to
+    plugins/ and features/ under their p2 names.
+    '''
+    for folder in ('plugins', 'features'):
+        if not os.path.exists(os.path.join(repository_dir, folder)):
+            os.makedirs(os.path.join(repository_dir, folder))
+    units, artifacts = [], []
+    for artifact_id, jar_path in bundle_jars:
+        headers = read_jar_manifest(jar_path)
+        unit = bundle_unit(headers, artifact_id)
+        units.append(unit)
+        target = os.path.join(repository_dir, 'plugins', '%s_%s.jar' % (unit.get('id'), unit.get('version')))
+        copyfile(jar_path, target)
+        artifacts.append(artifact_element('osgi.bundle', unit.get('id'), unit.get('version'), target))
+    for jar_path in feature_jars:
+        feature = read_feature(jar_path)
+        units += feature_units(feature)
+        target = os.path.join(repository_dir, 'features', '%s_%s.jar' % (feature['id'], feature['version']))
+        copyfile(jar_path, target)
+        artifacts.append(artifact_element('org.eclipse.update.feature', feature['id'], feature['version'], target))
+    units += category_units(category_xml, plugin_version)
+
+    content = ElementTree.Element('repository', {'name': name, 'type': 'org.eclipse.equinox.internal.p2.metadata.repository.LocalMetadataRepository', 'version': '1.0.0'})
+    add_p2_properties(content, [('p2.timestamp', '0'), ('p2.compressed', 'true')])
+    units_element = ElementTree.SubElement(content, 'units')
+    units_element.extend(units)
+    sized(units_element)
+    write_p2_metadata(repository_dir, 'content', content, '1.2.0', plain)
+
+    artifact_repository = ElementTree.Element('repository', {'name': name, 'type': 'org.eclipse.equinox.p2.artifact.repository.simpleRepository', 'version': '1'})
+    add_p2_properties(artifact_repository, [('publishPackFilesAsSiblings', 'true'), ('p2.compressed', 'true'), ('p2.timestamp', '0')])
+    mappings = ElementTree.SubElement(artifact_repository, 'mappings')
+    for rule_filter, output in P2_MAPPINGS:
+        ElementTree.SubElement(mappings, 'rule', {'filter': rule_filter, 'output': output})
+    sized(mappings)
+    artifacts_element = ElementTree.SubElement(artifact_repository, 'artifacts')
+    artifacts_element.extend(artifacts)
+    sized(artifacts_element)
+    write_p2_metadata(repository_dir, 'artifacts', artifact_repository, '1.1.0', plain)
+    return units
+
+def publish_plugin_repositories(plugin_version, work_dir='.'):
+    '''Assemble the repository and updates sites from the jars Maven built, in place of their Tycho modules'''
+    bundle_jars = [(d, os.path.join(work_dir, d, 'target', '%s-%s.jar' % (d, plugin_version))) for d in [SOURCE_DIR] + FRAGMENT_DIRS + variant_package_dirs(work_dir)]
+    feature_jars = [os.path.join(work_dir, FEATURE_DIR, 'target', '%s-%s.jar' % (FEATURE_DIR, plugin_version))]
+    repository_dir = os.path.join(work_dir, REPO_PACKAGE_DIR, 'target', 'repository')
+    if os.path.exists(repository_dir):
+        shutil.rmtree(repository_dir)
+    publish_p2_repository(repository_dir, REPO_PACKAGE_DIR, bundle_jars, feature_jars,
+                          os.path.join(work_dir, REPO_PACKAGE_DIR, 'category.xml'), plugin_version)
+    archive = os.path.join(work_dir, REPO_PACKAGE_DIR, 'target', '%s-%s.zip' % (REPO_PACKAGE_DIR, plugin_version))
+    with ZipFile(archive, 'w', ZIP_DEFLATED) as zip_file:
+        for folder, _, files in os.walk(repository_dir):
+            for file in files:
+                path = os.path.join(folder, file)
+                zip_file.write(path, os.path.relpath(path, repository_dir))
+    print('  Published p2 repository %s.' % (os.path.relpath(archive, work_dir)))
+
+    # The updates site accumulates every version: add this one to the published site
+    with tempfile.TemporaryDirectory() as temp_dir:
+        publish_p2_repository(temp_dir, UPDATES_PACKAGE_DIR, bundle_jars, feature_jars,
+                              os.path.join(work_dir, UPDATES_PACKAGE_DIR, 'category.xml'), plugin_version, plain=False)
+        updates_repository = os.path.join(work_dir, UPDATES_PACKAGE_DIR, 'target', 'repository')
+        if not os.path.exists(updates_repository):
+            os.makedirs(updates_repository)
+        merge_p2_repositories(updates_repository, temp_dir)
+    print('  Published plugin version %s to the updates site.' % (plugin_version))
+
+def version_key(version):
+    '''Sort key comparing dotted versions numerically, so 4.10.0 follows 4.8.5'''
+    return tuple(int(x) for x in re.findall(r'\d+', version))
+
+def make_delta_artifacts(plugin_version, repository_dir=os.path.join(UPDATES_PACKAGE_DIR, 'target', 'repository')):
+    '''Publish xdelta3 patches from the previous version of each native fragment jar.
+
+    Each patch is decoded again and compared with the new jar before it is
+    listed in deltas/index.json of the repository.  p2 clients do not read
+    this index; it serves mirrors and tools that fetch the patches
+    themselves, which is why publishing deltas is opt-in.
+    '''
+    if not shutil.which('xdelta3'):
+        raise CLIError('xdelta3 not found, cannot publish delta artifacts')
+    plugins_dir = os.path.join(repository_dir, 'plugins')
+    deltas_dir = os.path.join(repository_dir, 'deltas')
+    index_filename = os.path.join(deltas_dir, 'index.json')
+    index = []
+    if os.path.exists(index_filename):
+        with open(index_filename) as index_file:
+            index = json.load(index_file)
+    created = []
+    for bundle_id in FRAGMENT_DIRS:
+        jar_pattern = re.compile(re.escape(bundle_id) + r'_(\d+\.\d+\.\d+)\.jar$')
+        versions = sorted((m.group(1) for m in map(jar_pattern.match, os.listdir(plugins_dir)) if m), key=version_key)
+        older = [v for v in versions if version_key(v) < version_key(plugin_version)]
+        if plugin_version not in versions or not older:
+            continue
+        source = os.path.join(plugins_dir, '%s_%s.jar' % (bundle_id, older[-1]))
+        target = os.path.join(plugins_dir, '%s_%s.jar' % (bundle_id, plugin_version))
+        if not os.path.exists(deltas_dir):
+            os.makedirs(deltas_dir)
+        delta_name = '%s_%s_%s.xdelta' % (bundle_id, older[-1], plugin_version)
+        delta = os.path.join(deltas_dir, delta_name)
+        subprocess.check_call(['xdelta3', '-e', '-9', '-f', '-s', source, target, delta])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            rebuilt = os.path.join(temp_dir, 'rebuilt.jar')
+            subprocess.check_call(['xdelta3', '-d', '-f', '-s', source, delta, rebuilt])
+            target_digest = file_sha256(target)
+            if file_sha256(rebuilt) != target_digest:
+                raise CLIError('delta %s does not reconstruct %s' % (delta_name, os.path.basename(target)))
+        delta_size = os.path.getsize(delta)
+        target_size = os.path.getsize(target)
+        if delta_size > DELTA_MAX_RATIO * target_size:
+            print('  Delta for %s saves too little (%d of %d bytes), not published.' % (bundle_id, delta_size, target_size))
+            os.remove(delta)
+            continue
+        entry = {
+            'id': bundle_id,
+            'from': older[-1],
+            'to': plugin_version,
+            'file': 'deltas/' + delta_name,
+            'size': delta_size,
+            'target_size': target_size,
+            'target_sha256': target_digest,
+        }
+        index = [e for e in index if not (e['id'] == bundle_id and e['to'] == plugin_version)] + [entry]
+        created.append(entry)
+        print('  Delta %s: %d of %d bytes.' % (delta_name, delta_size, target_size))
+    if created:
+        with open(index_filename, 'w') as index_file:
+            json.dump(index, index_file, indent=1)
+    return created
+
+BenchmarkResult = namedtuple('BenchmarkResult', ['problem', 'expected', 'result', 'seconds', 'peak_rss_bytes'])
+
+def read_peak_rss(pid):
+    '''High-water mark of the resident memory of a running process in bytes, or 0 once it has exited'''
+    try:
+        with open('/proc/%d/status' % (pid)) as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, ValueError):
+        pass
+    return 0
+
+def solve_smtlib(executable, problem, timeout):
+    '''Run z3 on an SMT-LIB file; return its answer, wall time and peak RSS.
+
+    z3 is asked to give up after timeout seconds and is killed if it has not
+    exited shortly after.  The peak RSS is sampled from /proc while z3 runs,
+    since the rusage of a child also counts the memory of this process,
+    which the child had before it executed z3.
+    '''
+    started = time.monotonic()
+    with tempfile.TemporaryFile() as output:
+        process = subprocess.Popen([executable, '-smt2', '-T:%d' % (timeout), problem], stdout=output, stderr=subprocess.STDOUT)
+        peak_rss = [0]
+        exited = threading.Event()
+
+        def sample():
+            while True:
+                peak_rss[0] = max(peak_rss[0], read_peak_rss(process.pid))
+                if exited.wait(0.01):
+                    return
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        try:
+            process.wait(timeout + 5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        finally:
+            exited.set()
+        seconds = time.monotonic() - started
+        sampler.join()
+        output.seek(0)
+        answer = output.readline().decode('ascii', 'replace').strip()
+    if answer not in ('sat', 'unsat', 'unknown'):
+        answer = 'timeout' if seconds >= timeout else 'error'
+    return answer, seconds, peak_rss[0]
+
+class Benchmark(object):
+    '''Solver benchmark of the packaged Linux z3 over the SMT-LIB corpus in BENCHMARK_DIR.
+
+    Problems run in parallel, jobs at a time, each with its own timeout.
+    Answers contradicting the :status of a problem fail the version.
+    '''
+    def __init__(self, results_dir):
+        self.results_dir = results_dir
+        self.enabled = False
+        self.timeout = 60
+        self.jobs = os.cpu_count() or 1
+
+    @staticmethod
+    def expected_status(problem):
+        with open(problem) as smt_file:
+            match = re.search(r'\(set-info\s+:status\s+(sat|unsat|unknown)\s*\)', smt_file.read())
+        return match.group(1) if match else None
+
+    def run(self, plugin_version, work_dir='.'):
+        '''Benchmark the z3 packaged in work_dir; return the results, or None if it cannot run here'''
+        corpus_dir = os.path.join(work_dir, BENCHMARK_DIR)
+        binaries_path = os.path.join(work_dir, LINUX_PACKAGE_DIR, 'binaries')
+        if not sys.platform.startswith('linux') or not os.path.exists(os.path.join(binaries_path, 'z3')):
+            print('  No Linux z3 to run on this host, skipping benchmark.')
+            return None
+        problems = sorted(os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir) if f.endswith('.smt2'))
+        print('  Benchmarking z3 on %d problems, %d at a time...' % (len(problems), self.jobs))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # Run a copy, so the packaged files keep the mode they are committed with
+            executable = os.path.join(temp_dir, 'z3')
+            for name in os.listdir(binaries_path):
+                copyfile(os.path.join(binaries_path, name), os.path.join(temp_dir, name))
+            os.chmod(executable, 0o755)
+
+            def solve(problem):
+                answer, seconds, peak_rss = solve_smtlib(executable, problem, self.timeout)
+                return BenchmarkResult(os.path.basename(problem), self.expected_status(problem), answer, seconds, peak_rss)
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                results = list(executor.map(solve, problems))
+
+        wrong = []
+        for r in results:
+            print('    %-28s %-8s %9.3f s %9.1f MiB' % (r.problem, r.result, r.seconds, r.peak_rss_bytes / 1048576.0))
+            METRICS.set('z3_fetcher_benchmark_seconds', r.seconds, problem=r.problem)
+            METRICS.set('z3_fetcher_benchmark_peak_rss_bytes', r.peak_rss_bytes, problem=r.problem)
+            METRICS.inc('z3_fetcher_benchmark_results_total', result=r.result)
+            if r.expected in ('sat', 'unsat') and r.result in ('sat', 'unsat') and r.result != r.expected:
+                wrong.append(r.problem)
+        if not os.path.exists(self.results_dir):
+            os.makedirs(self.results_dir)
+        filename = os.path.join(self.results_dir, '%s.json' % (plugin_version))
+        with open(filename + '.part', 'w') as json_file:
+            json.dump({'plugin_version': plugin_version, 'timeout': self.timeout, 'finished': time.time(),
+                       'results': [r._asdict() for r in results]}, json_file, indent=1)
+        os.replace(filename + '.part', filename)
+        print('  Benchmark results written to %s.' % (filename))
+        if wrong:
+            sys.stderr.write('z3 of plugin version %s answers wrongly on %s\n' % (plugin_version, ', '.join(wrong)))
+            sys.exit(1)
+        return results
+
+BENCHMARK = Benchmark(os.path.join(STATE_DIR, 'benchmarks'))
+
+def pending_plugin_versions(z3_versions, extant_plugin_versions):
+    '''Map the plugin versions not yet packaged to their Z3 release tags'''
+    # Find the plugin version corresponding to the z3-version
+    regex = re.compile(r'\d+\.\d+\.\d+')
+    plugin_versions = {regex.search(x).group(0) : x for x in filter(regex.search, z3_versions)}
+
+    # remove the versions already packaged as plugin
+    return {v : plugin_versions[v] for v in filter(lambda x: (not x in extant_plugin_versions), plugin_versions)}
+
+class VersionScheduler(object):
+    '''Queue of plugin versions to build, ordered by a scheduling policy.
+
+    'newest' builds the most recent release first so it is published
+    without waiting for the backlog, 'oldest' backfills in release order.
+    Versions are compared numerically, so 4.10.0 is newer than 4.8.5.
+    Versions added with preempt=True, such as releases found while a
+    backlog is being built, go ahead of everything queued before them.
+    '''
+    def __init__(self, policy='newest', z3_releases=()):
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.heap = []
+        self.seen = set()
+        self.z3_versions = {}
+        self.z3_releases = list(z3_releases)
+
+    def _key(self, ver):
+        key = version_key(ver)
+        return tuple(-k for k in key) if self.policy == 'newest' else key
+
+    def add(self, plugin_versions, z3_releases=None, preempt=False):
+        '''Queue the versions (mapped to their Z3 tags) not queued before; return the ones added'''
+        added = []
+        with self.lock:
+            if z3_releases is not None:
+                self.z3_releases = list(z3_releases)
+            for ver in plugin_versions:
+                if ver in self.seen:
+                    continue
+                self.seen.add(ver)
+                self.z3_versions[ver] = plugin_versions[ver]
+                heapq.heappush(self.heap, (0 if preempt else 1, self._key(ver), ver))
+                added.append(ver)
+        return added
+
+    def pop(self):
+        '''Next version to build, or None when the queue is empty'''
+        with self.lock:
+            return heapq.heappop(self.heap)[2] if self.heap else None
+
+    def pending(self):
+        with self.lock:
+            return [ver for _, _, ver in sorted(self.heap)]
+
+def build_plugin_versions(plugin_versions, z3_releases, args, scheduler=None):
+    '''Package and release each of the plugin versions, in the order of the scheduler'''
+    if scheduler is None:
+        scheduler = VersionScheduler(args.schedule)
+    scheduler.add(plugin_versions, z3_releases)
+    print('Building plugin versions: %s' % (pformat(scheduler.pending())))
+    if args.jobs > 1 and len(scheduler.pending()) > 1:
+        return build_in_worktrees(scheduler, args)
+
+    built = []
+    ver = scheduler.pop()
+    while ver:
+        print('Building plugin version %s ...' % (ver))
+        package_plugin(ver, scheduler.z3_versions[ver], scheduler.z3_releases, push=not args.offline, range_fetch=args.range_fetch,
+                       asset_policy=args.asset_policy, native_p2=args.native_p2, deltas=args.deltas)
+        if args.offline:
+            print('Offline, skipping release of plugin version %s.' % (ver))
+        else:
+            release_plugin(ver)
+        built.append(ver)
+        ver = scheduler.pop()
+    return built
+
+def parse_shard(text):
+    '''Parse a shard specification i/N, 1 <= i <= N'''
+    match = re.match(r'^(\d+)/(\d+)$', text or '')
+    if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+        raise CLIError('shard must be given as i/N with 1 <= i <= N, not %s' % (text))
+    return int(match.group(1)), int(match.group(2))
+
+def build_shard(plugin_versions, z3_releases, args):
+    '''Build this worker's share of the versions and stage them for the merge step.
+
+    Versions are dealt round-robin in version order, so every shard gets
+    an even share of old and new releases.  Each version is staged as
+    <shard output>/<version>/ holding the generated tree and Maven outputs.
+    '''
+    shard_index, shard_count = parse_shard(args.shard)
+    versions = sorted(plugin_versions.keys(), key=version_key)[shard_index - 1::shard_count]
+    print('Shard %d/%d building plugin versions: %s' % (shard_index, shard_count, pformat(versions)))
+    for ver in versions:
+        package_plugin(ver, plugin_versions[ver], z3_releases, range_fetch=args.range_fetch, commit=False,
+                       asset_policy=args.asset_policy, native_p2=args.native_p2, deltas=args.deltas)
+        staged_dir = os.path.join(args.shard_output, ver)
+        if os.path.exists(staged_dir):
+            shutil.rmtree(staged_dir)
+        os.makedirs(staged_dir)
+        copyfile('pom.xml', os.path.join(staged_dir, 'pom.xml'))
+        for module_dir in maven_module_dirs():
+            shutil.copytree(module_dir, os.path.join(staged_dir, module_dir))
+        with open(os.path.join(staged_dir, 'shard.json'), 'w') as json_file:
+            json.dump({'plugin_version': ver, 'z3_version': plugin_versions[ver], 'shard': args.shard}, json_file)
+        print('  Staged plugin version %s in %s.' % (ver, staged_dir))
+    return versions
+
+def copy_tree(source_dir, target_dir):
+    '''Copy the files under source_dir into target_dir, keeping the files already there'''
+    for folder, _, files in os.walk(source_dir):
+        target_folder = os.path.join(target_dir, os.path.relpath(folder, source_dir))
+        if not os.path.exists(target_folder):
+            os.makedirs(target_folder)
+        for file in files:
+            shutil.copy2(os.path.join(folder, file), os.path.join(target_folder, file))
+
+def merge_staged_version(gitrepo, ver, staged_dir, args):
+    '''Commit, tag, push and release a version built outside the main checkout.
+
+    staged_dir holds the generated pom.xml and module directories, with
+    their Maven outputs, as left by a shard or a worktree build.
+    '''
+    print('Merging plugin version %s from %s ...' % (ver, staged_dir))
+    updates_repository = os.path.join(UPDATES_PACKAGE_DIR, 'target', 'repository')
+    if CHECKPOINTS.done(ver, 'commit'):
+        commit_plugin(gitrepo, ver, push=not args.offline)
+        if not args.offline:
+            release_plugin(ver, work_dir=staged_dir)
+        return
+    create_branch(gitrepo, ver)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Keep the published updates site; the staged one only adds its own version
+        published = os.path.join(temp_dir, 'repository')
+        if os.path.exists(updates_repository):
+            shutil.copytree(updates_repository, published)
+        for module_dir in variant_package_dirs():
+            if module_dir not in variant_package_dirs(staged_dir):
+                shutil.rmtree(module_dir)
+        for module_dir in maven_module_dirs(staged_dir):
+            for generated_dir in ('target', 'binaries'):
+                path = os.path.join(module_dir, generated_dir)
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+            copy_tree(os.path.join(staged_dir, module_dir), module_dir)
+        copyfile(os.path.join(staged_dir, 'pom.xml'), 'pom.xml')
+        if os.path.exists(published):
+            merge_p2_repositories(updates_repository, published)
+    commit_plugin(gitrepo, ver, push=not args.offline)
+    if args.offline:
+        print('Offline, skipping release of plugin version %s.' % (ver))
     else:
-        sys.stderr.write('Cannot find release description for %s' % (z3_version))
+        release_plugin(ver, work_dir=staged_dir)
+
+def merge_shards(shard_dirs, extant_plugin_versions, args):
+    '''Commit, tag, push and release the staged versions of all shards in version order'''
+    staged = {}
+    for shard_dir in shard_dirs:
+        for ver in os.listdir(shard_dir):
+            if os.path.exists(os.path.join(shard_dir, ver, 'shard.json')):
+                staged[ver] = os.path.join(shard_dir, ver)
+    merge_order = sorted((v for v in staged if v not in extant_plugin_versions), key=version_key)
+    print('Merging plugin versions: %s' % (pformat(merge_order)))
+    gitrepo = Repo(os.getcwd())
+    for ver in merge_order:
+        merge_staged_version(gitrepo, ver, staged[ver], args)
+    return merge_order
+
+def build_in_worktrees(scheduler, args):
+    '''Package versions concurrently, each in its own git worktree of master.
+
+    Up to args.jobs versions taken from the scheduler are generated,
+    extracted and built by Maven at once; a version is only taken when a
+    worker is free, so preempting versions start next.  The main checkout
+    then merges, tags, pushes and releases them one at a time in the order
+    they were started, each as soon as it and its predecessors are done.
+    Like shards, every version is built on the updates site as it was when
+    its worktree was created; the merge combines them.
+    '''
+    gitrepo = Repo(os.getcwd())
+    worktrees_dir = os.path.join(STATE_DIR, 'worktrees')
+    if not os.path.exists(worktrees_dir):
+        os.makedirs(worktrees_dir)
+    worktrees_dir = tempfile.mkdtemp(dir=worktrees_dir)
+    work_dirs = {}
+
+    def build(ver, z3_version, z3_releases):
+        packaged = package_plugin(ver, z3_version, z3_releases, range_fetch=args.range_fetch, commit=False,
+                                  asset_policy=args.asset_policy, work_dir=work_dirs[ver], native_p2=args.native_p2,
+                                  deltas=args.deltas)
+        return work_dirs[ver] if packaged else None
+
+    print('Building plugin versions with %d workers.' % (args.jobs))
+    merged = []
+    builds = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            try:
+                while True:
+                    while len(builds) < args.jobs:
+                        ver = scheduler.pop()
+                        if not ver:
+                            break
+                        work_dirs[ver] = os.path.join(worktrees_dir, ver)
+                        gitrepo.git.worktree('add', '--detach', work_dirs[ver], 'master')
+                        builds.append((ver, executor.submit(build, ver, scheduler.z3_versions[ver], scheduler.z3_releases)))
+                    if not builds:
+                        break
+                    ver, future = builds.pop(0)
+                    work_dir = future.result()
+                    if work_dir:
+                        merge_staged_version(gitrepo, ver, work_dir, args)
+                        merged.append(ver)
+            except BaseException:
+                for _, future in builds:
+                    future.cancel()
+                raise
+    finally:
+        for work_dir in work_dirs.values():
+            gitrepo.git.worktree('remove', '--force', work_dir)
+        shutil.rmtree(worktrees_dir, ignore_errors=True)
+        gitrepo.git.worktree('prune')
+    return merged
+
+class ReleaseWatcher(object):
+    '''Cached release list of a repository, refreshed with conditional requests'''
+    def __init__(self, gh, owner, repo):
+        self.repository = gh.repository(owner, repo)
+        self.etag = None
+        self.releases = []
+
+    def poll(self):
+        '''Refresh the release list; return True if it changed'''
+        iterator = self.repository.releases(etag=self.etag)
+        releases = [r for r in iterator]
+        if iterator.last_status == 304:
+            return False
+        self.etag = iterator.etag
+        self.releases = releases
+        return True
+
+class StatusServer(ThreadingMixIn, HTTPServer):
+    '''HTTP server answering each status request in its own thread'''
+    daemon_threads = True
+
+class StatusHandler(BaseHTTPRequestHandler):
+    '''Serve the daemon status as JSON on /status and a liveness check on /health'''
+    def do_GET(self):
+        status = self.server.status
+        with status['lock']:
+            body = {k: v for k, v in status.items() if k != 'lock'}
+        if self.path == '/metrics':
+            self.respond(200, 'text/plain; version=0.0.4', METRICS.render().encode('utf-8'))
+        elif self.path == '/health':
+            healthy = not body['last_error'] and time.time() - (body['last_poll'] or body['started']) < 3 * body['poll_interval']
+            self.respond(200 if healthy else 503, 'text/plain', b'ok\n' if healthy else b'unhealthy\n')
+        elif self.path in ('/', '/status'):
+            self.respond(200, 'application/json', json.dumps(body, indent=1).encode('utf-8'))
+        else:
+            self.respond(404, 'text/plain', b'not found\n')
 
-def release_plugin(plugin_version):
-    gh = GitHub(GITHUB_API, token=AUTH_TOKEN)
-    repository = gh.repository(Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
-    release = repository.create_release(plugin_version,
-        target_commitish='master',
-        name='Z3 Plugin %s' % (plugin_version),
-        body='Eclipse plugin containing binaries for Z3 Prover version %s.' % (plugin_version),
-        draft=False,
-        prerelease=False,
-    )
-    filename = '%s-%s.zip' % (REPO_PACKAGE_DIR, plugin_version)
-    filepath = os.path.join(REPO_PACKAGE_DIR, 'target', filename)
-    asset = release.upload_asset(content_type='application/binary', name=filename, asset=open(filepath, 'rb'))
+    def respond(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def watch_releases(prover_watcher, extant_plugin_versions, scheduler, stop, status, args, inpattern, expattern):
+    '''Keep polling the Z3 releases while a backlog is built, queueing new ones ahead of it'''
+    while not stop.wait(args.poll_interval):
+        try:
+            changed = prover_watcher.poll()
+            with status['lock']:
+                status['last_poll'] = time.time()
+            if not changed:
+                continue
+            z3_versions = filter_versions([r.tag_name for r in prover_watcher.releases], inpattern, expattern)
+            plugin_versions = pending_plugin_versions(z3_versions, extant_plugin_versions)
+            added = scheduler.add(plugin_versions, prover_watcher.releases, preempt=True)
+            if added:
+                print('New Z3 releases for plugin versions %s, building them next.' % (', '.join(added)))
+            with status['lock']:
+                status['pending_versions'] = scheduler.pending()
+        except Exception as e:
+            sys.stderr.write('Release poll failed: %r\n' % (e))
+
+def run_daemon(args, inpattern, expattern):
+    '''Poll the Z3 releases and package each new release as it appears'''
+    status = {
+        'lock': threading.Lock(),
+        'started': time.time(),
+        'poll_interval': args.poll_interval,
+        'last_poll': None,
+        'last_change': None,
+        'last_build': None,
+        'built_versions': [],
+        'pending_versions': [],
+        'last_error': None,
+    }
+    if args.status_port:
+        server = StatusServer(('127.0.0.1', args.status_port), StatusHandler)
+        server.status = status
+        threading.Thread(target=server.serve_forever, name='status-server', daemon=True).start()
+        print('Serving status on http://127.0.0.1:%d/status' % (server.server_port))
+
+    gh = connect_github()
+    prover_watcher = ReleaseWatcher(gh, Z3_PROVER_OWNER, Z3_PROVER_REPO)
+    plugin_watcher = ReleaseWatcher(gh, Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
+    while True:
+        try:
+            prover_changed = prover_watcher.poll()
+            plugin_changed = plugin_watcher.poll()
+            with status['lock']:
+                status['last_poll'] = time.time()
+                if prover_changed or plugin_changed:
+                    status['last_change'] = time.time()
+                built_versions = list(status['built_versions'])
+            # Recomputed from the cached release lists on every poll, so versions
+            # whose build failed are retried even when no release changed
+            z3_versions = filter_versions([r.tag_name for r in prover_watcher.releases], inpattern, expattern)
+            extant_plugin_versions = [r.tag_name for r in plugin_watcher.releases] + built_versions
+            plugin_versions = pending_plugin_versions(z3_versions, extant_plugin_versions)
+            with status['lock']:
+                status['pending_versions'] = sorted(plugin_versions.keys(), key=version_key, reverse=args.schedule == 'newest')
+            if plugin_versions:
+                scheduler = VersionScheduler(args.schedule)
+                scheduler.add(plugin_versions, prover_watcher.releases)
+                stop = threading.Event()
+                poller = threading.Thread(target=watch_releases, name='release-poller',
+                                          args=(prover_watcher, extant_plugin_versions, scheduler, stop, status, args, inpattern, expattern))
+                poller.start()
+                try:
+                    built = build_plugin_versions(plugin_versions, prover_watcher.releases, args, scheduler)
+                finally:
+                    stop.set()
+                    poller.join()
+                # Releases the poller queued after the last version was taken
+                while scheduler.pending():
+                    built += build_plugin_versions({}, prover_watcher.releases, args, scheduler)
+                with status['lock']:
+                    status['last_build'] = time.time()
+                    status['built_versions'].extend(built)
+                    status['pending_versions'] = []
+            with status['lock']:
+                status['last_error'] = None
+            METRICS.set('z3_fetcher_last_run_success', 1)
+        except (Exception, SystemExit) as e:
+            # package_plugin exits on failure; keep the daemon alive and retry next poll
+            sys.stderr.write('Daemon iteration failed: %r\n' % (e))
+            with status['lock']:
+                status['last_error'] = repr(e)
+            METRICS.set('z3_fetcher_last_run_success', 0)
+        METRICS.set('z3_fetcher_last_run_timestamp_seconds', time.time())
+        if args.metrics_file:
+            METRICS.write_textfile(args.metrics_file)
+        RUN_HISTORY.flush(status['last_error'] is None)
+        time.sleep(args.poll_interval)
 
 def main(argv=None): # IGNORE:C0111
     '''Command line options.'''
@@ -1116,12 +3844,44 @@ def main(argv=None): # IGNORE:C0111
   SOFTWARE.
 ''' % (program_shortdesc)
 
+    metrics_file = None
+    success = 0
     try:
         # Setup argument parser
         parser = ArgumentParser(description=program_license, formatter_class=RawDescriptionHelpFormatter)
         parser.add_argument("-v", "--verbose", dest="verbose", action="count", help="set verbosity level [default: %(default)s]")
         parser.add_argument("-i", "--include", dest="include", help="only include releasess matching this regex pattern. Note: exclude is given preference over include. [default: %(default)s]", metavar="RE" )
         parser.add_argument("-e", "--exclude", dest="exclude", help="exclude paths matching this regex pattern. [default: %(default)s]", metavar="RE" )
+        parser.add_argument("-m", "--mirror", dest="mirror", help="read releases and assets from this local mirror directory or file:// URL [default: %(default)s]", metavar="DIR")
+        parser.add_argument("--sync-mirror", dest="sync_mirror", action="store_true", help="update the mirror from GitHub and exit")
+        parser.add_argument("--offline", dest="offline", action="store_true", help="do not contact GitHub; resolve everything from the mirror and skip push and release")
+        parser.add_argument("--asset-policy", dest="asset_policy", choices=ASSET_POLICIES, default="oldest", help="which build to package when a release has several for a platform: oldest glibc/OS version for the widest compatibility, or newest [default: %(default)s]")
+        parser.add_argument("--variants", dest="variants", action="store_true", help="also package the Linux builds of a release for newer glibc versions as variant fragments, which every Linux install downloads")
+        parser.add_argument("--variant-assets", dest="variant_assets", help="package the locally built release zips in DIR/<level>/, for the x86-64 levels %s, as variant fragments, which every Linux install downloads [default: %%(default)s]" % (', '.join(CPU_LEVELS)), metavar="DIR")
+        parser.add_argument("--schedule", dest="schedule", choices=SCHEDULE_POLICIES, default="newest", help="order in which pending versions are built [default: %(default)s]")
+        parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1, help="build up to this many versions at once, each in its own git worktree [default: %(default)s]", metavar="N")
+        parser.add_argument("--native-p2", dest="native_p2", action="store_true", help="publish the repository and updates sites directly from the built jars instead of with Tycho")
+        parser.add_argument("--deltas", dest="deltas", action="store_true", help="also publish xdelta3 patches of the native fragment jars, listed in deltas/index.json of the updates site for tools other than p2; requires xdelta3")
+        parser.add_argument("--range-fetch", dest="range_fetch", action="store_true", help="fetch only the needed members of release zips with HTTP range requests")
+        parser.add_argument("--stream", dest="stream", action="store_true", help="extract only the needed members of downloaded release zips, in chunks sized from --memory-budget, and hash binaries without memory maps")
+        parser.add_argument("--memory-budget", dest="memory_budget", type=int, help="memory in MiB the streaming mode sizes its buffers and hashing threads for, and reports stages exceeding; implies --stream [default: %(default)s]", metavar="MB")
+        parser.add_argument("--scratch-budget", dest="scratch_budget", type=int, help="scratch disk in MiB shared by the versions being packaged; a platform waits until its estimated need fits; implies --stream [default: %(default)s]", metavar="MB")
+        parser.add_argument("--shard", dest="shard", help="build only shard i of N of the pending versions, staging them in --shard-output instead of committing [default: %(default)s]", metavar="i/N")
+        parser.add_argument("--shard-output", dest="shard_output", help="directory in which a shard stages its built versions [default: %(default)s]", metavar="DIR")
+        parser.add_argument("--merge-shards", dest="merge_shards", nargs="+", help="commit, tag, push and release the versions staged by the shards, in version order", metavar="DIR")
+        parser.add_argument("-d", "--daemon", dest="daemon", action="store_true", help="keep running, polling for new releases and packaging them as they appear")
+        parser.add_argument("--poll-interval", dest="poll_interval", type=int, default=900, help="seconds between release polls in daemon mode [default: %(default)s]", metavar="SECONDS")
+        parser.add_argument("--status-port", dest="status_port", type=int, help="serve daemon status on this local port [default: %(default)s]", metavar="PORT")
+        parser.add_argument("--benchmark", dest="benchmark", action="store_true", help="run the packaged Linux z3 over the SMT-LIB problems in %s before building each version" % (BENCHMARK_DIR))
+        parser.add_argument("--benchmark-timeout", dest="benchmark_timeout", type=int, default=60, help="seconds allowed for each benchmark problem [default: %(default)s]", metavar="SECONDS")
+        parser.add_argument("--benchmark-jobs", dest="benchmark_jobs", type=int, default=os.cpu_count() or 1, help="benchmark problems solved at once [default: %(default)s]", metavar="N")
+        parser.add_argument("--resume", dest="resume", action="store_true", help="continue each version from its last completed stage, reusing its existing branch and outputs")
+        parser.add_argument("--no-build-cache", dest="build_cache", action="store_false", help="rebuild every stage instead of reusing outputs of unchanged inputs")
+        parser.add_argument("--build-cache-size", dest="build_cache_size", type=int, default=4096, help="MiB the build cache may use before its least recently used entries are removed; 0 for no limit [default: %(default)s]", metavar="MB")
+        parser.add_argument("--metrics-file", dest="metrics_file", help="write Prometheus metrics to this textfile at the end of the run [default: %(default)s]", metavar="FILE")
+        parser.add_argument("--report", dest="report", action="store_true", help="print the trends recorded in the run history, flag regressions and exit")
+        parser.add_argument("--baseline-runs", dest="baseline_runs", type=int, default=5, help="number of previous runs of the same plugin version averaged into the baseline of --report [default: %(default)s]", metavar="N")
+        parser.add_argument("--regression-threshold", dest="regression_threshold", type=float, default=0.25, help="fraction above the baseline that --report flags as a regression [default: %(default)s]", metavar="FRACTION")
         parser.add_argument('-V', '--version', action='version', version=program_version_message)
 
         # Process arguments
@@ -1130,6 +3890,21 @@ def main(argv=None): # IGNORE:C0111
         verbose = args.verbose
         inpattern = args.include
         expattern = args.exclude
+        metrics_file = args.metrics_file
+        BUILD_CACHE.enabled = args.build_cache
+        BUILD_CACHE.max_bytes = args.build_cache_size * 1048576
+        CHECKPOINTS.resume = args.resume
+        BENCHMARK.enabled = args.benchmark
+        LINUX_VARIANTS.release_assets = args.variants
+        LINUX_VARIANTS.local_dir = args.variant_assets
+        BENCHMARK.timeout = args.benchmark_timeout
+        BENCHMARK.jobs = args.benchmark_jobs
+        RESOURCES.streaming = args.stream or bool(args.memory_budget or args.scratch_budget)
+        RESOURCES.memory_bytes = args.memory_budget * 1048576 if args.memory_budget else None
+        RESOURCES.scratch_bytes = args.scratch_budget * 1048576 if args.scratch_budget else None
+        if RESOURCES.streaming:
+            METRICS.trackers.append(RESOURCES.track)
+        mirror = ReleaseMirror(args.mirror) if args.mirror else None
 
         if verbose and verbose > 0:
             print('Verbose mode on')
@@ -1142,39 +3917,71 @@ def main(argv=None): # IGNORE:C0111
         if inpattern and expattern and inpattern == expattern:
             raise CLIError("include and exclude pattern are equal! Nothing will be processed.")
 
-        gh = GitHub(GITHUB_API, token=AUTH_TOKEN)
-        prover_repository = gh.repository(Z3_PROVER_OWNER, Z3_PROVER_REPO)
-        z3_releases = [r for r in prover_repository.releases()]
-        z3_versions = [r.tag_name for r in z3_releases]
+        if (args.sync_mirror or args.offline) and not mirror:
+            raise CLIError("--sync-mirror and --offline require a mirror (--mirror)")
 
-        plugin_repository = gh.repository(Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
-        extant_plugin_versions = [r.tag_name for r in plugin_repository.releases()]
+        if args.jobs < 1:
+            raise CLIError("--jobs must be at least 1")
 
-        # filter out the versions matching the exclude pattern
-        if expattern:
-            regex = re.compile(expattern)
-            z3_versions = [x for x in filter(lambda x: not regex.match(x), z3_versions)]
+        if args.shard and not args.shard_output:
+            raise CLIError("--shard requires --shard-output")
 
-        # filter on include pattern
-        if inpattern:
-            regex = re.compile(inpattern)
-            z3_versions = [x for x in filter(regex.match, z3_versions)]
+        if args.deltas and not shutil.which('xdelta3'):
+            raise CLIError("--deltas requires xdelta3 on the PATH")
 
-        # Find the plugin version corresponding to the z3-version
-        regex = re.compile(r'\d+\.\d+\.\d+')
-        plugin_versions = {regex.search(x).group(0) : x for x in filter(regex.search, z3_versions)}
+        if args.daemon and (mirror or args.offline):
+            raise CLIError("--daemon polls GitHub and cannot be combined with --mirror or --offline")
 
-        # remove the versions already packaged as plugin
-        plugin_versions = {v : plugin_versions[v] for v in filter(lambda x: (not x in extant_plugin_versions), plugin_versions)}
+        if args.report:
+            if args.baseline_runs < 1:
+                raise CLIError("--baseline-runs must be at least 1")
+            regressions = report_history(RUN_HISTORY, args.baseline_runs, args.regression_threshold)
+            return 1 if regressions else 0
 
-        build_order = sorted(plugin_versions.keys())
-        print('Building plugin versions: %s' % (pformat(build_order)))
+        if args.daemon:
+            run_daemon(args, inpattern, expattern)
+            return 0
 
-        for ver in build_order:
-            print('Building plugin version %s ...' % (ver))
-            package_plugin(ver, plugin_versions[ver], z3_releases)
-            release_plugin(ver)
+        if args.sync_mirror:
+            gh = connect_github()
+            mirror.sync(gh, Z3_PROVER_OWNER, Z3_PROVER_REPO,
+                        tag_filter=lambda t: filter_versions([t], inpattern, expattern),
+                        asset_filter=is_packaged_asset)
+            mirror.sync(gh, Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
+            return 0
+
+        if args.offline:
+            z3_releases = mirror.releases(Z3_PROVER_OWNER, Z3_PROVER_REPO)
+            extant_plugin_versions = [r.tag_name for r in mirror.releases(Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)]
+        else:
+            gh = connect_github()
+            if mirror:
+                z3_releases = mirror.releases(Z3_PROVER_OWNER, Z3_PROVER_REPO)
+            else:
+                prover_repository = gh.repository(Z3_PROVER_OWNER, Z3_PROVER_REPO)
+                z3_releases = [r for r in prover_repository.releases()]
+
+            plugin_repository = gh.repository(Z3_PLUGIN_OWNER, Z3_PLUGIN_REPO)
+            extant_plugin_versions = [r.tag_name for r in plugin_repository.releases()]
+
+        z3_versions = filter_versions([r.tag_name for r in z3_releases], inpattern, expattern)
+        if args.merge_shards:
+            merge_shards(args.merge_shards, extant_plugin_versions, args)
+            success = 1
+            return 0
+
+        plugin_versions = pending_plugin_versions(z3_versions, extant_plugin_versions)
+        if args.resume:
+            # Released versions whose asset upload did not complete
+            for ver, z3_version in CHECKPOINTS.unfinished().items():
+                if filter_versions([z3_version], inpattern, expattern):
+                    plugin_versions.setdefault(ver, z3_version)
+        if args.shard:
+            build_shard(plugin_versions, z3_releases, args)
+        else:
+            build_plugin_versions(plugin_versions, z3_releases, args)
 
+        success = 1
         return 0
     except KeyboardInterrupt:
         ### handle keyboard interrupt ###
@@ -1186,6 +3993,12 @@ def main(argv=None): # IGNORE:C0111
         sys.stderr.write(program_name + ": " + repr(e) + "\n")
         sys.stderr.write(indent + "  for help use --help")
         return 2
+    finally:
+        if metrics_file:
+            METRICS.set('z3_fetcher_last_run_success', success)
+            METRICS.set('z3_fetcher_last_run_timestamp_seconds', time.time())
+            METRICS.write_textfile(metrics_file)
+        RUN_HISTORY.flush(success)
 
 if __name__ == "__main__":
     sys.exit(main())